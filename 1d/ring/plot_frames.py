@@ -2,6 +2,11 @@
 
 from pylab import *
 import setplot
+import os, sys
+# tools for reading frames in the background while plotting:
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '../../tools'))
+import prefetch
 
 plotdata = setplot.setplot()
 
@@ -11,7 +16,10 @@ plotdata.print_fignos = [1]
 case = 'sphere'
 plotdata.outdir = '_output_%s' % case
 
-for frameno in [0,4,8,10,12,14]:
+framenos = [0,4,8,10,12,14]
+prefetch.install(plotdata, framenos)   # read next frames while plotting
+
+for frameno in framenos:
     plotdata.plotframe(frameno)
     fname = '%s_1d_frame%s.pdf' % (case,str(frameno).zfill(2))
     savefig(fname, bbox_inches='tight')
@@ -9,6 +9,11 @@ that will be read in by the Fortran code.
 import os, sys
 import numpy as np
 
+# tools shared by the cases (runtools, tuning, ...):
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '../../tools'))
+import runtools
+
 
 
 #------------------------------
@@ -248,6 +253,10 @@ def setrun(claw_pkg='geoclaw'):
     rundata.gaugedata.gauges = []
     # for gauges append lines of the form  [gaugeno, x, t1, t2]
 
+    # Values tuned for this machine, see tools/tuning.py:
+    casedir = os.path.dirname(os.path.abspath(__file__))
+    import tuning
+    tuning.apply(rundata, casedir)
 
     return rundata
 
@@ -256,5 +265,8 @@ if __name__ == '__main__':
     # Set up run-time parameters and write all data files.
     import sys
     rundata = setrun(*sys.argv[1:])
-    rundata.write()
+
+    # write only the .data files whose content changed, touching make's
+    # .data stamp only if some did (see tools/Makefile.data):
+    runtools.write_case_data(rundata)
 
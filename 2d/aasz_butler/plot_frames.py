@@ -2,6 +2,11 @@
 
 from pylab import *
 import setplot
+import os, sys
+# tools for reading frames in the background while plotting:
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '../../tools'))
+import prefetch
 
 plotdata = setplot.setplot()
 
@@ -10,7 +15,10 @@ plotdata.print_fignos = [21]
 
 plotdata.outdir = '_output_nosphere_6hr'
 
-for hour in [1,3,5]:
+hours = [1,3,5]
+prefetch.install(plotdata, hours)   # read next frames while plotting
+
+for hour in hours:
     plotdata.plotframe(hour)
     plot([-168, -150.],[51, 12],'k',linewidth=0.7)
     fname = 'butler_nosphere_%hr.pdf' % hour
@@ -9,10 +9,17 @@ function setplot is called to set the plot parameters.
 
 import numpy as np
 import matplotlib.pyplot as plt
-import os
+import os, sys
 
 from clawpack.geoclaw import topotools
 
+# tools for reading only the AMR levels that are plotted, and reading
+# the next frames in the background while plotting:
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', '..', 'tools'))
+import level_filter
+import prefetch
+
 if 0:
     image = plt.imread('GE_PA2.png')
 
@@ -679,4 +686,9 @@ def setplot(plotdata=None):
     plotdata.latex_makepdf = False           # also run pdflatex?
     plotdata.parallel = True
 
+    # read only the AMR levels needed by the figures being plotted:
+    level_filter.install(plotdata)
+    # read the next frames in the background while one is plotted:
+    prefetch.install(plotdata)
+
     return plotdata
@@ -7,7 +7,7 @@ that will be read in by the Fortran code.
 """
 
 
-import os
+import os, sys
 import numpy as np
 from clawpack.amrclaw.data import FlagRegion
 from clawpack.geoclaw import fgmax_tools
@@ -24,10 +24,16 @@ print('rundir = %s' % rundir)
 
 
 
-# set topodir and dtopodir to directory where topo and dtopo files are found:
-hawaii = '/Users/rjl/git/hawaii_land_trust/'
-topodir = hawaii + '/topo/topofiles'
-dtopodir = hawaii + '/dtopo/dtopofiles'
+# tools shared by the cases (runtools, datasets, tuning, ...):
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '../../tools'))
+import runtools
+import datasets
+
+# topodir and dtopodir are the directories where topo and dtopo files are
+# found, set in ~/.config/sphere_tests/datasets.json (see tools/datasets.py):
+topodir = datasets.directory('hawaii_topo')
+dtopodir = datasets.directory('hawaii_dtopo')
 
 #------------------------------
 def setrun(claw_pkg='geoclaw'):
@@ -866,7 +872,20 @@ def setrun(claw_pkg='geoclaw'):
     amrdata.sprint = False      # space/memory output
     amrdata.tprint = False      # time step reporting each level
     amrdata.uprint = False      # update/upbnd reporting
-    
+
+    # Values tuned for this machine, see tools/tuning.py:
+    casedir = os.path.dirname(os.path.abspath(__file__))
+    import tuning
+    tuning.apply(rundata, casedir)
+
+    # Topofiles cropped to the extent used, see tools/topo_crop.py:
+    import topo_crop
+    topo_crop.use_crop(rundata, casedir)
+
+    # Binary copies of the ASCII topofiles, see tools/topo_cache.py:
+    import topo_cache
+    topo_cache.use_cache(rundata)
+
     return rundata
 
 if __name__ == '__main__':
@@ -874,6 +893,12 @@ if __name__ == '__main__':
     import sys
     from clawpack.geoclaw import kmltools
     rundata = setrun(*sys.argv[1:])
-    rundata.write()
+
+    # Copies of the data files on node-local disk, see tools/datasets.py:
+    datasets.stage_files(rundata)
+
+    # write only the .data files whose content changed, touching make's
+    # .data stamp only if some did (see tools/Makefile.data):
+    runtools.write_case_data(rundata)
     
     kmltools.make_input_data_kmls(rundata)
@@ -14,6 +14,14 @@ import matplotlib.pyplot as plt
 
 from clawpack.geoclaw import topotools
 from six.moves import range
+import os, sys
+
+# tools for reading only the AMR levels that are plotted, and reading
+# the next frames in the background while plotting:
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', '..', 'tools'))
+import level_filter
+import prefetch
 
 
 #--------------------------
@@ -110,6 +118,7 @@ def setplot(plotdata=None):
         return y,eta
 
     plotitem.map_2d_to_1d = etalat
+    plotitem.amr_data_show = [1,0,0]   # coarsest level only
     
     def aa(current_data):
         from pylab import grid
@@ -169,5 +178,10 @@ def setplot(plotdata=None):
     plotdata.latex_makepdf = False           # also run pdflatex?
     plotdata.parallel = True                 # make multiple frame png's at once
 
+    # read only the AMR levels needed by the figures being plotted:
+    level_filter.install(plotdata)
+    # read the next frames in the background while one is plotted:
+    prefetch.install(plotdata)
+
     return plotdata
 
@@ -4,12 +4,37 @@ Module to set up run time parameters for Clawpack.
 The values set in the function setrun are then written out to data files
 that will be read in by the Fortran code.
 
+This case uses the setrun shared by the axisymmetric tests, in
+../axisymmetric_base.py, with the values below.
+
 """
 
-from __future__ import absolute_import
-from __future__ import print_function
-import os
-import numpy as np
+import os, sys
+
+# setrun shared by the axisymmetric cases:
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+import axisymmetric_base
+
+# tools shared by the cases (runtools, tuning, ...):
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '../../tools'))
+import runtools
+
+
+# Values for this case (see axisymmetric_base.py):
+case_values = dict(
+    lower = [-10., -70.],
+    upper = [10., 70.],
+    num_cells = [4, 2800],
+    num_output_times = 17,
+    tfinal = 61200,
+    max1d = 10000,
+    amr_levels_max = 1,
+    refinement_ratios_x = [1,1,1],
+    refinement_ratios_y = [2,4,4],
+    refinement_ratios_t = [2,4,4],
+    )
 
 
 #------------------------------
@@ -27,361 +52,15 @@ def setrun(claw_pkg='geoclaw'):
 
     """
 
-    from clawpack.clawutil import data
-
-    assert claw_pkg.lower() == 'geoclaw',  "Expected claw_pkg = 'geoclaw'"
-
-    num_dim = 2
-    rundata = data.ClawRunData(claw_pkg, num_dim)
-
-    #------------------------------------------------------------------
-    # GeoClaw specific parameters:
-    #------------------------------------------------------------------
-    rundata = setgeo(rundata)
-
-    #------------------------------------------------------------------
-    # Standard Clawpack parameters to be written to claw.data:
-    #   (or to amr2ez.data for AMR)
-    #------------------------------------------------------------------
-    clawdata = rundata.clawdata  # initialized when rundata instantiated
-
-
-    # Set single grid parameters first.
-    # See below for AMR parameters.
-
-
-    # ---------------
-    # Spatial domain:
-    # ---------------
-
-    # Number of space dimensions:
-    clawdata.num_dim = num_dim
-
-    # Lower and upper edge of computational domain:
-    clawdata.lower[0] = -10.
-    clawdata.upper[0] = 10.0
-
-    clawdata.lower[1] = -70.0
-    clawdata.upper[1] = 70.0
-
-
-
-    # Number of grid cells: Coarsest grid
-    clawdata.num_cells[0] = 4
-    clawdata.num_cells[1] = 2800
-
-
-    # ---------------
-    # Size of system:
-    # ---------------
-
-    # Number of equations in the system:
-    clawdata.num_eqn = 3
-
-    # Number of auxiliary variables in the aux array (initialized in setaux)
-    clawdata.num_aux = 3
-
-    # Index of aux array corresponding to capacity function, if there is one:
-    clawdata.capa_index = 2
-
-    
-    
-    # -------------
-    # Initial time:
-    # -------------
-
-    clawdata.t0 = 0.0
-
-
-    # Restart from checkpoint file of a previous run?
-    # If restarting, t0 above should be from original run, and the
-    # restart_file 'fort.chkNNNNN' specified below should be in 
-    # the OUTDIR indicated in Makefile.
-
-    clawdata.restart = False               # True to restart from prior results
-    clawdata.restart_file = 'fort.chk00006'  # File to use for restart data
-
-    # -------------
-    # Output times:
-    #--------------
-
-    # Specify at what times the results should be written to fort.q files.
-    # Note that the time integration stops after the final output time.
-    # The solution at initial time t0 is always written in addition.
-
-    clawdata.output_style = 1
-
-    if clawdata.output_style==1:
-        # Output nout frames at equally spaced times up to tfinal:
-        clawdata.num_output_times = 17
-        clawdata.tfinal = 61200
-        clawdata.output_t0 = True  # output at initial (or restart) time?
-
-    elif clawdata.output_style == 2:
-        # Specify a list of output times.
-        clawdata.output_times = [0.5, 1.0]
-
-    elif clawdata.output_style == 3:
-        # Output every iout timesteps with a total of ntot time steps:
-        clawdata.output_step_interval = 1
-        clawdata.total_steps = 1
-        clawdata.output_t0 = True
-        
-
-    clawdata.output_format = 'ascii'      # 'ascii' or 'binary' 
-
-    clawdata.output_q_components = 'all'   # could be list such as [True,True]
-    clawdata.output_aux_components = 'none'  # could be list
-    clawdata.output_aux_onlyonce = True    # output aux arrays only at t0
-
-
-
-    # ---------------------------------------------------
-    # Verbosity of messages to screen during integration:
-    # ---------------------------------------------------
-
-    # The current t, dt, and cfl will be printed every time step
-    # at AMR levels <= verbosity.  Set verbosity = 0 for no printing.
-    #   (E.g. verbosity == 2 means print only on levels 1 and 2.)
-    clawdata.verbosity = 2
-
-
-
-    # --------------
-    # Time stepping:
-    # --------------
-
-    # if dt_variable==1: variable time steps used based on cfl_desired,
-    # if dt_variable==0: fixed time steps dt = dt_initial will always be used.
-    clawdata.dt_variable = True
-
-    # Initial time step for variable dt.
-    # If dt_variable==0 then dt=dt_initial for all steps:
-    clawdata.dt_initial = 0.016
-
-    # Max time step to be allowed if variable dt used:
-    clawdata.dt_max = 1e+99
-
-    # Desired Courant number if variable dt used, and max to allow without
-    # retaking step with a smaller dt:
-    clawdata.cfl_desired = 0.9
-    clawdata.cfl_max = 1.0
-
-    # Maximum number of time steps to allow between output times:
-    clawdata.steps_max = 5000
-
-
-
-
-    # ------------------
-    # Method to be used:
-    # ------------------
-
-    # Order of accuracy:  1 => Godunov,  2 => Lax-Wendroff plus limiters
-    clawdata.order = 2
-    
-    # Use dimensional splitting? (not yet available for AMR)
-    clawdata.dimensional_split = 'unsplit'
-    
-    # For unsplit method, transverse_waves can be 
-    #  0 or 'none'      ==> donor cell (only normal solver used)
-    #  1 or 'increment' ==> corner transport of waves
-    #  2 or 'all'       ==> corner transport of 2nd order corrections too
-    clawdata.transverse_waves = 2
-
-    # Number of waves in the Riemann solution:
-    clawdata.num_waves = 3
-    
-    # List of limiters to use for each wave family:  
-    # Required:  len(limiter) == num_waves
-    # Some options:
-    #   0 or 'none'     ==> no limiter (Lax-Wendroff)
-    #   1 or 'minmod'   ==> minmod
-    #   2 or 'superbee' ==> superbee
-    #   3 or 'mc'       ==> MC limiter
-    #   4 or 'vanleer'  ==> van Leer
-    clawdata.limiter = ['mc', 'mc', 'mc']
-
-    clawdata.use_fwaves = True    # True ==> use f-wave version of algorithms
-    
-    # Source terms splitting:
-    #   src_split == 0 or 'none'    ==> no source term (src routine never called)
-    #   src_split == 1 or 'godunov' ==> Godunov (1st order) splitting used, 
-    #   src_split == 2 or 'strang'  ==> Strang (2nd order) splitting used,  not recommended.
-    clawdata.source_split = 'godunov'
-
-
-    # --------------------
-    # Boundary conditions:
-    # --------------------
-
-    # Number of ghost cells (usually 2)
-    clawdata.num_ghost = 2
-
-    # Choice of BCs at xlower and xupper:
-    #   0 => user specified (must modify bcN.f to use this option)
-    #   1 => extrapolation (non-reflecting outflow)
-    #   2 => periodic (must specify this at both boundaries)
-    #   3 => solid wall for systems where q(2) is normal velocity
-
-    clawdata.bc_lower[0] = 'extrap'
-    clawdata.bc_upper[0] = 'extrap'
-
-    clawdata.bc_lower[1] = 'extrap'
-    clawdata.bc_upper[1] = 'extrap'
-
-    # Specify when checkpoint files should be created that can be
-    # used to restart a computation.
-
-    clawdata.checkpt_style = 0
-
-    if clawdata.checkpt_style == 0:
-        # Do not checkpoint at all
-        pass
-
-    elif np.abs(clawdata.checkpt_style) == 1:
-        # Checkpoint only at tfinal.
-        pass
-
-    elif np.abs(clawdata.checkpt_style) == 2:
-        # Specify a list of checkpoint times.  
-        clawdata.checkpt_times = [0.1,0.15]
-
-    elif np.abs(clawdata.checkpt_style) == 3:
-        # Checkpoint every checkpt_interval timesteps (on Level 1)
-        # and at the final time.
-        clawdata.checkpt_interval = 5
-
-    # ---------------
-    # AMR parameters:
-    # ---------------
-    amrdata = rundata.amrdata
-    amrdata.max1d = 10000
-
-    # max number of refinement levels:
-    amrdata.amr_levels_max = 1
-
-    # List of refinement ratios at each level (length at least mxnest-1)
-    amrdata.refinement_ratios_x = [1,1,1]
-    amrdata.refinement_ratios_y = [2,4,4]
-    amrdata.refinement_ratios_t = [2,4,4]
-
-
-    # Specify type of each aux variable in amrdata.auxtype.
-    # This must be a list of length maux, each element of which is one of:
-    #   'center',  'capacity', 'xleft', or 'yleft'  (see documentation).
-
-    amrdata.aux_type = ['center','capacity','yleft']
-
-
-
-    # Flag using refinement routine flag2refine rather than richardson error
-    amrdata.flag_richardson = False    # use Richardson?
-    amrdata.flag2refine = True
-
-    # steps to take on each level L between regriddings of level L+1:
-    amrdata.regrid_interval = 3
-
-    # width of buffer zone around flagged points:
-    # (typically the same as regrid_interval so waves don't escape):
-    amrdata.regrid_buffer_width  = 2
-
-    # clustering alg. cutoff for (# flagged pts) / (total # of cells refined)
-    # (closer to 1.0 => more small grids may be needed to cover flagged cells)
-    amrdata.clustering_cutoff = 0.700000
-
-    # print info about each regridding up to this level:
-    amrdata.verbosity_regrid = 0  
-
-
-    #  ----- For developers ----- 
-    # Toggle debugging print statements:
-    amrdata.dprint = False      # print domain flags
-    amrdata.eprint = False      # print err est flags
-    amrdata.edebug = False      # even more err est flags
-    amrdata.gprint = False      # grid bisection/clustering
-    amrdata.nprint = False      # proper nesting output
-    amrdata.pprint = False      # proj. of tagged points
-    amrdata.rprint = False      # print regridding summary
-    amrdata.sprint = False      # space/memory output
-    amrdata.tprint = False      # time step reporting each level
-    amrdata.uprint = False      # update/upbnd reporting
-    
-
-    return rundata
-    # end of function setrun
-    # ----------------------
-
-
-#-------------------
-def setgeo(rundata):
-#-------------------
-    """
-    Set GeoClaw specific runtime parameters.
-    For documentation see ....
-    """
-
-    try:
-        geo_data = rundata.geo_data
-    except:
-        print("*** Error, this rundata has no geo_data attribute")
-        raise AttributeError("Missing geo_data attribute")
-
-       
-    # == Physics ==
-    geo_data.gravity = 9.81
-    geo_data.coordinate_system = 2
-    geo_data.sphere_source = 2
-    geo_data.earth_radius = 6367.5e3
-
-    # == Forcing Options
-    geo_data.coriolis_forcing = False
-
-    # == Algorithm and Initial Conditions ==
-    geo_data.sea_level = 0.0
-    geo_data.dry_tolerance = 1.e-3
-    geo_data.friction_forcing = True
-    geo_data.manning_coefficient = 0.025
-    geo_data.friction_depth = 20.0
-
-    # Refinement data
-    refinement_data = rundata.refinement_data
-    refinement_data.wave_tolerance = 1.e-2
-    refinement_data.variable_dt_refinement_ratios = True
-
-    # == settopo.data values ==
-    topo_data = rundata.topo_data
-    # for topography, append lines of the form
-    #    [topotype, fname]
-    topo_data.topofiles.append([1, 'flat.tt1'])
-
-    # == setdtopo.data values ==
-    dtopo_data = rundata.dtopo_data
-    # for moving topography, append lines of the form :   (<= 1 allowed for now!)
-    #   [topotype, fname]
-
-    # == setqinit.data values ==
-    #rundata.qinit_data.qinit_type = 4
-    rundata.qinit_data.qinitfiles = []
-    # for qinit perturbations, append lines of the form: (<= 1 allowed for now!)
-    #   [fname]
-    #rundata.qinit_data.qinitfiles.append(['ring.xyz'])
-
-    # == fgout grids ==
-    # new style as of v5.9.0 (old rundata.fixed_grid_data is deprecated)
-    # set rundata.fgout_data.fgout_grids to be a 
-    # list of objects of class clawpack.geoclaw.fgout_tools.FGoutGrid:
-    #rundata.fgout_data.fgout_grids = []
-
-    return rundata
-    # end of function setgeo
-    # ----------------------
-
+    casedir = os.path.dirname(os.path.abspath(__file__))
+    return axisymmetric_base.setrun(claw_pkg, casedir, **case_values)
 
 
 if __name__ == '__main__':
     # Set up run-time parameters and write all data files.
     import sys
     rundata = setrun(*sys.argv[1:])
-    rundata.write()
 
+    # write only the .data files whose content changed, touching make's
+    # .data stamp only if some did (see tools/Makefile.data):
+    runtools.write_case_data(rundata)
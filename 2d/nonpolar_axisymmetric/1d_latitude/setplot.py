@@ -3,6 +3,11 @@
 import os, sys
 from imp import reload
 
+# tools for reading the next frames in the background while plotting:
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '../../../tools'))
+import prefetch
+
 
 from clawpack.visclaw import geoplot
 
@@ -120,5 +125,8 @@ def setplot(plotdata=None):
     plotdata.latex = False             # Whether to make LaTeX output
     plotdata.parallel = True
 
+    # read the next frames in the background while one is plotted:
+    prefetch.install(plotdata)
+
     return plotdata
 
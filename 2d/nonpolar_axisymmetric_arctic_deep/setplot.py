@@ -15,6 +15,13 @@ import matplotlib.pyplot as plt
 from clawpack.geoclaw import topotools
 from six.moves import range
 
+import os, sys
+
+# tools for reading the next frames in the background while plotting:
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '../../tools'))
+import prefetch
+
 x0 = 0; y0 = 60.
 
 outdir_1d = '1d_latitude/_output'
@@ -213,5 +220,8 @@ def setplot(plotdata=None):
     plotdata.latex_makepdf = False           # also run pdflatex?
     plotdata.parallel = True                 # make multiple frame png's at once
 
+    # read the next frames in the background while one is plotted:
+    prefetch.install(plotdata)
+
     return plotdata
 
@@ -2,6 +2,11 @@
 
 from pylab import *
 import setplot
+import os, sys
+# tools for reading frames in the background while plotting:
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '../../tools'))
+import prefetch
 
 plotdata = setplot.setplot()
 
@@ -15,8 +20,11 @@ plotdata.outdir = '_output_sphere'
 x1trans,x2trans = 145, 210
 y1trans,y2trans = 35,20
 
-#for hour in [2,4,6]:
-for hour in range(9):
+#hours = [2,4,6]
+hours = range(9)
+prefetch.install(plotdata, hours)   # read next frames while plotting
+
+for hour in hours:
     plotdata.plotframe(hour)
     plot([x1trans,x2trans],[y1trans,y2trans],'k',linewidth=0.7)
     fname = 'tohoku_sphere_%hr.pdf' % hour
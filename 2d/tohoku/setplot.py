@@ -12,6 +12,12 @@ import pylab
 import glob
 
 import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '../../tools'))
+import datasets
+import prefetch
 
 outdir2 = None
 #outdir2 = os.path.abspath('../tohoku_sgn/_output_30min_afterfix')
@@ -19,7 +25,8 @@ outdir2 = None
 
 dartdata = {}
 for gaugeno in [21401, 21413, 21414, 21415,  21418, 21419, 51407, 52402]:
-    files = glob.glob('/Users/rjl/git/tohoku2011-paper1/dart/%s*_notide.txt' % gaugeno)
+    files = glob.glob(datasets.path('tohoku2011_dart',
+                                    '%s*_notide.txt' % gaugeno))
     if len(files) != 1:
         print("*** Warning: found %s files for gauge number %s" \
                    % (len(files),gaugeno))
@@ -535,4 +542,7 @@ def setplot(plotdata=None):
     plotdata.latex_framesperline = 1         # layout of plots
     plotdata.latex_makepdf = False           # also run pdflatex?
 
+    # read the next frames in the background while one is plotted:
+    prefetch.install(plotdata)
+
     return plotdata
@@ -6,7 +6,7 @@ that will be read in by the Fortran code.
 
 """
 
-import os
+import os, sys
 import numpy as np
 
 try:
@@ -14,6 +14,12 @@ try:
 except:
     raise Exception("*** Must first set CLAW enviornment variable")
 
+# tools shared by the cases (runtools, datasets, tuning, ...):
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '../../tools'))
+import runtools
+import datasets
+
 # Scratch directory for storing topo and dtopo files:
 scratch_dir = os.path.join(CLAW, 'geoclaw', 'scratch')
 
@@ -371,6 +377,19 @@ def setrun(claw_pkg='geoclaw'):
     gauges.append([2, 145.5, 37.4, 0., 1.e10])    
     gauges.append([3, 165, 29.5, 0., 1.e10])    
 
+    # Values tuned for this machine, see tools/tuning.py:
+    casedir = os.path.dirname(os.path.abspath(__file__))
+    import tuning
+    tuning.apply(rundata, casedir)
+
+    # Topofiles cropped to the extent used, see tools/topo_crop.py:
+    import topo_crop
+    topo_crop.use_crop(rundata, casedir)
+
+    # Binary copies of the ASCII topofiles, see tools/topo_cache.py:
+    import topo_cache
+    topo_cache.use_cache(rundata)
+
     return rundata
     # end of function setrun
     # ----------------------
@@ -415,7 +434,9 @@ def setgeo(rundata):
     topo_data = rundata.topo_data
     # for topography, append lines of the form
     #    [topotype, fname]
-    topodir = '/Users/rjl/git/tohoku2011-paper1/topo/'
+    # topodir and dtopodir are set in ~/.config/sphere_tests/datasets.json
+    # (see tools/datasets.py):
+    topodir = datasets.directory('tohoku2011_topo') + '/'
     topo_data.topofiles.append([3, \
                               topodir+'etopo1min139E147E34N41N.asc'])
     topo_data.topofiles.append([3, \
@@ -426,7 +447,7 @@ def setgeo(rundata):
     dtopo_data = rundata.dtopo_data
     # for moving topography, append lines of the form :   (<= 1 allowed for now!)
     #   [topotype, fname]
-    dtopodir = '/Users/rjl/git/tohoku2011-paper1/sources/'
+    dtopodir = datasets.directory('tohoku2011_sources') + '/'
     dtopo_data.dtopofiles.append([1,dtopodir+'UCSB3.txydz'])
     dtopo_data.dt_max_dtopo = 0.2
 
@@ -455,6 +476,12 @@ if __name__ == '__main__':
     from clawpack.geoclaw import kmltools
 
     rundata = setrun(*sys.argv[1:])
-    rundata.write()
+
+    # Copies of the data files on node-local disk, see tools/datasets.py:
+    datasets.stage_files(rundata)
+
+    # write only the .data files whose content changed, touching make's
+    # .data stamp only if some did (see tools/Makefile.data):
+    runtools.write_case_data(rundata)
 
     kmltools.make_input_data_kmls(rundata)
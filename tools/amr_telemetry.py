@@ -0,0 +1,289 @@
+"""
+Telemetry of a GeoClaw run from fort.amr and the timing files, as NumPy
+arrays, and a summary of where the run time goes.
+
+The solver writes into the output directory
+
+    fort.amr     with amrdata.tprint = True, one line per time step on each
+                 level ("AMRCLAW: level  2  CFL = ...  dt = ...  final t =
+                 ..."); with amrdata.verbosity_regrid >= L, one line for
+                 level L at the start ("Gridding level  2 at t = ...:  n
+                 grids with  m cells", setgrd.f) and at each regridding
+                 ("Regridding level  2 at t = ...", regrid.f); the mass
+                 check of conck.f90 ("total zeta"); and at the end the
+                 number of cells advanced on each level and the regridding
+                 statistics,
+    timing.txt   wall and CPU time and cell updates per level, and the time
+                 spent in stepgrid, boundary conditions, regridding and
+                 output, and the number of threads,
+    timing.csv   the cumulative wall and CPU time and cell updates per level
+                 at each output time.
+
+fort.amr can be large (one line per step per level), so it is streamed
+line by line and only lines with a known prefix are parsed:
+
+    tel = AMRTelemetry('_output')
+    tel.steps['dt'][tel.steps['level'] == 2]   # dt history of level 2
+    tel.regrids                                # level, t, ngrids, ncells
+    print(tel.summary())
+
+or from a case directory
+
+    python ../../tools/amr_telemetry.py _output
+
+prints a table of steps, dt range, cell updates, wall time, time fraction
+and cell updates per second for each level.
+
+The setruns leave tprint off (except tohoku), as it adds a line per step
+per level.  enable(rundata) turns it on, and verbosity_regrid on every
+level; benchmark.py does so for its runs, and runtools does for every
+case when $SPHERE_TESTS_TPRINT is set:
+
+    SPHERE_TESTS_TPRINT=1 make .output
+
+"""
+
+import os
+import re
+import numpy as np
+
+STEP_DTYPE = np.dtype([('level', 'i4'), ('cfl', 'f8'), ('dt', 'f8'),
+                       ('t', 'f8')])
+REGRID_DTYPE = np.dtype([('level', 'i4'), ('t', 'f8'), ('ngrids', 'i8'),
+                         ('ncells', 'i8')])
+MASS_DTYPE = np.dtype([('t', 'f8'), ('mass', 'f8'), ('diff', 'f8')])
+
+_GRIDDING = re.compile(r'(?:Re)?[Gg]ridding level\s+(\d+)\s+at t =\s*(\S+?):'
+                       r'\s*(\d+)\s+grids with\s+(\d+)\s+cells')
+_NUMBER = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eEdD][-+]?\d+)?')
+
+
+def _float(word):
+    """Fortran real, or nan if it overflowed its field (***)."""
+    try:
+        return float(word.replace('D', 'E').replace('d', 'e'))
+    except ValueError:
+        return np.nan
+
+
+def _numbers(line):
+    return [_float(word) for word in _NUMBER.findall(line)]
+
+
+def enable(rundata):
+    """
+    Turn on the time step lines (amrdata.tprint) and the regridding lines
+    of every level (amrdata.verbosity_regrid) of fort.amr.
+    """
+    amrdata = getattr(rundata, 'amrdata', None)
+    if amrdata is not None:
+        amrdata.tprint = True
+        amrdata.verbosity_regrid = amrdata.amr_levels_max
+    return rundata
+
+
+def parse_fort_amr(fname):
+    """
+    Stream fort.amr.  Returns a dictionary with the structured arrays
+    steps (STEP_DTYPE), regrids (REGRID_DTYPE) and mass (MASS_DTYPE), and
+    from the end of the run cells_advanced (per level), average_grids (per
+    level), max_cfl and nthreads (None if not found).
+    """
+    steps = []
+    regrids = []
+    mass = []
+    cells_advanced = {}
+    average_grids = {}
+    info = {'max_cfl': None, 'nthreads': None}
+    with open(fname) as f:
+        for line in f:
+            if line.startswith(' AMRCLAW: level'):
+                words = line.split()
+                # AMRCLAW: level L CFL = c dt = d final t = t
+                steps.append((int(words[2]), _float(words[5]),
+                              _float(words[8]), _float(words[12])))
+            elif line.startswith('Gridding level') \
+                    or 'Regridding level' in line:
+                match = _GRIDDING.match(line)
+                if match:
+                    level, t, ngrids, ncells = match.groups()
+                    regrids.append((int(level), _float(t), int(ngrids),
+                                    int(ncells)))
+            elif 'total zeta' in line:
+                # time t = t,  total zeta = m  diff = d
+                values = _numbers(line)
+                if len(values) == 3:
+                    mass.append(tuple(values))
+            elif '# cells advanced on level' in line:
+                level, ncells = _numbers(line.split('level')[1])
+                cells_advanced[int(level)] = ncells
+            elif 'average num. grids' in line:
+                level, ngrids = _numbers(line)[:2]
+                average_grids[int(level)] = ngrids
+            elif 'maximum Courant number seen' in line:
+                info['max_cfl'] = _numbers(line)[-1]
+            elif 'max threads set to' in line:
+                info['nthreads'] = int(_numbers(line)[-1])
+    info['steps'] = np.array(steps, dtype=STEP_DTYPE)
+    info['regrids'] = np.array(regrids, dtype=REGRID_DTYPE)
+    info['mass'] = np.array(mass, dtype=MASS_DTYPE)
+    info['cells_advanced'] = cells_advanced
+    info['average_grids'] = average_grids
+    return info
+
+
+def parse_timing_txt(fname):
+    """
+    Timing table of timing.txt: dictionary with per-level arrays level,
+    wall, cpu and cell_updates, the totals (wall, cpu, cell_updates), the
+    wall time of the parts of the run (stepgrid, bc, regridding, output),
+    total_time and nthreads.
+    """
+    levels = []
+    timing = {'parts': {}, 'total_time': None, 'nthreads': None}
+    parts = {'stepgrid': 'stepgrid', 'BC/ghost cells': 'bc',
+             'Regridding': 'regridding', 'Output (valout)': 'output'}
+    with open(fname) as f:
+        for line in f:
+            words = line.split()
+            if not words:
+                continue
+            if words[0].isdigit() and len(words) == 4:
+                levels.append([_float(word) for word in words])
+            elif words[0] == 'total':
+                timing['totals'] = [_float(word) for word in words[1:4]]
+            elif line.startswith('Total time:'):
+                timing['total_time'] = _float(words[2])
+            elif line.startswith('Using'):
+                timing['nthreads'] = int(_numbers(line)[0])
+            else:
+                for prefix, name in parts.items():
+                    if line.startswith(prefix):
+                        values = _numbers(line[len(prefix):])
+                        timing['parts'][name] = values[0]
+    levels = np.array(levels).reshape((-1, 4))
+    timing['level'] = levels[:, 0].astype(int)
+    timing['wall'] = levels[:, 1]
+    timing['cpu'] = levels[:, 2]
+    timing['cell_updates'] = levels[:, 3]
+    return timing
+
+
+def parse_timing_csv(fname):
+    """
+    timing.csv as a dictionary of arrays, one entry per output time:
+    output_time, wall and cpu (totals), and wall_level, cpu_level and
+    cells_level of shape (noutputs, nlevels), all cumulative.
+    """
+    data = np.loadtxt(fname, delimiter=',', skiprows=1, ndmin=2)
+    return {'output_time': data[:, 0], 'wall': data[:, 1],
+            'cpu': data[:, 2], 'wall_level': data[:, 3::3],
+            'cpu_level': data[:, 4::3], 'cells_level': data[:, 5::3]}
+
+
+class AMRTelemetry(object):
+
+    """
+    Telemetry of the run in outdir, from whichever of fort.amr, timing.txt
+    and timing.csv are present.
+    """
+
+    def __init__(self, outdir='_output'):
+        self.outdir = outdir
+        fname = os.path.join(outdir, 'fort.amr')
+        amr = parse_fort_amr(fname) if os.path.isfile(fname) \
+              else parse_fort_amr(os.devnull)
+        self.steps = amr['steps']
+        self.regrids = amr['regrids']
+        self.mass = amr['mass']
+        self.cells_advanced = amr['cells_advanced']
+        self.average_grids = amr['average_grids']
+        self.max_cfl = amr['max_cfl']
+        fname = os.path.join(outdir, 'timing.txt')
+        self.timing = parse_timing_txt(fname) if os.path.isfile(fname) \
+                      else None
+        fname = os.path.join(outdir, 'timing.csv')
+        self.timing_csv = parse_timing_csv(fname) if os.path.isfile(fname) \
+                          else None
+        self.nthreads = amr['nthreads']
+        if self.timing is not None and self.timing['nthreads']:
+            self.nthreads = self.timing['nthreads']
+
+    @property
+    def levels(self):
+        levels = set(self.steps['level']) | set(self.cells_advanced)
+        if self.timing is not None:
+            levels |= set(self.timing['level'])
+        return sorted(int(level) for level in levels)
+
+    def level_steps(self, level):
+        """Time steps taken on a level (STEP_DTYPE array)."""
+        return self.steps[self.steps['level'] == level]
+
+    def level_cells(self, level):
+        """(t, ncells) of each regridding of a level."""
+        regrids = self.regrids[self.regrids['level'] == level]
+        return regrids['t'], regrids['ncells']
+
+    def cell_updates(self, level):
+        if self.timing is not None and level in self.timing['level']:
+            updates = self.timing['cell_updates']
+            return updates[self.timing['level'] == level][0]
+        return self.cells_advanced.get(level, np.nan)
+
+    def wall_time(self, level=None):
+        """Wall time of a level, or of the whole run if level is None."""
+        if self.timing is None:
+            return np.nan
+        if level is None:
+            return self.timing['total_time']
+        return self.timing['wall'][self.timing['level'] == level][0]
+
+    def cell_updates_per_second(self, level=None):
+        """Cell updates per second of wall time, on a level or overall."""
+        if level is None:
+            cells = sum(self.cell_updates(level) for level in self.levels)
+        else:
+            cells = self.cell_updates(level)
+        wall = self.wall_time(level)
+        return cells / wall if wall else np.nan
+
+    def summary(self):
+        """Text table of the time spent on each level."""
+        lines = ['%s: %i time steps, %i regriddings, %s threads'
+                 % (self.outdir, len(self.steps), len(self.regrids),
+                    self.nthreads)]
+        lines.append('level   steps      dt min      dt max   cell updates'
+                     '   wall (s)  fraction  updates/s')
+        levels_wall = np.nansum([self.wall_time(level)
+                                 for level in self.levels])
+        for level in self.levels:
+            steps = self.level_steps(level)
+            dt = steps['dt'] if len(steps) else np.array([np.nan])
+            wall = self.wall_time(level)
+            lines.append('%5i %7i %11.4e %11.4e %14.4e %10.2f %9.3f %10.3e'
+                         % (level, len(steps), np.nanmin(dt), np.nanmax(dt),
+                            self.cell_updates(level), wall,
+                            wall / levels_wall if levels_wall else np.nan,
+                            self.cell_updates_per_second(level)))
+        if self.timing is not None:
+            total = self.timing['total_time']
+            parts = ', '.join('%s %.2f s' % (name, value) for name, value
+                              in self.timing['parts'].items())
+            lines.append('total time %.2f s (%s), %.3e cell updates/s'
+                         % (total, parts, self.cell_updates_per_second()))
+        if self.max_cfl is not None:
+            lines.append('maximum Courant number %.2f' % self.max_cfl)
+        return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Summarize fort.amr and the timing files of runs')
+    parser.add_argument('outdirs', nargs='*', default=['_output'])
+    args = parser.parse_args()
+
+    for outdir in args.outdirs:
+        print(AMRTelemetry(outdir).summary())
+        print()
@@ -0,0 +1,222 @@
+"""
+Benchmark the cases of this repository and track performance regressions.
+
+Each case is built with OpenMP (as in scaling.py) and run for a reduced
+time span (the first --fraction of its tfinal, with one output frame and
+no checkpoints), once at each of a fixed set of thread counts, one run at
+a time.  For every run the wall time, cell updates per second (from
+timing.txt, see amr_telemetry.py; not available for the 1d codes), peak
+resident memory and bytes of output are appended to a JSON history file,
+together with the host, the Clawpack version and the git revision of this
+repository:
+
+    python tools/benchmark.py --nthreads 1 4
+    python tools/benchmark.py --cases 2d/nonpolar_axisymmetric 1d/ring
+
+The first result for a host, case, thread count and fraction becomes the
+baseline; later results with a wall time more than --threshold (default
+10%) above it, or a rate of cell updates that much below it, are reported
+as regressions and make the script exit with status 1.  Use --set-baseline
+after an intended change, e.g. a Clawpack update, to replace the baselines.
+
+The runs write the time steps of each level to fort.amr (amrdata.tprint,
+see amr_telemetry.py).
+
+"""
+
+import os
+import json
+import time
+import shutil
+import socket
+import subprocess
+import numpy as np
+
+import runtools
+import scaling
+import amr_telemetry
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CASES = ['1d/ring',
+         '2d/nonpolar_axisymmetric',
+         '2d/nonpolar_axisymmetric/1d_latitude',
+         '2d/nonpolar_axisymmetric_arctic',
+         '2d/nonpolar_axisymmetric_arctic/1d_latitude',
+         '2d/nonpolar_axisymmetric_arctic_deep',
+         '2d/axisymmetric_ring',
+         '2d/aasz_butler',
+         '2d/tohoku']
+
+HISTORY_NAME = 'benchmark_history.json'
+
+
+def output_bytes(outdir):
+    """Total size of the files in outdir."""
+    return sum(os.path.getsize(os.path.join(outdir, fname))
+               for fname in os.listdir(outdir)
+               if os.path.isfile(os.path.join(outdir, fname)))
+
+
+def clawpack_version():
+    try:
+        import clawpack
+        return clawpack.__version__
+    except (ImportError, AttributeError):
+        return None
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short',
+                                        'HEAD'], cwd=REPO,
+                                       stderr=subprocess.DEVNULL
+                                       ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _finite(value):
+    """value as a float, or None if it is not a finite number (JSON)."""
+    if value is None or not np.isfinite(value):
+        return None
+    return float(value)
+
+
+def benchmark_case(case, nthreads_list=(1, 4), fraction=0.1,
+                   workdir='_benchmark', exe=None):
+    """
+    Run one case (path relative to the repository) shortened to fraction
+    of its time span at each thread count.  Returns a list of records.
+    """
+    casedir = os.path.join(REPO, case)
+    if exe is None:
+        exe = runtools.build(casedir, scaling.openmp_fflags())
+    rundata = runtools.shorten(runtools.make_rundata(casedir), fraction)
+    amr_telemetry.enable(rundata)
+    rundir = os.path.join(os.path.abspath(workdir), case.replace('/', '_'))
+    runtools.write_data(rundata, rundir, casedir)
+
+    records = []
+    for nthreads in nthreads_list:
+        outdir = os.path.join(rundir, '_output_%ithreads' % nthreads)
+        if os.path.isdir(outdir):
+            shutil.rmtree(outdir)
+        run = runtools.Run(exe, rundir, outdir, nthreads,
+                           name='%s (%i threads)' % (case, nthreads))
+        runtools.run_all([run], nthreads, interval=0.05)
+        tel = amr_telemetry.AMRTelemetry(outdir)
+        scaling.check_threads(tel.nthreads, nthreads)
+        records.append({
+            'case': case, 'nthreads': nthreads, 'fraction': fraction,
+            'tfinal': rundata.clawdata.tfinal,
+            'returncode': run.returncode, 'wall': run.elapsed,
+            'cell_updates_per_second': _finite(tel.cell_updates_per_second()),
+            'solver_threads': tel.nthreads,
+            'max_rss': run.max_rss, 'output_bytes': output_bytes(outdir),
+            'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'host': socket.gethostname(),
+            'clawpack': clawpack_version(), 'revision': git_revision()})
+    return records
+
+
+class History(object):
+
+    """Benchmark records in a JSON file, with one baseline per key."""
+
+    def __init__(self, fname=HISTORY_NAME):
+        self.fname = fname
+        if os.path.isfile(fname):
+            with open(fname) as f:
+                data = json.load(f)
+        else:
+            data = {}
+        self.records = data.get('records', [])
+        self.baselines = data.get('baselines', {})
+
+    @staticmethod
+    def key(record):
+        return '%s|%s|%i|%g' % (record['host'], record['case'],
+                                record['nthreads'], record['fraction'])
+
+    def write(self):
+        tmp = self.fname + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'baselines': self.baselines, 'records': self.records},
+                      f, indent=1)
+        os.replace(tmp, self.fname)
+
+    def add(self, record, set_baseline=False):
+        """Append a record; it becomes the baseline if there is none yet."""
+        self.records.append(record)
+        if record['returncode'] == 0 and \
+                (set_baseline or self.key(record) not in self.baselines):
+            self.baselines[self.key(record)] = record
+
+    def regression(self, record, threshold=0.1):
+        """Description of the regression of record against its baseline,
+        or None."""
+        if record['returncode'] != 0:
+            return 'run failed with return code %s' % record['returncode']
+        base = self.baselines.get(self.key(record))
+        if base is None or base is record:
+            return None
+        problems = []
+        if record['wall'] > (1 + threshold) * base['wall']:
+            problems.append('wall time %.2f s, baseline %.2f s'
+                            % (record['wall'], base['wall']))
+        rate, base_rate = record['cell_updates_per_second'], \
+                          base['cell_updates_per_second']
+        if rate and base_rate and rate * (1 + threshold) < base_rate:
+            problems.append('%.3e cell updates/s, baseline %.3e'
+                            % (rate, base_rate))
+        return ', '.join(problems) or None
+
+
+def format_record(record):
+    rate = record['cell_updates_per_second']
+    return '%-45s %3i threads %9.2f s %11s updates/s %8.1f MB rss ' \
+           '%9.1f MB out' \
+           % (record['case'], record['nthreads'], record['wall'] or np.nan,
+              '%.3e' % rate if rate else '-',
+              (record['max_rss'] or np.nan) / 2**20,
+              record['output_bytes'] / 2**20)
+
+
+if __name__ == '__main__':
+    import sys
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Benchmark the cases and flag performance regressions')
+    parser.add_argument('--cases', nargs='+', default=CASES)
+    parser.add_argument('--nthreads', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--fraction', type=float, default=0.1,
+                        help='fraction of tfinal to run (default 0.1)')
+    parser.add_argument('--workdir', default='_benchmark')
+    parser.add_argument('--history', default=HISTORY_NAME)
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative slowdown flagged (default 0.1)')
+    parser.add_argument('--set-baseline', action='store_true')
+    args = parser.parse_args()
+
+    history = History(args.history)
+    regressions = []
+    for case in args.cases:
+        try:
+            records = benchmark_case(case, args.nthreads, args.fraction,
+                                     args.workdir)
+        except (IOError, subprocess.CalledProcessError) as err:
+            print('*** Skipping %s: %s' % (case, err))
+            continue
+        for record in records:
+            history.add(record, args.set_baseline)
+            print(format_record(record))
+            problem = history.regression(record, args.threshold)
+            if problem:
+                regressions.append('%s, %i threads: %s'
+                                   % (case, record['nthreads'], problem))
+        history.write()
+
+    for regression in regressions:
+        print('*** Regression: %s' % regression)
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,233 @@
+"""
+Convert ascii GeoClaw output to binary64 or binary32 format.
+
+Several cases in this repository use clawdata.output_format = 'ascii'.
+The ascii frames are several times larger than binary ones and much slower
+to read.  This script converts existing output directories without
+rerunning the simulations:
+
+    python convert_ascii.py _output_sphere0 _output_sphere2
+    python convert_ascii.py _output --format binary32 --nproc 8
+    python convert_ascii.py _output --dest _output_binary
+
+Each frame is streamed patch by patch, so memory use is bounded by the
+largest patch.  fort.qNNNN is rewritten with headers only, the data go to
+fort.bNNNN (and aux arrays, if any, to a binary fort.aNNNN), and fort.tNNNN
+records the new format, so clawpack.pyclaw and visclaw read the converted
+frames with no change to setplot.py.  The ascii data have no ghost cells,
+so the binary arrays are padded with num_ghost layers of zeros, num_ghost
+being that of the original fort.tNNNN (frameio.binary_num_ghost).
+
+The new files are written to a temporary directory and read back, both
+patch by patch and (with aux) through clawpack.pyclaw; only if every
+patch header and every value round-trips exactly (after rounding to
+float32 for binary32) are they moved into place.  Frames are converted
+in parallel by a pool of processes.
+
+"""
+
+import os
+import glob
+import shutil
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+
+import frameio
+import patch_index
+
+HEADER_FIELDS = ['patch', 'level', 'mx', 'my', 'xlow', 'ylow', 'dx', 'dy']
+
+
+def _digest(q, dtype):
+    return hashlib.sha1(np.ascontiguousarray(q, dtype=dtype)).digest()
+
+
+def _convert_file(src, records, tinfo, num_var, qf, bf, dtype, num_ghost):
+    """
+    Copy the patches described by records from ascii file src, writing
+    headers to qf (if not None) and data, padded with num_ghost ghost
+    cells, to bf.  Returns a list of digests.
+    """
+    digests = []
+    with open(src, 'rb') as f:
+        for record in records:
+            q = frameio.read_patch_data(f, record, tinfo, num_var)
+            if qf is not None:
+                frameio.write_header(qf, record, tinfo['num_dim'])
+            frameio.write_binary_data(bf, q, num_ghost, dtype)
+            digests.append(_digest(q, dtype))
+    return digests
+
+
+def _verify(qname, dname, tinfo, num_var, records, digests):
+    """Read back a converted file and compare with the original records."""
+    new_records = frameio.scan_file(qname, tinfo, num_var, False)
+    for field in HEADER_FIELDS:
+        if not np.array_equal(new_records[field], records[field]):
+            raise ValueError('Patch headers differ in %s' % qname)
+    dtype = frameio.BINARY_DTYPES[tinfo['file_format']]
+    with open(dname, 'rb') as f:
+        for record, digest in zip(new_records, digests):
+            q = frameio.read_patch_data(f, record, tinfo, num_var)
+            if _digest(q, dtype) != digest:
+                raise ValueError('Data for patch %i differ in %s'
+                                 % (record['patch'], dname))
+
+
+def _verify_pyclaw(frameno, path, tinfo, file_prefix, digests, aux_digests):
+    """
+    Read a converted frame with clawpack.pyclaw, as visclaw does, and
+    compare q and aux of every patch with the original data.
+    """
+    from clawpack import pyclaw
+    dtype = frameio.BINARY_DTYPES[tinfo['file_format']]
+    solution = pyclaw.Solution(frameno, path=path,
+                               file_format=tinfo['file_format'],
+                               file_prefix=file_prefix, read_aux=True)
+    for k, state in enumerate(solution.states):
+        if _digest(state.q, dtype) != digests[k] \
+                or _digest(state.aux, dtype) != aux_digests[k]:
+            raise ValueError('pyclaw reads patch %i of frame %i differently'
+                             % (state.patch.patch_index, frameno))
+
+
+def convert_frame(frameno, outdir='_output', dest=None,
+                  file_format='binary64', file_prefix='fort', verify=True):
+    """
+    Convert one ascii frame to binary, in place or into directory dest.
+    Returns (frameno, bytes before, bytes after), or None if the frame
+    is not ascii (it is then copied to dest as it is).
+    """
+    tinfo, records = frameio.scan_patches(frameno, outdir, file_prefix)
+    if tinfo['file_format'] != 'ascii':
+        if dest is not None \
+                and os.path.abspath(dest) != os.path.abspath(outdir):
+            _copy_frame(frameno, outdir, dest, file_prefix)
+        return None
+    dest = outdir if dest is None else dest
+    dtype = frameio.BINARY_DTYPES[file_format]
+    num_ghost = frameio.binary_num_ghost(tinfo)
+    tinfo_new = dict(tinfo, file_format=file_format, num_ghost=num_ghost)
+
+    tmpdir = os.path.join(dest, '.convert_%s' % str(frameno).zfill(4))
+    os.makedirs(tmpdir, exist_ok=True)
+    src = {}
+    fname = {}
+    tmp = {}
+    for kind in 'qbat':
+        src[kind] = frameio.frame_fname(frameno, outdir, file_prefix, kind)
+        fname[kind] = frameio.frame_fname(frameno, dest, file_prefix, kind)
+        tmp[kind] = frameio.frame_fname(frameno, tmpdir, file_prefix, kind)
+    kinds = ['q', 'b', 't']
+
+    try:
+        nbytes_old = os.path.getsize(src['q']) + os.path.getsize(src['t'])
+        with open(tmp['q'], 'w') as qf, open(tmp['b'], 'wb') as bf:
+            digests = _convert_file(src['q'], records, tinfo,
+                                    tinfo['num_eqn'], qf, bf, dtype,
+                                    num_ghost)
+
+        aux_records = frameio.scan_aux(frameno, outdir, file_prefix)[1]
+        if aux_records is not None:
+            nbytes_old += os.path.getsize(src['a'])
+            with open(tmp['a'], 'wb') as af:
+                aux_digests = _convert_file(src['a'], aux_records, tinfo,
+                                            tinfo['num_aux'], None, af,
+                                            dtype, num_ghost)
+            kinds.insert(2, 'a')
+
+        frameio.write_t(tmp['t'], tinfo_new)
+
+        if verify:
+            _verify(tmp['q'], tmp['b'], tinfo_new, tinfo['num_eqn'],
+                    records, digests)
+            if aux_records is not None:
+                _verify(tmp['q'], tmp['a'], tinfo_new, tinfo['num_aux'],
+                        aux_records, aux_digests)
+                _verify_pyclaw(frameno, tmpdir, tinfo_new, file_prefix,
+                               digests, aux_digests)
+
+        # fort.t goes last so that it never announces data not yet in place:
+        for kind in kinds:
+            os.replace(tmp[kind], fname[kind])
+    finally:
+        shutil.rmtree(tmpdir)
+    index = patch_index.index_fname(frameno, dest, file_prefix)
+    if os.path.isfile(index):
+        os.remove(index)
+
+    nbytes_new = sum(os.path.getsize(fname[kind]) for kind in kinds)
+    return frameno, nbytes_old, nbytes_new
+
+
+def _copy_frame(frameno, outdir, dest, file_prefix):
+    """Copy the fort.q/b/a/t files of a frame, fort.t last."""
+    for kind in 'qbat':
+        fname = frameio.frame_fname(frameno, outdir, file_prefix, kind)
+        if os.path.isfile(fname):
+            shutil.copy2(fname, frameio.frame_fname(frameno, dest,
+                                                    file_prefix, kind))
+
+
+def _copy_other_files(outdir, dest, file_prefix):
+    """Copy files other than frame files (gauges, fort.amr, *.data, ...)."""
+    frame_prefixes = ['%s.%s' % (file_prefix, kind) for kind in 'tqabi']
+    for fname in glob.glob(os.path.join(outdir, '*')):
+        base = os.path.basename(fname)
+        if base[:len(file_prefix)+2] in frame_prefixes \
+                and base[len(file_prefix)+2:].isdigit():
+            continue
+        if os.path.isfile(fname):
+            shutil.copy2(fname, os.path.join(dest, base))
+
+
+def convert_outdir(outdir='_output', dest=None, file_format='binary64',
+                   nproc=None, file_prefix='fort', verify=True):
+    """
+    Convert all ascii frames in outdir using a pool of nproc processes
+    (default os.cpu_count()).  If dest is given the binary frames are
+    written there and the other files in outdir, including frames that
+    are already binary, are copied.
+    """
+    if dest is not None and os.path.abspath(dest) != os.path.abspath(outdir):
+        os.makedirs(dest, exist_ok=True)
+        _copy_other_files(outdir, dest, file_prefix)
+    framenos = patch_index.frame_numbers(outdir, file_prefix)
+    total_old = total_new = 0
+    with ProcessPoolExecutor(max_workers=nproc) as pool:
+        futures = [pool.submit(convert_frame, frameno, outdir, dest,
+                               file_format, file_prefix, verify)
+                   for frameno in framenos]
+        for future in as_completed(futures):
+            result = future.result()
+            if result is None:
+                continue
+            frameno, nbytes_old, nbytes_new = result
+            total_old += nbytes_old
+            total_new += nbytes_new
+            print('Converted frame %4i: %10.3f MB -> %10.3f MB'
+                  % (frameno, nbytes_old/1e6, nbytes_new/1e6))
+    print('%s: %.3f MB of ascii frames converted to %.3f MB of %s'
+          % (outdir, total_old/1e6, total_new/1e6, file_format))
+    return total_old, total_new
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Convert ascii GeoClaw frames to binary')
+    parser.add_argument('outdirs', nargs='+')
+    parser.add_argument('--format', default='binary64',
+                        choices=['binary64', 'binary32'])
+    parser.add_argument('--dest', default=None,
+                        help='write converted frames here (one outdir only)')
+    parser.add_argument('--nproc', type=int, default=None)
+    parser.add_argument('--no-verify', action='store_true')
+    args = parser.parse_args()
+
+    if args.dest is not None and len(args.outdirs) > 1:
+        parser.error('--dest can only be used with a single outdir')
+    for outdir in args.outdirs:
+        convert_outdir(outdir, args.dest, args.format, args.nproc,
+                       verify=not args.no_verify)
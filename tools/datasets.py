@@ -0,0 +1,232 @@
+"""
+Registry of the topography, deformation and observation data sets used by
+the realistic cases, and staging of the files a run needs to node-local
+disk.
+
+The cases refer to data sets by name (DATASETS), e.g.
+
+    topodir = datasets.directory('hawaii_topo')
+
+and the directory of each is, in order of precedence,
+
+  - $SPHERE_TESTS_DATA_<NAME>, e.g. SPHERE_TESTS_DATA_HAWAII_TOPO,
+  - "path" of the data set in the config file, $SPHERE_TESTS_DATASETS or
+    ~/.config/sphere_tests/datasets.json:
+
+        {"datasets": {"hawaii_topo": {"path": "/shared/topo/hawaii",
+                                      "sha1": {"hawaii_6s.txt": "3f0a..."}}},
+         "stage_dir": "/local/scratch/sphere_tests"}
+
+  - the default location in DATASETS.
+
+If a stage directory is set ($SPHERE_TESTS_STAGE_DIR or "stage_dir"),
+stage_files copies each topo and dtopo file of a run into
+stage_dir/<sha1>/<name> and points rundata at the copy.  It is called by
+the __main__ block of setrun.py (make .data) and by runtools.write_data
+for the tools that launch runs, not by setrun(), so the tools that only
+read the setrun of a case see the original files.
+The sha1 is computed while copying and checked against the "sha1" of the
+config file, if recorded there, and stage_dir/index.json remembers it by
+source path, size and mtime, so later jobs on the node reuse the copy
+without reading the source again.
+
+    python tools/datasets.py list
+    python tools/datasets.py checksum tohoku2011_topo    # record sha1s
+    python tools/datasets.py stage 2d/tohoku 2d/aasz_butler
+
+"""
+
+import os
+import json
+import hashlib
+
+DATASETS = {
+    'hawaii_topo': '/Users/rjl/git/hawaii_land_trust/topo/topofiles',
+    'hawaii_dtopo': '/Users/rjl/git/hawaii_land_trust/dtopo/dtopofiles',
+    'tohoku2011_topo': '/Users/rjl/git/tohoku2011-paper1/topo',
+    'tohoku2011_sources': '/Users/rjl/git/tohoku2011-paper1/sources',
+    'tohoku2011_dart': '/Users/rjl/git/tohoku2011-paper1/dart',
+    }
+
+INDEX = 'index.json'
+
+
+def config_fname():
+    return os.environ.get('SPHERE_TESTS_DATASETS',
+                          os.path.join(os.path.expanduser('~'), '.config',
+                                       'sphere_tests', 'datasets.json'))
+
+
+def load_config(fname=None):
+    fname = fname or config_fname()
+    if not os.path.isfile(fname):
+        return {'datasets': {}}
+    with open(fname) as f:
+        config = json.load(f)
+    config.setdefault('datasets', {})
+    return config
+
+
+def directory(name, config=None):
+    """Local directory of the data set name."""
+    if name not in DATASETS:
+        raise KeyError('Unknown data set %s, known: %s'
+                       % (name, ', '.join(sorted(DATASETS))))
+    env = 'SPHERE_TESTS_DATA_%s' % name.upper()
+    if env in os.environ:
+        return os.environ[env]
+    config = load_config() if config is None else config
+    entry = config['datasets'].get(name, {})
+    return entry.get('path', DATASETS[name])
+
+
+def path(name, fname, config=None):
+    """Local path of the file fname of the data set name."""
+    return os.path.join(directory(name, config), fname)
+
+
+def stage_dir(config=None):
+    """
+    Node-local stage directory, or None if files are used in place (also
+    if $SPHERE_TESTS_STAGE_DIR is set but empty).
+    """
+    config = load_config() if config is None else config
+    return os.environ.get('SPHERE_TESTS_STAGE_DIR',
+                          config.get('stage_dir')) or None
+
+
+def expected_sha1(fname, config=None):
+    """sha1 of fname recorded in the config file, if any."""
+    config = load_config() if config is None else config
+    fname = os.path.abspath(fname)
+    for name in config['datasets']:
+        if os.path.dirname(fname) == os.path.abspath(directory(name, config)):
+            return config['datasets'][name].get('sha1', {}) \
+                         .get(os.path.basename(fname))
+    return None
+
+
+class Stage(object):
+
+    """Content-addressed copies of data files in a node-local directory."""
+
+    def __init__(self, stagedir, config=None):
+        self.stagedir = os.path.abspath(stagedir)
+        self.config = load_config() if config is None else config
+        os.makedirs(self.stagedir, exist_ok=True)
+        self._index_fname = os.path.join(self.stagedir, INDEX)
+
+    def _index(self):
+        if not os.path.isfile(self._index_fname):
+            return {}
+        with open(self._index_fname) as f:
+            return json.load(f)
+
+    def _record(self, fname, stamp, sha1):
+        index = self._index()   # reread: other jobs may have added entries
+        index[fname] = [stamp, sha1]
+        tmp = '%s.%i.tmp' % (self._index_fname, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp, self._index_fname)
+
+    def _copy(self, fname, blocksize=2**22):
+        """Copy fname to a temporary file, returning it and its sha1."""
+        tmp = os.path.join(self.stagedir, '.%s.%i.tmp'
+                           % (os.path.basename(fname), os.getpid()))
+        sha1 = hashlib.sha1()
+        with open(fname, 'rb') as src, open(tmp, 'wb') as dest:
+            for block in iter(lambda: src.read(blocksize), b''):
+                sha1.update(block)
+                dest.write(block)
+        return tmp, sha1.hexdigest()
+
+    def stage(self, fname):
+        """Path of the staged copy of fname, copying it if needed."""
+        fname = os.path.abspath(fname)
+        if os.path.dirname(os.path.dirname(fname)) == self.stagedir:
+            return fname    # staged already
+        if not os.path.isfile(fname):
+            raise IOError('%s not found, set its data set directory in %s'
+                          % (fname, config_fname()))
+        stat = os.stat(fname)
+        stamp = [stat.st_size, stat.st_mtime]
+        entry = self._index().get(fname)
+        if entry is not None and entry[0] == stamp:
+            staged = os.path.join(self.stagedir, entry[1],
+                                  os.path.basename(fname))
+            if os.path.isfile(staged):
+                return staged
+        tmp, sha1 = self._copy(fname)
+        expected = expected_sha1(fname, self.config)
+        if expected is not None and expected != sha1:
+            os.remove(tmp)
+            raise IOError('Checksum of %s is %s, expected %s'
+                          % (fname, sha1, expected))
+        staged = os.path.join(self.stagedir, sha1, os.path.basename(fname))
+        os.makedirs(os.path.dirname(staged), exist_ok=True)
+        os.replace(tmp, staged)
+        self._record(fname, stamp, sha1)
+        print('Staged %s to %s' % (fname, staged))
+        return staged
+
+
+def stage_files(rundata, config=None):
+    """
+    If a stage directory is set, replace the topo and dtopo files of
+    rundata by staged copies.  Called before the .data files of a run are
+    written.
+    """
+    config = load_config() if config is None else config
+    stagedir = stage_dir(config)
+    if stagedir is None:
+        return rundata
+    stage = Stage(stagedir, config)
+    for files in [rundata.topo_data.topofiles,
+                  rundata.dtopo_data.dtopofiles]:
+        for item in files:
+            item[-1] = stage.stage(item[-1])
+    return rundata
+
+
+def checksums(name, config=None):
+    """Dictionary file name -> sha1 of the files of a data set."""
+    import run_cache
+    dirname = directory(name, config)
+    return dict((fname, run_cache.file_sha1(os.path.join(dirname, fname)))
+                for fname in sorted(os.listdir(dirname))
+                if os.path.isfile(os.path.join(dirname, fname)))
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Data sets of the realistic cases')
+    parser.add_argument('command', choices=['list', 'checksum', 'stage'])
+    parser.add_argument('args', nargs='*',
+                        help='data set names (checksum) or cases (stage)')
+    args = parser.parse_args()
+
+    config = load_config()
+    if args.command == 'list':
+        for name in sorted(DATASETS):
+            dirname = directory(name, config)
+            print('%-20s %s%s' % (name, dirname, '' if os.path.isdir(dirname)
+                                  else '   (missing)'))
+    elif args.command == 'checksum':
+        for name in args.args or sorted(DATASETS):
+            entry = config['datasets'].setdefault(name, {})
+            entry['sha1'] = checksums(name, config)
+            print('%s: %i files' % (name, len(entry['sha1'])))
+        fname = config_fname()
+        os.makedirs(os.path.dirname(fname), exist_ok=True)
+        with open(fname, 'w') as f:
+            json.dump(config, f, indent=1)
+        print('Checksums written to %s' % fname)
+    else:
+        import runtools
+        if stage_dir(config) is None:
+            raise SystemExit('No stage directory: set SPHERE_TESTS_STAGE_DIR '
+                             'or stage_dir in %s' % config_fname())
+        for casedir in args.args:
+            stage_files(runtools.make_rundata(casedir), config)
@@ -0,0 +1,430 @@
+"""
+Compressed single-file archive of a GeoClaw output directory, with random
+access to individual patches.
+
+Output directories such as those of 2d/aasz_butler (8 AMR levels, hundreds
+of frames) are too large to keep around.  An archive holds a whole run in
+one file:
+
+  - every patch array (q and, if present, aux) of every frame is stored as
+    an independently compressed chunk, using zlib or lzma from the
+    standard library, optionally after byte shuffling (which groups the
+    exponent bytes of the floats and usually compresses much better),
+  - the other files in the output directory (fort.amr, gauge files,
+    *.data, ...) are stored as compressed chunks too,
+  - an index by frame, level and patch is written at the end of the file.
+
+Create an archive and read it back with
+
+    python frame_archive.py _output_sphere2 butler_sphere2.arc --codec lzma
+    python frame_archive.py --extract butler_sphere2.arc _restored
+    python frame_archive.py --list butler_sphere2.arc
+
+or from Python
+
+    from frame_archive import FrameArchive
+    arc = FrameArchive('butler_sphere2.arc')
+    recs = arc.patches(10, level=8)
+    q = arc.read_patch(10, recs['patch'][0])      # decompresses one chunk
+    framesoln = arc.solution(10)                   # clawpack.pyclaw Solution
+
+Only the requested chunks are read and decompressed, into preallocated
+arrays (pass out= to reuse a buffer).
+
+"""
+
+import os
+import io
+import glob
+import zlib
+import lzma
+import struct
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+import frameio
+import patch_index
+
+MAGIC = b'CLAWARC1'
+FOOTER = struct.Struct('<8sQQ')     # magic, index offset, index length
+
+CODECS = {'zlib': 0, 'lzma': 1}
+
+# One entry per stored patch array:
+CHUNK_DTYPE = np.dtype([('frame', 'i4'), ('aux', 'i1'),
+                        ('patch', 'i4'), ('level', 'i4'),
+                        ('mx', 'i4'), ('my', 'i4'),
+                        ('xlow', 'f8'), ('ylow', 'f8'),
+                        ('dx', 'f8'), ('dy', 'f8'),
+                        ('num_var', 'i4'), ('itemsize', 'i1'),
+                        ('offset', 'i8'), ('nbytes', 'i8'),
+                        ('raw_nbytes', 'i8')])
+
+# One entry per frame:
+FRAME_DTYPE = np.dtype([('frame', 'i4'), ('t', 'f8'),
+                        ('num_eqn', 'i4'), ('num_aux', 'i4'),
+                        ('num_dim', 'i4'), ('num_patches', 'i4'),
+                        ('file_format', 'U8'), ('num_ghost', 'i4')])
+
+
+def _shuffle(data, itemsize):
+    a = np.frombuffer(data, dtype=np.uint8)
+    return a.reshape((-1, itemsize)).T.tobytes()
+
+
+def _unshuffle(data, itemsize, out):
+    """Undo _shuffle, writing the bytes into the array out."""
+    a = np.frombuffer(data, dtype=np.uint8).reshape((itemsize, -1))
+    out.view(np.uint8).reshape((-1, itemsize))[...] = a.T
+
+
+def _compress(data, codec, level):
+    if codec == 'lzma':
+        return lzma.compress(data, preset=level)
+    return zlib.compress(data, level)
+
+
+def _decompress(data, codec):
+    if codec == 'lzma':
+        return lzma.decompress(data)
+    return zlib.decompress(data)
+
+
+def _is_frame_file(base, file_prefix):
+    kind = base[len(file_prefix)+1:len(file_prefix)+2]
+    return base.startswith(file_prefix + '.') and kind in 'tqabi' \
+           and base[len(file_prefix)+2:].isdigit()
+
+
+class ArchiveWriter(object):
+
+    """
+    Write an archive incrementally:
+
+        with ArchiveWriter('run.arc', codec='zlib') as writer:
+            writer.add_frame(0, '_output')
+            ...
+            writer.add_file('_output/fort.amr')
+    """
+
+    def __init__(self, fname, codec='zlib', level=None, shuffle=True,
+                 nthreads=None):
+        if codec not in CODECS:
+            raise ValueError('Unknown codec %s, use one of %s'
+                             % (codec, list(CODECS)))
+        self.fname = fname
+        self.codec = codec
+        self.level = level if level is not None else \
+                     (6 if codec == 'zlib' else 3)
+        self.shuffle = shuffle
+        self.nthreads = nthreads
+        self.f = open(fname + '.tmp', 'wb')
+        self.f.write(MAGIC)
+        self.chunks = []
+        self.frames = []
+        self.files = []
+
+    def _write(self, data):
+        offset = self.f.tell()
+        self.f.write(data)
+        return offset, len(data)
+
+    def _pack(self, q, itemsize):
+        raw = np.ascontiguousarray(q).tobytes()
+        if self.shuffle:
+            raw = _shuffle(raw, itemsize)
+        return _compress(raw, self.codec, self.level), len(raw)
+
+    def add_frame(self, frameno, outdir='_output', file_prefix='fort'):
+        """Add all patches of one frame (any output format)."""
+        tinfo, records, qlist = frameio.read_frame(frameno, outdir,
+                                                   file_prefix)
+        arrays = [(0, r, q) for r, q in zip(records, qlist)]
+        aux_records = frameio.scan_aux(frameno, outdir, file_prefix)[1]
+        if aux_records is not None:
+            fname = frameio.data_fname(frameno, tinfo, outdir, file_prefix,
+                                       aux=True)
+            with open(fname, 'rb') as f:
+                for r in aux_records:
+                    aux = frameio.read_patch_data(f, r, tinfo,
+                                                  tinfo['num_aux'])
+                    arrays.append((1, r, aux))
+
+        dtype = np.float32 if tinfo['file_format'] == 'binary32' \
+                else np.float64
+        itemsize = np.dtype(dtype).itemsize
+        # zlib and lzma release the GIL, so threads compress in parallel:
+        with ThreadPoolExecutor(max_workers=self.nthreads) as pool:
+            packed = pool.map(lambda a: self._pack(np.asarray(a[2], dtype),
+                                                   itemsize), arrays)
+            for (aux, r, q), (data, raw_nbytes) in zip(arrays, packed):
+                offset, nbytes = self._write(data)
+                self.chunks.append((frameno, aux, r['patch'], r['level'],
+                                    r['mx'], r['my'], r['xlow'], r['ylow'],
+                                    r['dx'], r['dy'], q.shape[0], itemsize,
+                                    offset, nbytes, raw_nbytes))
+        self.frames.append((frameno, tinfo['t'], tinfo['num_eqn'],
+                            tinfo['num_aux'], tinfo['num_dim'],
+                            tinfo['num_patches'], tinfo['file_format'],
+                            tinfo['num_ghost']))
+
+    def add_file(self, fname, name=None):
+        """Add an arbitrary file (stored compressed under its base name)."""
+        with open(fname, 'rb') as f:
+            data = f.read()
+        offset, nbytes = self._write(_compress(data, self.codec, self.level))
+        self.files.append((name or os.path.basename(fname), offset, nbytes))
+
+    def close(self):
+        chunks = np.array(self.chunks, dtype=CHUNK_DTYPE)
+        frames = np.array(self.frames, dtype=FRAME_DTYPE)
+        buf = io.BytesIO()
+        np.savez(buf, chunks=chunks, frames=frames,
+                 file_names=np.array([f[0] for f in self.files], dtype='U'),
+                 file_offsets=np.array([f[1] for f in self.files], 'i8'),
+                 file_nbytes=np.array([f[2] for f in self.files], 'i8'),
+                 codec=np.array(self.codec), shuffle=np.array(self.shuffle))
+        offset, nbytes = self._write(zlib.compress(buf.getvalue()))
+        self.f.write(FOOTER.pack(MAGIC, offset, nbytes))
+        self.f.close()
+        os.replace(self.fname + '.tmp', self.fname)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.f.close()
+            os.remove(self.fname + '.tmp')
+
+
+def write_archive(outdir, fname, codec='zlib', level=None, shuffle=True,
+                  framenos='all', include_files=True, file_prefix='fort',
+                  nthreads=None, verbose=True):
+    """Archive the frames (and other files) in outdir into file fname."""
+    if framenos == 'all':
+        framenos = patch_index.frame_numbers(outdir, file_prefix)
+    with ArchiveWriter(fname, codec, level, shuffle, nthreads) as writer:
+        for frameno in framenos:
+            writer.add_frame(frameno, outdir, file_prefix)
+            if verbose:
+                print('Archived frame %i' % frameno)
+        if include_files:
+            for path in sorted(glob.glob(os.path.join(outdir, '*'))):
+                base = os.path.basename(path)
+                if os.path.isfile(path) and \
+                        not _is_frame_file(base, file_prefix):
+                    writer.add_file(path)
+    if verbose:
+        nbytes = sum(os.path.getsize(p) for p in
+                     glob.glob(os.path.join(outdir, '*'))
+                     if os.path.isfile(p))
+        print('Created %s: %.3f MB from %.3f MB in %s'
+              % (fname, os.path.getsize(fname)/1e6, nbytes/1e6, outdir))
+
+
+class FrameArchive(object):
+
+    """
+    Random access reader for an archive written by ArchiveWriter.
+
+    Attributes:
+        frames   array of FRAME_DTYPE, one entry per frame
+        chunks   array of CHUNK_DTYPE, one entry per stored patch array
+        files    dictionary of the other stored files: name -> (offset,nbytes)
+    """
+
+    def __init__(self, fname):
+        self.fname = fname
+        self.f = open(fname, 'rb')
+        if self.f.read(len(MAGIC)) != MAGIC:
+            raise IOError('%s is not a frame archive' % fname)
+        self.f.seek(-FOOTER.size, os.SEEK_END)
+        magic, offset, nbytes = FOOTER.unpack(self.f.read(FOOTER.size))
+        if magic != MAGIC:
+            raise IOError('%s is incomplete (no index found)' % fname)
+        self.f.seek(offset)
+        index = np.load(io.BytesIO(zlib.decompress(self.f.read(nbytes))))
+        self.chunks = index['chunks']
+        self.frames = index['frames']
+        self.codec = index['codec'].item()
+        self.shuffle = bool(index['shuffle'])
+        self.files = dict(zip(index['file_names'],
+                              zip(index['file_offsets'],
+                                  index['file_nbytes'])))
+        self.num_dim = int(self.frames['num_dim'][0]) if len(self.frames) \
+                       else 2
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def framenos(self):
+        return list(self.frames['frame'])
+
+    def tinfo(self, frameno):
+        """fort.t values for frameno, as returned by frameio.read_t."""
+        fr = self.frames[self.frames['frame'] == frameno]
+        if len(fr) == 0:
+            raise KeyError('Frame %i is not in %s' % (frameno, self.fname))
+        fr = fr[0]
+        # archives written before num_ghost was stored:
+        num_ghost = int(fr['num_ghost']) if 'num_ghost' in fr.dtype.names \
+                    else frameio.NUM_GHOST
+        return {'t': float(fr['t']), 'num_eqn': int(fr['num_eqn']),
+                'num_patches': int(fr['num_patches']),
+                'num_aux': int(fr['num_aux']), 'num_dim': int(fr['num_dim']),
+                'num_ghost': num_ghost,
+                'file_format': str(fr['file_format'])}
+
+    def patches(self, frameno, level=None, aux=False):
+        """Chunk records for the patches of one frame, optionally one level."""
+        mask = (self.chunks['frame'] == frameno) & \
+               (self.chunks['aux'] == int(aux))
+        if level is not None:
+            mask &= (self.chunks['level'] == level)
+        return self.chunks[mask]
+
+    def _read_chunk(self, chunk, out=None):
+        shape = (int(chunk['num_var']), int(chunk['mx']))
+        if self.num_dim > 1:
+            shape = shape + (int(chunk['my']),)
+        dtype = np.float32 if chunk['itemsize'] == 4 else np.float64
+        if out is None:
+            out = np.empty(shape, dtype=dtype)
+        elif out.shape != shape or out.dtype != dtype \
+                or not out.flags.c_contiguous:
+            raise ValueError('out must be a contiguous %s array of shape %s'
+                             % (np.dtype(dtype), shape))
+        self.f.seek(int(chunk['offset']))
+        data = _decompress(self.f.read(int(chunk['nbytes'])), self.codec)
+        if self.shuffle:
+            _unshuffle(data, int(chunk['itemsize']), out)
+        else:
+            out.view(np.uint8).reshape(-1)[...] = \
+                    np.frombuffer(data, dtype=np.uint8)
+        return out
+
+    def read_patch(self, frameno, patch, aux=False, out=None):
+        """
+        Decompress one patch array (num_var, mx, my) of frame frameno,
+        into out if given (which must have the right shape and dtype).
+        """
+        chunk = self.patches(frameno, aux=aux)
+        chunk = chunk[chunk['patch'] == patch]
+        if len(chunk) == 0:
+            raise KeyError('Patch %i of frame %i is not in %s'
+                           % (patch, frameno, self.fname))
+        return self._read_chunk(chunk[0], out)
+
+    def read_frame(self, frameno, levels=None, aux=False):
+        """
+        Return (chunk records, list of arrays) for one frame, only for the
+        given levels if levels is not None.
+        """
+        chunks = self.patches(frameno, aux=aux)
+        if levels is not None:
+            chunks = chunks[np.isin(chunks['level'], levels)]
+        return chunks, [self._read_chunk(c) for c in chunks]
+
+    def read_file(self, name):
+        """Contents (bytes) of one of the other stored files."""
+        offset, nbytes = self.files[name]
+        self.f.seek(int(offset))
+        return _decompress(self.f.read(int(nbytes)), self.codec)
+
+    def solution(self, frameno, levels=None):
+        """The frame as a clawpack.pyclaw Solution, e.g. for plotting."""
+        chunks, qlist = self.read_frame(frameno, levels)
+        return frameio.make_solution(self.tinfo(frameno), chunks, qlist)
+
+    def extract_frame(self, frameno, outdir, file_prefix='fort'):
+        """
+        Write frame frameno into outdir as binary fort.t/q/b files (and
+        fort.a if aux arrays were stored) that visclaw can plot, with the
+        num_ghost ghost cells of the original output (zeros), which
+        pyclaw's binary reader expects.
+        """
+        os.makedirs(outdir, exist_ok=True)
+        tinfo = self.tinfo(frameno)
+        # the chunks of a frame are stored in single precision only if it
+        # was written as binary32 (add_frame), and a frame may have none:
+        fmt = 'binary32' if tinfo['file_format'] == 'binary32' \
+              else 'binary64'
+        tinfo['file_format'] = fmt
+        num_ghost = frameio.binary_num_ghost(tinfo)
+        tinfo['num_ghost'] = num_ghost
+        dtype = frameio.BINARY_DTYPES[fmt]
+        fname = {}
+        for kind in 'tqba':
+            fname[kind] = frameio.frame_fname(frameno, outdir, file_prefix,
+                                              kind)
+        chunks = self.patches(frameno)
+        with open(fname['q'], 'w') as qf, open(fname['b'], 'wb') as bf:
+            for c in chunks:
+                frameio.write_header(qf, c, tinfo['num_dim'])
+                frameio.write_binary_data(bf, self._read_chunk(c), num_ghost,
+                                          dtype)
+        aux_chunks = self.patches(frameno, aux=True)
+        if len(aux_chunks) > 0:
+            with open(fname['a'], 'wb') as af:
+                for c in aux_chunks:
+                    frameio.write_binary_data(af, self._read_chunk(c),
+                                              num_ghost, dtype)
+        frameio.write_t(fname['t'], tinfo)
+
+    def extract(self, outdir, framenos='all', include_files=True,
+                file_prefix='fort'):
+        """Restore an output directory from the archive."""
+        os.makedirs(outdir, exist_ok=True)
+        if framenos == 'all':
+            framenos = self.framenos
+        for frameno in framenos:
+            self.extract_frame(frameno, outdir, file_prefix)
+        if include_files:
+            for name in self.files:
+                with open(os.path.join(outdir, name), 'wb') as f:
+                    f.write(self.read_file(name))
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Create, list or extract a compressed frame archive')
+    parser.add_argument('source', help='outdir to archive, or archive file')
+    parser.add_argument('target', nargs='?', default=None,
+                        help='archive file to write, or outdir to extract to')
+    parser.add_argument('--codec', default='zlib', choices=list(CODECS))
+    parser.add_argument('--level', type=int, default=None)
+    parser.add_argument('--no-shuffle', action='store_true')
+    parser.add_argument('--frames', type=int, nargs='*', default=None)
+    parser.add_argument('--extract', action='store_true')
+    parser.add_argument('--list', action='store_true')
+    args = parser.parse_args()
+
+    framenos = 'all' if args.frames is None else args.frames
+    if args.list:
+        with FrameArchive(args.source) as arc:
+            for fr in arc.frames:
+                chunks = arc.patches(fr['frame'])
+                print('frame %4i  t = %12.3f  %5i patches  levels %s  '
+                      '%10.3f MB compressed'
+                      % (fr['frame'], fr['t'], fr['num_patches'],
+                         sorted(set(chunks['level'].tolist())),
+                         chunks['nbytes'].sum()/1e6))
+            print('other files: %s' % ', '.join(sorted(arc.files)))
+    elif args.extract:
+        with FrameArchive(args.source) as arc:
+            arc.extract(args.target or '_output', framenos)
+    else:
+        target = args.target or args.source.rstrip('/') + '.arc'
+        write_archive(args.source, target, args.codec, args.level,
+                      not args.no_shuffle, framenos)
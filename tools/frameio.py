@@ -0,0 +1,422 @@
+"""
+Lightweight reading of GeoClaw frame files fort.tNNNN, fort.qNNNN and
+(for binary output) fort.bNNNN, keeping track of byte offsets so that
+individual patches can be read without parsing the whole frame.
+
+The file layout is the one written by valout in Clawpack 5.x:
+
+  fort.tNNNN   time, num_eqn, number of patches, num_aux, num_dim,
+               num_ghost and (5.9 and later) the output format.
+  fort.qNNNN   for each patch a header (grid_number, AMR_level, mx, [my,]
+               xlow, [ylow,] dx, [dy]) followed by a blank line.  For
+               ascii output the data follow each header, one line per cell
+               with all components, and a blank line after each row.
+  fort.bNNNN   for binary output, the patch arrays including ghost cells,
+               stored one after another in Fortran order.
+
+Patch arrays are returned with shape (num_eqn, mx, my), or (num_eqn, mx)
+in one space dimension, as in clawpack.pyclaw.
+
+"""
+
+import os
+import numpy as np
+
+# One record per patch, as returned by scan_patches.
+# data_offset and data_nbytes refer to fort.qNNNN for ascii output
+# and to fort.bNNNN for binary output.
+PATCH_DTYPE = np.dtype([('patch', 'i4'), ('level', 'i4'),
+                        ('mx', 'i4'), ('my', 'i4'),
+                        ('xlow', 'f8'), ('ylow', 'f8'),
+                        ('xhigh', 'f8'), ('yhigh', 'f8'),
+                        ('dx', 'f8'), ('dy', 'f8'),
+                        ('q_offset', 'i8'),
+                        ('data_offset', 'i8'), ('data_nbytes', 'i8')])
+
+BINARY_DTYPES = {'binary64': np.float64, 'binary32': np.float32}
+
+NUM_GHOST = 2   # ghost cells written by valout in GeoClaw
+
+
+def frame_fname(frameno, outdir='_output', file_prefix='fort', kind='q'):
+    """Return the path of fort.tNNNN, fort.qNNNN, fort.bNNNN, ..."""
+    return os.path.join(outdir, '%s.%s%s' % (file_prefix, kind,
+                                             str(frameno).zfill(4)))
+
+
+def _header_value(line, data_type=float):
+    token = line.split()[0].decode() if isinstance(line, bytes) \
+            else line.split()[0]
+    if data_type is int:
+        return int(token)
+    return float(token.replace('D', 'E').replace('d', 'e'))
+
+
+def read_t(frameno, outdir='_output', file_prefix='fort'):
+    """
+    Read fort.tNNNN and return a dictionary with keys
+    t, num_eqn, num_patches, num_aux, num_dim, num_ghost, file_format.
+    file_format is one of 'ascii', 'binary64', 'binary32'.
+    """
+    fname = frame_fname(frameno, outdir, file_prefix, 't')
+    with open(fname) as f:
+        lines = [line for line in f.readlines() if line.strip()]
+
+    tinfo = {}
+    tinfo['t'] = _header_value(lines[0])
+    tinfo['num_eqn'] = _header_value(lines[1], int)
+    tinfo['num_patches'] = _header_value(lines[2], int)
+    tinfo['num_aux'] = _header_value(lines[3], int)
+    tinfo['num_dim'] = _header_value(lines[4], int)
+    tinfo['num_ghost'] = _header_value(lines[5], int)
+
+    if len(lines) > 6:
+        file_format = lines[6].split()[0]
+    elif os.path.isfile(frame_fname(frameno, outdir, file_prefix, 'b')):
+        file_format = 'binary64'   # older versions did not record format
+    else:
+        file_format = 'ascii'
+    if file_format == 'binary':
+        file_format = 'binary64'
+    tinfo['file_format'] = file_format
+    return tinfo
+
+
+def _read_header(f, num_dim):
+    """
+    Read the next patch header from fort.q file object f (opened 'rb').
+    Returns (offset of header, list of header values) or (None, None) at EOF.
+    """
+    nvals = 2 + 3*num_dim
+    vals = []
+    offset = None
+    while len(vals) < nvals:
+        pos = f.tell()
+        line = f.readline()
+        if not line:
+            if vals:
+                raise IOError('Incomplete patch header at byte %i of %s'
+                              % (pos, f.name))
+            return None, None
+        if line.strip():
+            if offset is None:
+                offset = pos
+            vals.append(line)
+    header = [_header_value(v, int) for v in vals[:2+num_dim]] \
+           + [_header_value(v) for v in vals[2+num_dim:]]
+    return offset, header
+
+
+def _skip_blank(f):
+    """Advance f past blank lines, returning the offset of the next line."""
+    while True:
+        pos = f.tell()
+        line = f.readline()
+        if not line or line.strip():
+            f.seek(pos)
+            return pos
+
+
+def _ascii_block(f, mx, my, num_dim, num_eqn):
+    """
+    Find the extent of the ascii data block starting at the current position
+    of f.  Valout writes fixed width lines with all components of one cell,
+    so the block length is normally computed from the first line and one
+    blank line and then verified; otherwise the values are counted.
+    Returns the number of bytes in the block and leaves f at its end.
+    """
+    start = f.tell()
+    first = f.readline()
+    L = len(first)
+    nbytes = -1
+    if len(first.split()) == num_eqn:
+        if num_dim == 1:
+            nbytes = mx*L
+            tail = L
+        else:
+            f.seek(start + mx*L)
+            blank = f.readline()
+            if not blank.strip():
+                nbytes = my*(mx*L + len(blank))
+                tail = L + len(blank)
+
+    if nbytes > 0:
+        # verify: the last data line must be a full line of the same length,
+        # followed by a blank line in 2d.
+        f.seek(start + nbytes - tail)
+        last = f.readline()
+        after = f.readline() if num_dim > 1 else b''
+        if len(last) == L and len(last.split()) == num_eqn \
+                and not after.strip():
+            f.seek(start + nbytes)
+            return nbytes
+
+    # fall back on counting values:
+    f.seek(start)
+    nvals = mx*my*num_eqn
+    count = 0
+    while count < nvals:
+        line = f.readline()
+        if not line:
+            raise IOError('Incomplete patch data at byte %i of %s'
+                          % (start, f.name))
+        count += len(line.split())
+    if num_dim > 1:
+        f.readline()   # blank line after last row
+    return f.tell() - start
+
+
+def scan_file(fname, tinfo, num_var, ascii):
+    """
+    Scan the patch headers (and for ascii files the data blocks) in fname,
+    which holds num_var values per cell.  Returns an array of PATCH_DTYPE.
+    """
+    num_dim = tinfo['num_dim']
+    if not ascii:
+        itemsize = np.dtype(BINARY_DTYPES[tinfo['file_format']]).itemsize
+        ng = tinfo['num_ghost']
+
+    records = np.zeros(tinfo['num_patches'], dtype=PATCH_DTYPE)
+    b_offset = 0
+    with open(fname, 'rb') as f:
+        for k in range(tinfo['num_patches']):
+            q_offset, header = _read_header(f, num_dim)
+            if header is None:
+                raise IOError('Found only %i of %i patches in %s'
+                              % (k, tinfo['num_patches'], fname))
+            r = records[k]
+            r['patch'], r['level'] = header[:2]
+            r['q_offset'] = q_offset
+            if num_dim == 1:
+                r['mx'], r['xlow'], r['dx'] = header[2:]
+                r['my'] = 1
+            else:
+                r['mx'], r['my'], r['xlow'], r['ylow'], r['dx'], r['dy'] \
+                        = header[2:]
+            r['xhigh'] = r['xlow'] + r['mx']*r['dx']
+            r['yhigh'] = r['ylow'] + r['my']*r['dy']
+
+            if ascii:
+                r['data_offset'] = _skip_blank(f)
+                r['data_nbytes'] = _ascii_block(f, r['mx'], r['my'],
+                                                 num_dim, num_var)
+            else:
+                ncells = (r['mx'] + 2*ng)
+                if num_dim > 1:
+                    ncells *= (r['my'] + 2*ng)
+                r['data_offset'] = b_offset
+                r['data_nbytes'] = num_var * ncells * itemsize
+                b_offset += r['data_nbytes']
+    return records
+
+
+def scan_patches(frameno, outdir='_output', file_prefix='fort'):
+    """
+    Scan fort.qNNNN and return (tinfo, records), where tinfo is the
+    dictionary returned by read_t and records is an array of dtype
+    PATCH_DTYPE with one entry per patch, in the order they appear.
+    """
+    tinfo = read_t(frameno, outdir, file_prefix)
+    qfname = frame_fname(frameno, outdir, file_prefix, 'q')
+    records = scan_file(qfname, tinfo, tinfo['num_eqn'],
+                        tinfo['file_format'] == 'ascii')
+    return tinfo, records
+
+
+def scan_aux(frameno, outdir='_output', file_prefix='fort'):
+    """
+    Like scan_patches, but for the aux arrays in fort.aNNNN.
+    Returns (tinfo, records) or (tinfo, None) if there is no aux file.
+    Binary aux files hold no headers, so in that case the offsets are
+    computed from the headers in fort.qNNNN.
+    """
+    tinfo = read_t(frameno, outdir, file_prefix)
+    afname = frame_fname(frameno, outdir, file_prefix, 'a')
+    if tinfo['num_aux'] == 0 or not os.path.isfile(afname):
+        return tinfo, None
+    ascii = (tinfo['file_format'] == 'ascii')
+    fname = afname if ascii else frame_fname(frameno, outdir, file_prefix, 'q')
+    records = scan_file(fname, tinfo, tinfo['num_aux'], ascii)
+    return tinfo, records
+
+
+def data_fname(frameno, tinfo, outdir='_output', file_prefix='fort',
+               aux=False):
+    """
+    The file holding the patch data: fort.qNNNN or fort.bNNNN,
+    or fort.aNNNN for aux arrays.
+    """
+    if aux:
+        kind = 'a'
+    else:
+        kind = 'q' if tinfo['file_format'] == 'ascii' else 'b'
+    return frame_fname(frameno, outdir, file_prefix, kind)
+
+
+def read_patch_data(f, record, tinfo, num_var=None):
+    """
+    Read the data for one patch from the open data file f (see data_fname),
+    touching only the bytes belonging to this patch.
+    Returns q with shape (num_eqn, mx, my), or (num_eqn, mx) if num_dim==1,
+    without ghost cells.  For aux arrays pass num_var=tinfo['num_aux'].
+    """
+    num_eqn = tinfo['num_eqn'] if num_var is None else num_var
+    num_dim = tinfo['num_dim']
+    mx = int(record['mx'])
+    my = int(record['my'])
+    f.seek(int(record['data_offset']))
+
+    if tinfo['file_format'] == 'ascii':
+        buf = f.read(int(record['data_nbytes']))
+        q = np.array(buf.split(), dtype=np.float64)
+        if num_dim == 1:
+            return q.reshape((mx, num_eqn)).T
+        return q.reshape((my, mx, num_eqn)).transpose(2, 1, 0)
+
+    dtype = BINARY_DTYPES[tinfo['file_format']]
+    ng = tinfo['num_ghost']
+    count = int(record['data_nbytes']) // np.dtype(dtype).itemsize
+    q = np.fromfile(f, dtype=dtype, count=count)
+    if num_dim == 1:
+        q = q.reshape((num_eqn, mx + 2*ng), order='F')
+        return q[:, ng:ng+mx]
+    q = q.reshape((num_eqn, mx + 2*ng, my + 2*ng), order='F')
+    return q[:, ng:ng+mx, ng:ng+my]
+
+
+def frame_records(frameno, outdir='_output', file_prefix='fort'):
+    """
+    Return (tinfo, records) for a frame, from its index file fort.iNNNN
+    (see patch_index.py) if that is present and up to date, and otherwise
+    by scanning fort.qNNNN.
+    """
+    import patch_index
+    tinfo, records = patch_index.read_index(frameno, outdir, file_prefix)
+    if tinfo is None:
+        tinfo, records = scan_patches(frameno, outdir, file_prefix)
+    return tinfo, records
+
+
+def select_levels(records, levels=None, max_level=None):
+    """
+    Subset of records on the AMR levels in the list levels (all levels if
+    None) and no finer than max_level (if not None).
+    """
+    keep = np.ones(len(records), dtype=bool)
+    if levels is not None:
+        keep &= np.isin(records['level'], list(levels))
+    if max_level is not None:
+        keep &= (records['level'] <= max_level)
+    return records[keep]
+
+
+def read_records(frameno, tinfo, records, outdir='_output',
+                 file_prefix='fort'):
+    """Read the data for the given patch records, in order."""
+    qlist = []
+    with open(data_fname(frameno, tinfo, outdir, file_prefix), 'rb') as f:
+        for record in records:
+            qlist.append(read_patch_data(f, record, tinfo))
+    return qlist
+
+
+def read_frame(frameno, outdir='_output', file_prefix='fort', levels=None,
+               max_level=None):
+    """
+    Read a frame, or only the patches on the given levels and/or up to
+    max_level.  The data of other levels are skipped without being read
+    (for ascii output only a few bytes of each skipped patch are touched).
+    Returns (tinfo, records, qlist) with qlist[k] the data for records[k].
+    """
+    tinfo, records = frame_records(frameno, outdir, file_prefix)
+    records = select_levels(records, levels, max_level)
+    qlist = read_records(frameno, tinfo, records, outdir, file_prefix)
+    return tinfo, records, qlist
+
+
+def make_solution(tinfo, records, qlist):
+    """
+    Build a clawpack.pyclaw Solution from patch records and data,
+    e.g. for plotting with visclaw.
+    """
+    from clawpack import pyclaw
+    num_dim = tinfo['num_dim']
+    names = ['x', 'y']
+    states = []
+    for r, q in zip(records, qlist):
+        lower = [r['xlow'], r['ylow']]
+        delta = [r['dx'], r['dy']]
+        n = [int(r['mx']), int(r['my'])]
+        dims = [pyclaw.Dimension(lower[i], lower[i] + n[i]*delta[i], n[i],
+                                 name=names[i]) for i in range(num_dim)]
+        patch = pyclaw.geometry.Patch(dims)
+        patch.patch_index = int(r['patch'])
+        patch.level = int(r['level'])
+        state = pyclaw.state.State(patch, q.shape[0], 0)
+        state.q = np.asarray(q, dtype=np.float64)
+        state.t = tinfo['t']
+        states.append(state)
+    solution = pyclaw.Solution(states,
+                               pyclaw.geometry.Domain([s.patch
+                                                       for s in states]))
+    solution.t = tinfo['t']
+    return solution
+
+
+def patch_centers(record):
+    """Return cell center arrays (x,y) for a patch record, as 2d arrays."""
+    x = record['xlow'] + (np.arange(record['mx']) + 0.5) * record['dx']
+    y = record['ylow'] + (np.arange(record['my']) + 0.5) * record['dy']
+    return np.meshgrid(x, y, indexing='ij')
+
+
+def write_t(fname, tinfo):
+    """Write a fort.tNNNN file in the format used by valout."""
+    with open(fname, 'w') as f:
+        f.write('%18.8e    time\n' % tinfo['t'])
+        f.write('%6i                 num_eqn\n' % tinfo['num_eqn'])
+        f.write('%6i                 nstates\n' % tinfo['num_patches'])
+        f.write('%6i                 num_aux\n' % tinfo['num_aux'])
+        f.write('%6i                 num_dim\n' % tinfo['num_dim'])
+        f.write('%6i                 num_ghost\n' % tinfo['num_ghost'])
+        f.write('%-10s            format\n' % tinfo['file_format'])
+
+
+def write_header(f, record, num_dim):
+    """Write the header for one patch to the fort.q file object f."""
+    f.write('%6i                 grid_number\n' % record['patch'])
+    f.write('%6i                 AMR_level\n' % record['level'])
+    f.write('%6i                 mx\n' % record['mx'])
+    if num_dim > 1:
+        f.write('%6i                 my\n' % record['my'])
+    f.write('%26.16e    xlow\n' % record['xlow'])
+    if num_dim > 1:
+        f.write('%26.16e    ylow\n' % record['ylow'])
+    f.write('%26.16e    dx\n' % record['dx'])
+    if num_dim > 1:
+        f.write('%26.16e    dy\n' % record['dy'])
+    f.write('\n')
+
+
+def binary_num_ghost(tinfo):
+    """
+    num_ghost to record when writing a frame in binary: that of the
+    original output, or NUM_GHOST if it recorded none (as pyclaw's ascii
+    writer does).  pyclaw's binary reader strips the ghost cells of aux
+    arrays with aux[:, mbc:-mbc, ...], so binary frames need some.
+    """
+    return tinfo['num_ghost'] or NUM_GHOST
+
+
+def write_binary_data(f, q, num_ghost=0, dtype=np.float64):
+    """
+    Write patch data q (without ghost cells) to the fort.b file object f,
+    padding with num_ghost layers of zeros to match the layout of valout.
+    Returns the number of bytes written.
+    """
+    if num_ghost > 0:
+        pad = [(0, 0)] + [(num_ghost, num_ghost)] * (q.ndim - 1)
+        q = np.pad(q, pad)
+    data = np.asarray(q, dtype=dtype).tobytes(order='F')
+    f.write(data)
+    return len(data)
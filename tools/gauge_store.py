@@ -0,0 +1,339 @@
+"""
+Columnar store of all the gauge time series of a run, for fast loading of
+gauges across many runs.
+
+GeoClaw writes one file gaugeNNNNN.txt (and gaugeNNNNN.bin for binary
+gauge output) per gauge, and every plot or comparison parses them again
+one by one.  This script packs all the gauges of an output directory into
+one file _output/gauges.store:
+
+  - a header and an npz index giving, for each gauge, its number,
+    location, type and the range of rows holding its time series,
+  - the columns t (float64), level (int32) and q[m] (float64), one
+    component after the other, each stored contiguously with the rows of
+    all gauges in order of gauge number.
+
+Columns are memory-mapped when the store is opened, so loading a gauge
+only touches its own rows:
+
+    python gauge_store.py _output_sphere0 _output_sphere2 ...
+
+    from gauge_store import GaugeStore, load_runs, stack_runs
+    store = GaugeStore('_output')
+    g = store.gauge(21401)                # g.t, g.level, g.q (num_eqn,nt)
+    gauges = load_runs(outdirs, [21401, 21413])
+    t, eta = stack_runs(outdirs, 21401, m=-1)   # array (len(outdirs),nt)
+
+load_runs and stack_runs (re)build the store of an outdir if it is missing
+or older than the gauge files.
+
+"""
+
+import os
+import io
+import glob
+import struct
+import numpy as np
+
+MAGIC = b'CLAWGST1'
+HEADER = struct.Struct('<8sQQ')     # magic, index offset, index length
+ALIGN = 64
+STORE_NAME = 'gauges.store'
+
+GTYPES = {'stationary': 0, 'lagrangian': 1}
+
+# One entry per gauge:
+GAUGE_DTYPE = np.dtype([('gaugeno', 'i8'), ('gtype', 'i1'),
+                        ('x', 'f8'), ('y', 'f8'),
+                        ('start', 'i8'), ('nt', 'i8')])
+
+
+def store_fname(outdir='_output'):
+    return os.path.join(outdir, STORE_NAME)
+
+
+def gauge_fnames(outdir='_output'):
+    """Dictionary gaugeno -> gaugeNNNNN.txt for the gauges in outdir."""
+    fnames = {}
+    for fname in glob.glob(os.path.join(outdir, 'gauge*.txt')):
+        digits = os.path.basename(fname)[5:-4]
+        if digits.isdigit():
+            fnames[int(digits)] = fname
+    return dict(sorted(fnames.items()))
+
+
+def read_gauge_file(fname):
+    """
+    Read one gauge in the format of clawpack.pyclaw.gauges.GaugeSolution.
+    Returns (header, data), with header a dictionary (gaugeno, location,
+    gtype, num_eqn) and data an array of shape (nt, 2+num_eqn) with rows
+    level, t, q[0:num_eqn].
+    """
+    with open(fname, 'r') as f:
+        words = f.readline().split()
+        num_eqn = int(words[-1])
+        location = tuple(float(w) for w in words[4:-3])
+        comments = []
+        line = f.readline()
+        while line.startswith('#'):
+            comments.append(line.lower())
+            line = f.readline()
+        text = line + f.read()
+
+    gtype = 'lagrangian' if any('lagrangian' in c for c in comments) \
+            else 'stationary'
+    file_format = 'ascii'
+    if any('binary32' in c for c in comments):
+        file_format = 'binary32'
+    elif any('binary' in c for c in comments) or len(text.strip()) == 0:
+        file_format = 'binary64'
+
+    header = {'gaugeno': int(words[2]), 'location': location,
+              'gtype': gtype, 'num_eqn': num_eqn}
+    ncols = 2 + num_eqn
+    if file_format == 'ascii':
+        values = np.array(text.split(), dtype=np.float64)
+        return header, values.reshape((-1, ncols))
+
+    bin_fname = fname[:-4] + '.bin'
+    dtype = np.float32 if file_format == 'binary32' else np.float64
+    values = np.fromfile(bin_fname, dtype=dtype)
+    if len(values) % ncols != 0:
+        raise IOError('Unexpected number of values in %s' % bin_fname)
+    return header, values.reshape((ncols, -1), order='F').T
+
+
+def _source_stamp(fnames):
+    """Latest mtime of the gauge files, to detect a stale store."""
+    paths = list(fnames)
+    paths += [f[:-4] + '.bin' for f in fnames if os.path.isfile(f[:-4]+'.bin')]
+    return max([os.path.getmtime(p) for p in paths] + [0.])
+
+
+def _pad(f):
+    f.write(b'\0' * (-f.tell() % ALIGN))
+
+
+def write_store(outdir='_output', fname=None, verbose=True):
+    """Pack all gauges of outdir into one columnar file (default
+    outdir/gauges.store).  Returns the number of gauges stored."""
+    fname = store_fname(outdir) if fname is None else fname
+    fnames = gauge_fnames(outdir)
+    gauges = [read_gauge_file(gfile) for gfile in fnames.values()]
+    num_eqn = gauges[0][0]['num_eqn'] if gauges else 0
+
+    records = np.zeros(len(gauges), dtype=GAUGE_DTYPE)
+    start = 0
+    for record, (header, data) in zip(records, gauges):
+        if header['num_eqn'] != num_eqn:
+            raise ValueError('Gauge %i has num_eqn = %i, expected %i'
+                             % (header['gaugeno'], header['num_eqn'], num_eqn))
+        location = header['location'] + (0.,)
+        record['gaugeno'] = header['gaugeno']
+        record['gtype'] = GTYPES[header['gtype']]
+        record['x'], record['y'] = location[0], location[1]
+        record['start'] = start
+        record['nt'] = len(data)
+        start += len(data)
+    nrows = start
+
+    columns = {}
+    tmp = fname + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, 0, 0))
+        for name in ['t', 'level'] + ['q%i' % m for m in range(num_eqn)]:
+            if name in ['t', 'level', 'q0']:
+                _pad(f)     # the q components are contiguous, no padding
+            columns[name] = f.tell()
+            if name == 't':
+                col, dtype = 1, np.float64
+            elif name == 'level':
+                col, dtype = 0, np.int32
+            else:
+                col, dtype = 2 + int(name[1:]), np.float64
+            for header, data in gauges:
+                f.write(np.ascontiguousarray(data[:, col], dtype=dtype))
+
+        index = io.BytesIO()
+        np.savez(index, gauges=records, num_eqn=num_eqn, nrows=nrows,
+                 column_names=np.array(list(columns)),
+                 column_offsets=np.array(list(columns.values()),
+                                         dtype=np.int64),
+                 stamp=_source_stamp(fnames.values()))
+        offset = f.tell()
+        f.write(index.getvalue())
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, offset, len(index.getvalue())))
+    os.replace(tmp, fname)
+
+    if verbose:
+        print('Created %s: %i gauges, %i rows' % (fname, len(records), nrows))
+    return len(records)
+
+
+class GaugeData(object):
+
+    """
+    Time series of one gauge, with the attributes of
+    clawpack.pyclaw.gauges.GaugeSolution: id, location, gtype, level, t,
+    q (shape (num_eqn, nt)).  Arrays are views of the memory-mapped store.
+    """
+
+    def __init__(self, record, t, level, q):
+        self.id = int(record['gaugeno'])
+        self.location = (float(record['x']), float(record['y']))
+        self.gtype = [k for k, v in GTYPES.items() if v == record['gtype']][0]
+        self.t = t
+        self.level = level
+        self.q = q
+
+    def __repr__(self):
+        return 'GaugeData(%i, nt = %i)' % (self.id, len(self.t))
+
+
+class GaugeStore(object):
+
+    """
+    Memory-mapped reader for a file written by write_store.  The argument
+    is the store file or the outdir containing gauges.store.
+
+    Attributes:
+        gauges     array of GAUGE_DTYPE, one entry per gauge
+        gaugenos   list of gauge numbers
+        t, level   columns for all rows (memory-mapped)
+        q          array of shape (num_eqn, nrows) (memory-mapped)
+    """
+
+    def __init__(self, fname):
+        if os.path.isdir(fname):
+            fname = store_fname(fname)
+        self.fname = fname
+        with open(fname, 'rb') as f:
+            magic, offset, nbytes = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or offset == 0:
+                raise IOError('%s is not a gauge store' % fname)
+            f.seek(offset)
+            index = np.load(io.BytesIO(f.read(nbytes)))
+            self.gauges = index['gauges']
+            self.num_eqn = int(index['num_eqn'])
+            self.nrows = int(index['nrows'])
+            self.stamp = float(index['stamp'])
+            columns = dict(zip(index['column_names'].tolist(),
+                               index['column_offsets'].tolist()))
+        self._rows = dict(zip(self.gauges['gaugeno'].tolist(),
+                              range(len(self.gauges))))
+
+        def column(name, dtype, shape):
+            if self.nrows == 0:
+                return np.empty(shape, dtype=dtype)
+            return np.memmap(fname, dtype=dtype, mode='r',
+                             offset=columns[name], shape=shape)
+
+        self.t = column('t', np.float64, (self.nrows,))
+        self.level = column('level', np.int32, (self.nrows,))
+        # q components are stored one after the other, so q is one array:
+        if self.num_eqn > 0:
+            self.q = column('q0', np.float64, (self.num_eqn, self.nrows))
+        else:
+            self.q = np.empty((0, self.nrows))
+
+    @property
+    def gaugenos(self):
+        return self.gauges['gaugeno'].tolist()
+
+    def _slice(self, gaugeno):
+        try:
+            record = self.gauges[self._rows[gaugeno]]
+        except KeyError:
+            raise KeyError('Gauge %i is not in %s' % (gaugeno, self.fname))
+        return record, slice(record['start'], record['start'] + record['nt'])
+
+    def gauge(self, gaugeno):
+        """GaugeData for one gauge."""
+        record, rows = self._slice(gaugeno)
+        return GaugeData(record, self.t[rows], self.level[rows],
+                         self.q[:, rows])
+
+    def read(self, gaugenos=None):
+        """Dictionary gaugeno -> GaugeData for gaugenos (default all)."""
+        if gaugenos is None:
+            gaugenos = self.gaugenos
+        return dict((gaugeno, self.gauge(gaugeno)) for gaugeno in gaugenos)
+
+    def interp(self, gaugeno, times, m=-1):
+        """Component m (default eta, the last) of one gauge at times."""
+        record, rows = self._slice(gaugeno)
+        return np.interp(times, self.t[rows], self.q[m, rows],
+                         left=np.nan, right=np.nan)
+
+
+def open_store(outdir='_output', rebuild=False):
+    """
+    GaugeStore for outdir, writing or rewriting gauges.store first if it is
+    missing or older than the gauge files.
+    """
+    fname = store_fname(outdir)
+    if not rebuild and os.path.isfile(fname):
+        store = GaugeStore(fname)
+        if store.stamp >= _source_stamp(gauge_fnames(outdir).values()):
+            return store
+    write_store(outdir, verbose=False)
+    return GaugeStore(fname)
+
+
+def load_runs(outdirs, gaugenos=None):
+    """
+    Load gauges from several runs.  Returns a dictionary
+    outdir -> {gaugeno: GaugeData}.
+    """
+    return dict((outdir, open_store(outdir).read(gaugenos))
+                for outdir in outdirs)
+
+
+def stack_runs(outdirs, gaugeno, m=-1, times=None):
+    """
+    Component m of one gauge in several runs, interpolated to common times
+    (default: the output times of the gauge in the first run).  Returns
+    (times, values) with values of shape (len(outdirs), len(times)), NaN
+    outside the time range of a run.
+    """
+    stores = [open_store(outdir) for outdir in outdirs]
+    if times is None:
+        times = np.array(stores[0].gauge(gaugeno).t)
+    values = np.empty((len(stores), len(times)))
+    for k, store in enumerate(stores):
+        values[k, :] = store.interp(gaugeno, times, m)
+    return times, values
+
+
+def rms_difference(outdir, ref_outdir, gaugenos=None, m=-1):
+    """
+    RMS difference of component m (default eta) between the gauges of
+    outdir and those of a reference run, at the reference output times
+    within the time range of both.  Returns a dictionary gaugeno -> RMS
+    difference, for the gauges in both runs (or those in gaugenos).
+    """
+    store = open_store(outdir)
+    ref = open_store(ref_outdir)
+    if gaugenos is None:
+        gaugenos = [gaugeno for gaugeno in ref.gaugenos
+                    if gaugeno in store.gaugenos]
+    rms = {}
+    for gaugeno in gaugenos:
+        times = np.array(ref.gauge(gaugeno).t)
+        diff = store.interp(gaugeno, times, m) - ref.interp(gaugeno, times, m)
+        diff = diff[~np.isnan(diff)]
+        rms[gaugeno] = np.sqrt(np.mean(diff**2)) if len(diff) else np.nan
+    return rms
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Pack the gauge files of output directories into '
+                    'columnar gauges.store files')
+    parser.add_argument('outdirs', nargs='+')
+    args = parser.parse_args()
+
+    for outdir in args.outdirs:
+        write_store(outdir)
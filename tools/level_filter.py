@@ -0,0 +1,154 @@
+"""
+Level-filtered frame loading for plotting with visclaw.
+
+Many plots use only some AMR levels, e.g. a 2d_contour item with
+amr_contour_show = [1,0,0] draws level 1 only, but visclaw always reads
+every patch of the frame.  After calling
+
+    level_filter.install(plotdata)
+
+at the end of setplot, frames are read through frameio with only the
+levels needed by the figures that will actually be plotted.  The levels
+needed by each plotitem are taken from
+
+  - plotitem.amr_levels, if declared with declare_levels(plotitem, levels),
+  - otherwise from amr_data_show, and for contour items amr_contour_show
+    (with the visclaw convention that the last entry applies to all finer
+    levels),
+
+and the loader reads the union of these over the items shown for each
+outdir.  Items that show every level (the default) make the whole frame
+be read, as before.
+
+declare_levels only limits what is read: visclaw plots every level that
+was read, including levels needed by other figures, so an item meant to
+plot fewer levels than the frame holds (e.g. level 1 in a
+1d_from_2d_data item) should set amr_data_show, which fixes both.
+
+The same filtering is available directly, e.g. for fgmax-style checks on
+the finest level only:
+
+    tinfo, records, qlist = frameio.read_frame(frameno, outdir, levels=[8])
+    framesoln = level_filter.read_solution(frameno, outdir, max_level=2)
+
+"""
+
+import os
+
+import frameio
+
+
+def declare_levels(plotitem, levels):
+    """Declare the AMR levels (a list) plotitem needs from each frame."""
+    plotitem.add_attribute('amr_levels', list(levels))
+
+
+def shown_levels(amr_show, present_levels):
+    """
+    Levels among present_levels for which the visclaw amr_*_show list
+    amr_show is true (an empty list means all levels).
+    """
+    if amr_show is None or len(amr_show) == 0:
+        return set(present_levels)
+    return set(level for level in present_levels
+               if amr_show[min(len(amr_show), level) - 1])
+
+
+def item_levels(plotitem, present_levels):
+    """Levels among present_levels needed by one plotitem."""
+    levels = getattr(plotitem, 'amr_levels', None)
+    if levels is not None:
+        return set(levels) & set(present_levels)
+    needed = shown_levels(getattr(plotitem, 'amr_data_show', []),
+                          present_levels)
+    if plotitem.plot_type == '2d_contour':
+        needed &= shown_levels(getattr(plotitem, 'amr_contour_show', []),
+                               present_levels)
+    return needed
+
+
+def needed_levels(plotdata, outdir, present_levels):
+    """
+    Union of the levels needed by the plotitems that will be plotted from
+    outdir, following the choice of figures made by visclaw's plot_frame.
+    """
+    if plotdata.mode() == 'iplotclaw':
+        requested_fignos = plotdata.iplotclaw_fignos
+    else:
+        requested_fignos = plotdata.print_fignos
+
+    outdir = os.path.abspath(outdir)
+    levels = set()
+    for figname in plotdata._fignames:
+        plotfigure = plotdata.plotfigure_dict[figname]
+        if (not plotfigure.show) or (plotfigure.type != 'each_frame'):
+            continue
+        if (requested_fignos != 'all') and \
+                (plotfigure.figno not in requested_fignos):
+            continue
+        for axesname in plotfigure._axesnames:
+            plotaxes = plotfigure.plotaxes_dict[axesname]
+            if not plotaxes.show:
+                continue
+            for itemname in plotaxes._itemnames:
+                plotitem = plotaxes.plotitem_dict[itemname]
+                item_outdir = plotitem.outdir or plotdata.outdir
+                if (not plotitem.show) or \
+                        os.path.abspath(item_outdir) != outdir:
+                    continue
+                levels |= item_levels(plotitem, present_levels)
+    return sorted(levels)
+
+
+def read_solution(frameno, outdir='_output', levels=None, max_level=None,
+                  file_prefix='fort'):
+    """Read a frame as a pyclaw Solution, keeping only the given levels."""
+    tinfo, records, qlist = frameio.read_frame(frameno, outdir, file_prefix,
+                                               levels, max_level)
+    return frameio.make_solution(tinfo, records, qlist)
+
+
+def install(plotdata):
+    """
+    Make plotdata.getframe read only the levels needed by the current
+    figures.  Call this at the end of setplot, after all plotitems are set.
+    """
+
+    def reader(frameno, outdir):
+        tinfo, records = frameio.frame_records(frameno, outdir,
+                                               plotdata.file_prefix)
+        present = sorted(set(records['level'].tolist()))
+        levels = needed_levels(plotdata, outdir, present)
+        if len(levels) == 0:
+            levels = present    # e.g. only gauge plots requested
+        records = frameio.select_levels(records, levels)
+        qlist = frameio.read_records(frameno, tinfo, records, outdir,
+                                     plotdata.file_prefix)
+        framesoln = frameio.make_solution(tinfo, records, qlist)
+        if levels != present:
+            framesoln.levels_read = levels
+        return framesoln
+
+    def getframe(frameno, outdir=None, refresh=False):
+        if outdir is None:
+            outdir = plotdata.outdir
+        outdir = os.path.abspath(outdir)
+        key = (frameno, outdir)
+        framesoln_dict = plotdata.framesoln_dict
+        if refresh or (key not in framesoln_dict):
+            framesoln = reader(frameno, outdir)
+            if not plotdata.save_frames:
+                framesoln_dict.clear()
+            framesoln_dict[key] = framesoln
+            print('    Reading  Frame %s at t = %g  from outdir = %s'
+                  % (frameno, framesoln.t, outdir))
+            if hasattr(framesoln, 'levels_read'):
+                print('    (levels %s only)' % framesoln.levels_read)
+        return framesoln_dict[key]
+
+    # used by prefetch.py to read frames without touching framesoln_dict:
+    getframe.reader = reader
+
+    # ClawPlotData only accepts declared attributes, so bypass its check:
+    object.__setattr__(plotdata, 'getframe', getframe)
+    return plotdata
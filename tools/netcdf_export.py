@@ -0,0 +1,224 @@
+"""
+Export GeoClaw frames to a CF-style NetCDF file on a uniform lon/lat grid.
+
+Each frame is regridded onto the points of the requested grid using, at
+every point, the finest AMR level available there: patches are processed
+level by level, coarse to fine, and each patch fills all grid points that
+lie in it at once.  The variables written are
+
+    eta (surface), h (depth), u, v (velocities), all but h missing
+    where dry (h <= dry_tolerance; eta would be the land elevation)
+
+as float32 arrays (time, lat, lon), with time a record (unlimited)
+dimension.  The file is created with scipy.io.netcdf_file and each later
+frame is appended as one more record, so a whole run is exported in one
+pass holding only one frame and one regridded field in memory:
+
+    python netcdf_export.py _output_sphere tohoku.nc --bbox 140 210 20 60 \\
+                            --dx 0.1 --t0 '2011-03-11 05:46:24'
+
+Without --bbox the domain covered by the level 1 patches of the first
+frame is used.  --dx defaults to the level 1 resolution, and --dy to --dx
+if that is given, otherwise to the level 1 resolution.
+
+"""
+
+import os
+import numpy as np
+from scipy.io import netcdf_file
+
+import frameio
+import patch_index
+
+FILL_VALUE = np.float32(-9999.)
+
+VARIABLES = [('eta', 'sea surface height above geoid', 'm'),
+             ('h', 'water depth', 'm'),
+             ('u', 'eastward water velocity', 'm s-1'),
+             ('v', 'northward water velocity', 'm s-1')]
+
+
+def uniform_grid(x1, x2, y1, y2, dx, dy=None):
+    """Points of a uniform grid covering [x1,x2] x [y1,y2]."""
+    dy = dx if dy is None else dy
+    nx = int(round((x2 - x1) / dx)) + 1
+    ny = int(round((y2 - y1) / dy)) + 1
+    return x1 + dx*np.arange(nx), y1 + dy*np.arange(ny)
+
+
+def regrid(records, qlist, lon, lat, dry_tolerance=1e-3):
+    """
+    Values of eta, h, u, v at the points lon (nx,) x lat (ny,) from the
+    patches (records and data arrays as returned by frameio.read_frame).
+    Returns a dictionary of float32 arrays of shape (ny,nx), FILL_VALUE
+    outside all patches and, except for h, where h <= dry_tolerance.
+    """
+    fields = dict((name, np.full((len(lat), len(lon)), FILL_VALUE,
+                                 dtype=np.float32))
+                  for name, long_name, units in VARIABLES)
+    # coarse to fine, so finer levels overwrite coarser ones:
+    for k in np.argsort(records['level'], kind='stable'):
+        record, q = records[k], qlist[k]
+        i1, i2 = np.searchsorted(lon, [record['xlow'], record['xhigh']])
+        j1, j2 = np.searchsorted(lat, [record['ylow'], record['yhigh']])
+        if i1 == i2 or j1 == j2:
+            continue
+        i = ((lon[i1:i2] - record['xlow']) / record['dx']).astype(int)
+        j = ((lat[j1:j2] - record['ylow']) / record['dy']).astype(int)
+        i = np.minimum(i, record['mx'] - 1)
+        j = np.minimum(j, record['my'] - 1)
+        cells = np.ix_(i, j)
+        h = q[0][cells].T
+        wet = h > dry_tolerance
+        hsafe = np.where(wet, h, 1.)
+        fields['h'][j1:j2, i1:i2] = h
+        fields['eta'][j1:j2, i1:i2] = np.where(wet, q[-1][cells].T,
+                                               FILL_VALUE)
+        fields['u'][j1:j2, i1:i2] = np.where(wet, q[1][cells].T/hsafe,
+                                             FILL_VALUE)
+        fields['v'][j1:j2, i1:i2] = np.where(wet, q[2][cells].T/hsafe,
+                                             FILL_VALUE)
+    return fields
+
+
+class NetCDFWriter(object):
+
+    """
+    Write a time-stacked NetCDF file one frame at a time.  The first
+    append() writes the header, the lon/lat coordinates and the first
+    record with scipy.io.netcdf_file; later ones write each record at the
+    end of the file and update the record count in the header.
+    """
+
+    def __init__(self, fname, lon, lat, t0=None, history=''):
+        self.fname = fname
+        self.lon = lon
+        self.lat = lat
+        self.t0 = t0
+        self.history = history
+        self.numrecs = 0
+        self.record_vars = None
+
+    def _create(self, t, fields):
+        with netcdf_file(self.fname, 'w', version=2) as nc:
+            nc.Conventions = 'CF-1.6'
+            nc.title = 'GeoClaw results regridded to a uniform grid'
+            nc.history = self.history
+            nc.createDimension('time', None)
+            nc.createDimension('lat', len(self.lat))
+            nc.createDimension('lon', len(self.lon))
+            var = nc.createVariable('lat', 'd', ('lat',))
+            var[:] = self.lat
+            var.standard_name = 'latitude'
+            var.units = 'degrees_north'
+            var = nc.createVariable('lon', 'd', ('lon',))
+            var[:] = self.lon
+            var.standard_name = 'longitude'
+            var.units = 'degrees_east'
+            var = nc.createVariable('time', 'd', ('time',))
+            var[0] = t
+            var.standard_name = 'time'
+            if self.t0 is not None:
+                var.units = 'seconds since %s' % self.t0
+            else:
+                var.units = 'seconds'
+                var.long_name = 'time since start of simulation'
+            for name, long_name, units in VARIABLES:
+                var = nc.createVariable(name, 'f', ('time', 'lat', 'lon'))
+                var[0] = fields[name]
+                var.long_name = long_name
+                var.units = units
+                var._FillValue = FILL_VALUE
+
+        # the record variables, in the order of their data in each record:
+        with netcdf_file(self.fname, 'r', mmap=False) as nc:
+            self.record_vars = [name for name, var in nc.variables.items()
+                                if var.isrec]
+
+    def append(self, t, fields):
+        """Append one record: time t and the arrays in dictionary fields."""
+        if self.numrecs == 0:
+            self._create(t, fields)
+            self.numrecs = 1
+            return
+        with open(self.fname, 'r+b') as f:
+            f.seek(0, os.SEEK_END)
+            for name in self.record_vars:
+                if name == 'time':
+                    f.write(np.array(t, dtype='>f8').tobytes())
+                else:
+                    f.write(np.asarray(fields[name], dtype='>f4').tobytes())
+            self.numrecs += 1
+            f.seek(4)
+            f.write(np.array(self.numrecs, dtype='>i4').tobytes())
+
+
+def default_grid(outdir, frameno, file_prefix='fort'):
+    """Bounding box and dx, dy of the level 1 patches of a frame."""
+    tinfo, records = frameio.frame_records(frameno, outdir, file_prefix)
+    level1 = frameio.select_levels(records, [1])
+    return (level1['xlow'].min(), level1['xhigh'].max(),
+            level1['ylow'].min(), level1['yhigh'].max(),
+            level1['dx'][0], level1['dy'][0])
+
+
+def export(outdir, fname, bbox=None, dx=None, dy=None, framenos='all',
+           max_level=None, t0=None, file_prefix='fort', verbose=True):
+    """
+    Regrid frames of outdir (default all) to a uniform grid and write them
+    to NetCDF file fname.  bbox = [x1,x2,y1,y2]; points are spaced dx, dy,
+    by default the level 1 dx and dy (dy = dx if only dx is given).
+    """
+    if framenos == 'all':
+        framenos = patch_index.frame_numbers(outdir, file_prefix)
+    x1, x2, y1, y2, dx1, dy1 = default_grid(outdir, framenos[0], file_prefix)
+    if bbox is not None:
+        x1, x2, y1, y2 = bbox
+    else:
+        # cell centers of the level 1 grid:
+        x1, x2, y1, y2 = x1 + dx1/2, x2 - dx1/2, y1 + dy1/2, y2 - dy1/2
+    if dy is None:
+        dy = dy1 if dx is None else dx
+    if dx is None:
+        dx = dx1
+    lon, lat = uniform_grid(x1, x2, y1, y2, dx, dy)
+
+    writer = NetCDFWriter(fname, lon, lat, t0,
+                          history='netcdf_export.py %s' % outdir)
+    for frameno in framenos:
+        tinfo, records = frameio.frame_records(frameno, outdir, file_prefix)
+        records = frameio.select_levels(records, max_level=max_level)
+        # only the patches that overlap the grid are read:
+        overlap = (records['xhigh'] >= lon[0]) & (records['xlow'] <= lon[-1]) \
+                  & (records['yhigh'] >= lat[0]) & (records['ylow'] <= lat[-1])
+        records = records[overlap]
+        qlist = frameio.read_records(frameno, tinfo, records, outdir,
+                                     file_prefix)
+        writer.append(tinfo['t'], regrid(records, qlist, lon, lat))
+        if verbose:
+            print('Exported frame %i at t = %g' % (frameno, tinfo['t']))
+    if verbose:
+        print('Created %s: %i times on a %i x %i grid'
+              % (fname, writer.numrecs, len(lon), len(lat)))
+    return fname
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Export GeoClaw frames to NetCDF on a uniform grid')
+    parser.add_argument('outdir')
+    parser.add_argument('fname')
+    parser.add_argument('--bbox', type=float, nargs=4, default=None,
+                        metavar=('X1', 'X2', 'Y1', 'Y2'))
+    parser.add_argument('--dx', type=float, default=None)
+    parser.add_argument('--dy', type=float, default=None)
+    parser.add_argument('--frames', type=int, nargs='+', default=None)
+    parser.add_argument('--max-level', type=int, default=None)
+    parser.add_argument('--t0', default=None,
+                        help="reference time for CF units, e.g. "
+                             "'2011-03-11 05:46:24'")
+    args = parser.parse_args()
+
+    export(args.outdir, args.fname, args.bbox, args.dx, args.dy,
+           args.frames or 'all', args.max_level, args.t0)
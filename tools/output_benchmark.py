@@ -0,0 +1,154 @@
+"""
+Cost of writing output frames, for each output format, aux and q
+component selection and output cadence.
+
+A case is run for a short time span (the first --fraction of tfinal) once
+per variant, one run at a time with --nthreads threads, as single sweeps
+in --sweepdir, built with OpenMP (as in scaling.py) unless --exe is
+given.  The variants are all combinations of
+
+    --formats           output_format: ascii, binary32, binary64
+    --aux               none:  output_aux_components = 'none'
+                        once:  all aux arrays, only at t0
+                        every: all aux arrays in every frame
+    --q-components      output_q_components, as JSON ('all' or a list of
+                        booleans)
+    --num-output-times  frames written in the time span
+
+and for each the time spent in valout (the "Output (valout)" line of
+timing.txt, see amr_telemetry.py) is reported separately from stepgrid,
+with the bytes of fort.q/b/a/t files written, seconds and bytes per frame
+and the share of the integration time spent on output:
+
+    python ../../tools/output_benchmark.py . --nthreads 8 --fraction 0.1 \\
+        --num-output-times 5 20
+
+The 1d codes do not write timing.txt, so only bytes and wall time are
+reported for them.
+
+"""
+
+import os
+import re
+import json
+import itertools
+import numpy as np
+
+import sweep
+import scaling
+import runtools
+import patch_index
+import amr_telemetry
+
+FORMATS = ['ascii', 'binary32', 'binary64']
+
+AUX = {'none': {'clawdata.output_aux_components': 'none'},
+       'once': {'clawdata.output_aux_components': 'all',
+                'clawdata.output_aux_onlyonce': True},
+       'every': {'clawdata.output_aux_components': 'all',
+                 'clawdata.output_aux_onlyonce': False}}
+
+_FRAME_FILE = re.compile(r'^fort\.[qtab]\d+$')
+
+
+def frame_bytes(outdir):
+    """Bytes of the frame files (fort.q, fort.b, fort.a, fort.t) in outdir."""
+    return sum(os.path.getsize(os.path.join(outdir, fname))
+               for fname in os.listdir(outdir) if _FRAME_FILE.match(fname))
+
+
+def variants(formats=FORMATS, aux=('none', 'once', 'every'),
+             q_components=('all',), num_output_times=(5,)):
+    """List of (label, params) for all combinations."""
+    result = []
+    for fmt, aux_name, q, nout in itertools.product(formats, aux,
+                                                    q_components,
+                                                    num_output_times):
+        params = {'clawdata.output_format': fmt,
+                  'clawdata.output_q_components': q,
+                  'clawdata.num_output_times': nout}
+        params.update(AUX[aux_name])
+        label = '%s, aux %s, q %s, %i frames' % (fmt, aux_name,
+                                                 json.dumps(q), nout)
+        result.append((label, params))
+    return result
+
+
+def measure(entry):
+    """Output cost of a completed sweep entry."""
+    outdir = entry['outdir']
+    tel = amr_telemetry.AMRTelemetry(outdir)
+    timing = tel.timing or {'parts': {}, 'total_time': None}
+    nframes = len(patch_index.frame_numbers(outdir))
+    total = timing['total_time'] or entry['elapsed']
+    output = timing['parts'].get('output', np.nan)
+    nbytes = frame_bytes(outdir)
+    return {'nframes': nframes, 'bytes': nbytes,
+            'bytes_per_frame': nbytes / max(nframes, 1),
+            'time': total, 'output_time': output,
+            'stepgrid_time': timing['parts'].get('stepgrid', np.nan),
+            'seconds_per_frame': output / max(nframes, 1),
+            'output_share': output / total if total else np.nan,
+            'solver_threads': tel.nthreads}
+
+
+def benchmark_output(casedir, variant_list, nthreads=None, fraction=0.1,
+                     sweepdir='_output_benchmark', exe=None):
+    """Run each variant; returns a list of (label, params, measurements)."""
+    casedir = os.path.abspath(casedir)
+    nthreads = nthreads or os.cpu_count()
+    if exe is None:
+        exe = runtools.build(casedir, scaling.openmp_fflags())
+    results = []
+    for label, params in variant_list:
+        grid = dict((path, [value]) for path, value in params.items())
+        s = sweep.Sweep(casedir, sweepdir, grid, fraction=fraction)
+        if s.run(exe, nthreads, nthreads):
+            print('*** %s failed, see run.log in %s'
+                  % (label, s.entry(params)['outdir']))
+            continue
+        m = measure(s.entry(params))
+        scaling.check_threads(m['solver_threads'], nthreads)
+        results.append((label, params, m))
+    return results
+
+
+def format_table(results):
+    lines = ['%-40s %6s %10s %10s %9s %10s %11s %7s'
+             % ('variant', 'frames', 'MB', 'MB/frame', 'time (s)',
+                'output (s)', 's/frame', 'share')]
+    for label, params, m in results:
+        lines.append('%-40s %6i %10.2f %10.3f %9.2f %10.3f %11.4f %6.1f%%'
+                     % (label, m['nframes'], m['bytes'] / 2**20,
+                        m['bytes_per_frame'] / 2**20, m['time'],
+                        m['output_time'], m['seconds_per_frame'],
+                        100 * m['output_share']))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Time the output phase for output formats and cadences')
+    parser.add_argument('casedir', nargs='?', default='.')
+    parser.add_argument('--formats', nargs='+', default=FORMATS,
+                        choices=FORMATS)
+    parser.add_argument('--aux', nargs='+', default=['none', 'once', 'every'],
+                        choices=sorted(AUX))
+    parser.add_argument('--q-components', nargs='+', default=['"all"'],
+                        help='output_q_components values as JSON')
+    parser.add_argument('--num-output-times', type=int, nargs='+',
+                        default=[5])
+    parser.add_argument('--nthreads', type=int, default=None)
+    parser.add_argument('--fraction', type=float, default=0.1,
+                        help='fraction of tfinal to run (default 0.1)')
+    parser.add_argument('--sweepdir', default='_output_benchmark')
+    parser.add_argument('--exe', default=None)
+    args = parser.parse_args()
+
+    variant_list = variants(args.formats, args.aux,
+                            [json.loads(q) for q in args.q_components],
+                            args.num_output_times)
+    results = benchmark_output(args.casedir, variant_list, args.nthreads,
+                               args.fraction, args.sweepdir, args.exe)
+    print(format_table(results))
@@ -0,0 +1,372 @@
+"""
+Patch index sidecar files for random access into GeoClaw frames.
+
+To find one patch in fort.qNNNN / fort.bNNNN a reader normally has to parse
+every patch header (and for ascii output every data line) that comes before
+it.  This module writes an index file fort.iNNNN next to each frame,
+recording for every patch its number, level, extent, dx, dy and the byte
+offsets of its header in fort.qNNNN and of its data in fort.qNNNN (ascii)
+or fort.bNNNN (binary).  It also records the size and modification time
+of these files, and is ignored once they change (e.g. a rerun into the
+same output directory).
+
+The index is used through the class PatchIndex, e.g.
+
+    from patch_index import PatchIndex
+    pindex = PatchIndex(5, outdir='_output')
+    recs = pindex.query_bbox(-156, -154, 19, 21, level=4)
+    qlist = pindex.read(recs)            # reads only the bytes needed
+    eta = pindex.sample(xtrans, ytrans, m=-1)   # finest level values
+
+Spatial queries use a small packed R-tree per AMR level, built when the
+index is loaded.
+
+Indices for all frames can be written with
+
+    python patch_index.py _output
+
+To write them during a run, start the same command with --watch alongside
+the solver, e.g.
+
+    make .output & python $TOOLS/patch_index.py _output --watch
+
+which indexes each frame as soon as its fort.tNNNN file appears, and stops
+once frame --last-frame is indexed or no new frame has appeared for
+--timeout seconds.
+
+"""
+
+import os
+import glob
+import time
+import numpy as np
+
+import frameio
+
+NODE_SIZE = 16    # number of patches per leaf of the R-tree
+
+
+def index_fname(frameno, outdir='_output', file_prefix='fort'):
+    return frameio.frame_fname(frameno, outdir, file_prefix, 'i')
+
+
+def _source_stamps(frameno, tinfo, outdir, file_prefix):
+    """
+    Size and modification time (ns) of fort.qNNNN and fort.bNNNN (zeros
+    for ascii output), to detect a frame rewritten since it was indexed.
+    """
+    stamps = []
+    for kind in ['q', 'b']:
+        if kind == 'b' and tinfo['file_format'] == 'ascii':
+            stamps += [0, 0]
+        else:
+            stat = os.stat(frameio.frame_fname(frameno, outdir, file_prefix,
+                                               kind))
+            stamps += [stat.st_size, stat.st_mtime_ns]
+    return tuple(stamps)
+
+
+def write_index(frameno, outdir='_output', file_prefix='fort'):
+    """
+    Scan frame frameno and write its index file fort.iNNNN.
+    Returns the name of the index file.
+    """
+    tinfo, records = frameio.scan_patches(frameno, outdir, file_prefix)
+    stamps = _source_stamps(frameno, tinfo, outdir, file_prefix)
+    bsize = stamps[2]
+    if bsize and bsize != records['data_nbytes'].sum():
+        raise IOError('Size of fort.b file for frame %i does not match '
+                      'its patch headers' % frameno)
+    fname = index_fname(frameno, outdir, file_prefix)
+    # write to a temporary file first so readers never see a partial index
+    tmpname = fname + '.tmp'
+    with open(tmpname, 'wb') as f:
+        np.savez(f, records=records, stamps=np.array(stamps, dtype=np.int64),
+                 **{key: np.array(value) for key, value in tinfo.items()})
+    os.replace(tmpname, fname)
+    return fname
+
+
+def read_index(frameno, outdir='_output', file_prefix='fort'):
+    """
+    Read fort.iNNNN, returning (tinfo, records) as frameio.scan_patches does.
+    Returns (None, None) if the index is missing or out of date.
+    """
+    fname = index_fname(frameno, outdir, file_prefix)
+    if not os.path.isfile(fname):
+        return None, None
+    with np.load(fname) as data:
+        records = data['records']
+        tinfo = {}
+        for key in ['t', 'num_eqn', 'num_patches', 'num_aux', 'num_dim',
+                    'num_ghost', 'file_format']:
+            tinfo[key] = data[key].item()
+        if 'stamps' not in data:
+            return None, None       # index of an older version
+        stamps = tuple(int(value) for value in data['stamps'])
+    try:
+        if _source_stamps(frameno, tinfo, outdir, file_prefix) != stamps:
+            return None, None
+    except OSError:
+        return None, None
+    return tinfo, records
+
+
+def frame_numbers(outdir='_output', file_prefix='fort'):
+    """Sorted list of frame numbers with a fort.tNNNN file in outdir."""
+    fnames = glob.glob(os.path.join(outdir, '%s.t[0-9][0-9][0-9][0-9]*'
+                                    % file_prefix))
+    framenos = []
+    for fname in fnames:
+        suffix = os.path.basename(fname)[len(file_prefix)+2:]
+        if suffix.isdigit():
+            framenos.append(int(suffix))
+    return sorted(framenos)
+
+
+def index_outdir(outdir='_output', framenos='all', overwrite=False,
+                 file_prefix='fort', verbose=True):
+    """
+    Write index files for the frames in outdir.
+    Existing up to date indices are kept unless overwrite is True.
+    """
+    if framenos == 'all':
+        framenos = frame_numbers(outdir, file_prefix)
+    for frameno in framenos:
+        if not overwrite:
+            tinfo, records = read_index(frameno, outdir, file_prefix)
+            if tinfo is not None:
+                continue
+        fname = write_index(frameno, outdir, file_prefix)
+        if verbose:
+            print('Created ', fname)
+
+
+def watch(outdir='_output', interval=5., timeout=3600., file_prefix='fort',
+          num_output_times=None):
+    """
+    Index frames as they are written by a running solver.
+
+    A frame is indexed once its fort.tNNNN exists and all of its patches can
+    be scanned.  Stops after frame num_output_times has been indexed (if
+    given) or when no new frame has appeared for timeout seconds.
+    """
+    done = set()
+    last_new = time.time()
+    while True:
+        for frameno in frame_numbers(outdir, file_prefix):
+            if frameno in done:
+                continue
+            try:
+                fname = write_index(frameno, outdir, file_prefix)
+            except (IOError, ValueError, IndexError):
+                continue    # frame still being written, try again later
+            print('Created ', fname)
+            done.add(frameno)
+            last_new = time.time()
+        if num_output_times is not None and num_output_times in done:
+            return
+        if time.time() - last_new > timeout:
+            return
+        time.sleep(interval)
+
+
+class _LevelTree(object):
+
+    """
+    Packed R-tree (sort-tile-recursive) over the patches on one level.
+    Leaves hold up to NODE_SIZE patches; both the leaf boxes and the
+    patches in the selected leaves are tested with vectorized comparisons.
+    """
+
+    def __init__(self, records, rows):
+        n = len(rows)
+        nleaves = max(1, int(np.ceil(n / float(NODE_SIZE))))
+        nslices = max(1, int(np.ceil(np.sqrt(nleaves))))
+        xc = 0.5*(records['xlow'][rows] + records['xhigh'][rows])
+        yc = 0.5*(records['ylow'][rows] + records['yhigh'][rows])
+        k = np.argsort(xc, kind='stable')
+        order = rows[k]
+        yc = yc[k]
+        slice_size = nslices * NODE_SIZE
+        for s in range(0, n, slice_size):
+            k = np.argsort(yc[s:s+slice_size], kind='stable')
+            order[s:s+slice_size] = order[s:s+slice_size][k]
+
+        self.order = order
+        self.starts = np.arange(0, n, NODE_SIZE)
+        self.box = np.empty((len(self.starts), 4))
+        for k, s in enumerate(self.starts):
+            r = records[order[s:s+NODE_SIZE]]
+            self.box[k] = [r['xlow'].min(), r['xhigh'].max(),
+                           r['ylow'].min(), r['yhigh'].max()]
+
+    def candidates(self, x1, x2, y1, y2):
+        """Rows of patches in leaves whose box intersects [x1,x2]x[y1,y2]."""
+        box = self.box
+        hit = (box[:, 0] <= x2) & (box[:, 1] >= x1) & \
+              (box[:, 2] <= y2) & (box[:, 3] >= y1)
+        if not hit.any():
+            return np.empty(0, dtype=int)
+        return np.concatenate([self.order[s:s+NODE_SIZE]
+                               for s in self.starts[hit]])
+
+
+class PatchIndex(object):
+
+    """
+    Index of the patches in one frame, loaded from fort.iNNNN (which is
+    written first if it is missing or out of date).
+
+    Attributes:
+        tinfo    dictionary of fort.tNNNN values (see frameio.read_t)
+        records  array of frameio.PATCH_DTYPE, one entry per patch
+        levels   sorted list of AMR levels present
+    """
+
+    def __init__(self, frameno, outdir='_output', file_prefix='fort'):
+        self.frameno = frameno
+        self.outdir = outdir
+        self.file_prefix = file_prefix
+        tinfo, records = read_index(frameno, outdir, file_prefix)
+        if tinfo is None:
+            write_index(frameno, outdir, file_prefix)
+            tinfo, records = read_index(frameno, outdir, file_prefix)
+        self.tinfo = tinfo
+        self.records = records
+        self.levels = sorted(set(records['level']))
+        self._trees = {}
+        for level in self.levels:
+            rows = np.nonzero(records['level'] == level)[0]
+            self._trees[level] = _LevelTree(records, rows)
+
+    def query_bbox(self, x1, x2, y1, y2, level=None):
+        """
+        Records of the patches intersecting [x1,x2] x [y1,y2], on the given
+        level or on all levels if level is None.  In 1d, y1,y2 are ignored.
+        """
+        if self.tinfo['num_dim'] == 1:
+            y1, y2 = -np.inf, np.inf
+        levels = self.levels if level is None else [level]
+        rows = []
+        for L in levels:
+            if L not in self._trees:
+                continue
+            cand = self._trees[L].candidates(x1, x2, y1, y2)
+            r = self.records[cand]
+            hit = (r['xlow'] < x2) & (r['xhigh'] > x1)
+            if self.tinfo['num_dim'] > 1:
+                hit &= (r['ylow'] < y2) & (r['yhigh'] > y1)
+            rows.append(cand[hit])
+        if not rows:
+            return self.records[:0]
+        return self.records[np.sort(np.concatenate(rows))]
+
+    def query_point(self, x, y=0., level=None):
+        """
+        Records of the patches containing the point (x,y), with each patch
+        taken as [xlow,xhigh) x [ylow,yhigh) as in finest_containing.
+        """
+        levels = self.levels if level is None else [level]
+        rows = []
+        for L in levels:
+            if L not in self._trees:
+                continue
+            cand = self._trees[L].candidates(x, x, y, y)
+            r = self.records[cand]
+            hit = (r['xlow'] <= x) & (x < r['xhigh'])
+            if self.tinfo['num_dim'] > 1:
+                hit &= (r['ylow'] <= y) & (y < r['yhigh'])
+            rows.append(cand[hit])
+        if not rows:
+            return self.records[:0]
+        return self.records[np.sort(np.concatenate(rows))]
+
+    def finest_containing(self, x, y=None):
+        """
+        For arrays of points x,y return the row in self.records of the
+        finest patch containing each point (-1 if outside every patch).
+        """
+        x = np.atleast_1d(np.asarray(x, dtype=float))
+        y = np.zeros_like(x) if y is None \
+            else np.atleast_1d(np.asarray(y, dtype=float))
+        rows = -np.ones(x.shape, dtype=int)
+        todo = np.ones(x.shape, dtype=bool)
+        for level in reversed(self.levels):
+            if not todo.any():
+                break
+            tree = self._trees[level]
+            cand = tree.candidates(x[todo].min(), x[todo].max(),
+                                   y[todo].min(), y[todo].max())
+            for row in cand:
+                r = self.records[row]
+                inside = todo & (r['xlow'] <= x) & (x < r['xhigh'])
+                if self.tinfo['num_dim'] > 1:
+                    inside &= (r['ylow'] <= y) & (y < r['yhigh'])
+                rows[inside] = row
+                todo &= ~inside
+        return rows
+
+    def read(self, records):
+        """
+        Read the data for the given records (a subset of self.records),
+        seeking directly to each patch.  Returns a list of q arrays.
+        """
+        fname = frameio.data_fname(self.frameno, self.tinfo, self.outdir,
+                                   self.file_prefix)
+        qlist = []
+        with open(fname, 'rb') as f:
+            for record in np.atleast_1d(records):
+                qlist.append(frameio.read_patch_data(f, record, self.tinfo))
+        return qlist
+
+    def sample(self, x, y=None, m=-1):
+        """
+        Values of component m of q at points x,y, taken from the finest
+        patch containing each point (piecewise constant in each cell).
+        Only the patches containing some point are read.
+        Points outside the domain get nan.
+        """
+        x = np.atleast_1d(np.asarray(x, dtype=float))
+        y = np.zeros_like(x) if y is None \
+            else np.atleast_1d(np.asarray(y, dtype=float))
+        rows = self.finest_containing(x, y)
+        values = np.full(x.shape, np.nan)
+        needed = np.unique(rows[rows >= 0])
+        qlist = self.read(self.records[needed])
+        for row, q in zip(needed, qlist):
+            r = self.records[row]
+            k = (rows == row)
+            i = np.minimum(((x[k] - r['xlow']) / r['dx']).astype(int),
+                           r['mx'] - 1)
+            if self.tinfo['num_dim'] == 1:
+                values[k] = q[m, i]
+            else:
+                j = np.minimum(((y[k] - r['ylow']) / r['dy']).astype(int),
+                               r['my'] - 1)
+                values[k] = q[m, i, j]
+        return values
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Write patch index files fort.iNNNN for GeoClaw output')
+    parser.add_argument('outdir', nargs='?', default='_output')
+    parser.add_argument('--frames', type=int, nargs='*', default=None,
+                        help='frame numbers to index (default all)')
+    parser.add_argument('--overwrite', action='store_true')
+    parser.add_argument('--watch', action='store_true',
+                        help='index frames as a running solver writes them')
+    parser.add_argument('--interval', type=float, default=5.)
+    parser.add_argument('--timeout', type=float, default=3600.)
+    parser.add_argument('--last-frame', type=int, default=None,
+                        help='with --watch, stop after indexing this frame')
+    args = parser.parse_args()
+
+    if args.watch:
+        watch(args.outdir, args.interval, args.timeout,
+              num_output_times=args.last_frame)
+    else:
+        framenos = 'all' if args.frames is None else args.frames
+        index_outdir(args.outdir, framenos, overwrite=args.overwrite)
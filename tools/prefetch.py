@@ -0,0 +1,171 @@
+"""
+Read the next frames in the background while the current one is plotted.
+
+Plotting scripts alternate between reading a frame and rendering it, so
+the disk idles while matplotlib works and the CPU idles while the frame
+is read.  After
+
+    prefetch.install(plotdata, framenos)
+
+each call plotdata.plotframe(frameno) (or any plotdata.getframe) starts
+reading the frames that follow frameno in the list framenos, on a
+background thread, while frameno is plotted.  Without framenos the
+frames that follow in plotdata.print_framenos are prefetched, or
+frameno+1, frameno+2, ... if it is 'all'.  The setplot files of the
+cases call install at their end, so `make .plots` (including the frame
+subsets of parallel plotting) prefetches too; calling install again,
+e.g. in a plot_frames script with its own list of frames, only replaces
+framenos.
+
+At most depth frames (default 2) are read ahead, and fewer if their
+estimated size (from the sizes of fort.q, fort.b and fort.a) would exceed
+max_bytes, by default a quarter of the memory available when install is
+called.  Frames are read with the loader installed by
+level_filter.install, if any, so only the levels needed are prefetched.
+
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import frameio
+
+
+def available_memory():
+    """Available physical memory in bytes (1 GB if unknown)."""
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (ValueError, OSError, AttributeError):
+        return 2**30
+
+
+def frame_nbytes(frameno, outdir='_output', file_prefix='fort'):
+    """
+    Estimate of the memory needed for a frame, from its file sizes (an
+    overestimate for ascii frames), or None if the frame does not exist.
+    """
+    if not os.path.isfile(frameio.frame_fname(frameno, outdir, file_prefix,
+                                              't')):
+        return None
+    nbytes = 0
+    for kind in 'qba':
+        fname = frameio.frame_fname(frameno, outdir, file_prefix, kind)
+        if os.path.isfile(fname):
+            nbytes += os.path.getsize(fname)
+    return nbytes
+
+
+class Prefetcher(object):
+
+    """
+    Replacement for plotdata.getframe that reads ahead on one background
+    thread.  Created by install().
+    """
+
+    def __init__(self, plotdata, framenos=None, depth=2, max_bytes=None):
+        self.plotdata = plotdata
+        self.framenos = list(framenos) if framenos is not None else None
+        self.depth = depth
+        self.max_bytes = max_bytes if max_bytes is not None \
+                         else available_memory() // 4
+        self.reader = getattr(plotdata.getframe, 'reader', self._read)
+        self.pool = ThreadPoolExecutor(max_workers=1)
+        self.pending = {}       # key -> (nbytes, future)
+        self.lock = threading.Lock()
+
+    def _read(self, frameno, outdir):
+        from clawpack.pyclaw import solution
+        return solution.Solution(frameno, path=outdir,
+                                 file_prefix=self.plotdata.file_prefix,
+                                 file_format=self.plotdata.format)
+
+    def _following(self, frameno):
+        """Frames to prefetch after frameno."""
+        framenos = self.framenos
+        if framenos is None:
+            print_framenos = self.plotdata.print_framenos
+            if isinstance(print_framenos, str):
+                return list(range(frameno + 1, frameno + 1 + self.depth))
+            framenos = list(print_framenos)
+        if frameno not in framenos:
+            return []
+        k = framenos.index(frameno)
+        return framenos[k+1 : k+1+self.depth]
+
+    def _schedule(self, frameno, outdir):
+        following = self._following(frameno)
+        keys = [(n, outdir) for n in following]
+        with self.lock:
+            # drop reads that are no longer ahead of the plotting:
+            for key in list(self.pending):
+                if key not in keys:
+                    self.pending.pop(key)[1].cancel()
+            in_flight = sum(nbytes for nbytes, future
+                            in self.pending.values())
+            for key in keys:
+                if key in self.pending or \
+                        key in self.plotdata.framesoln_dict:
+                    continue
+                nbytes = frame_nbytes(key[0], outdir,
+                                      self.plotdata.file_prefix)
+                if nbytes is None or in_flight + nbytes > self.max_bytes:
+                    break
+                in_flight += nbytes
+                future = self.pool.submit(self.reader, key[0], outdir)
+                self.pending[key] = (nbytes, future)
+
+    def getframe(self, frameno, outdir=None, refresh=False):
+        plotdata = self.plotdata
+        if outdir is None:
+            outdir = plotdata.outdir
+        outdir = os.path.abspath(outdir)
+        key = (frameno, outdir)
+        framesoln_dict = plotdata.framesoln_dict
+        with self.lock:
+            nbytes, future = self.pending.pop(key, (0, None))
+        if refresh or (key not in framesoln_dict):
+            if future is not None and not refresh:
+                framesoln = future.result()
+                how = 'Prefetched'
+            else:
+                if future is not None:
+                    future.cancel()
+                framesoln = self.reader(frameno, outdir)
+                how = 'Reading   '
+            if not plotdata.save_frames:
+                framesoln_dict.clear()
+            framesoln_dict[key] = framesoln
+            print('    %s Frame %s at t = %g  from outdir = %s'
+                  % (how, frameno, framesoln.t, outdir))
+            if hasattr(framesoln, 'levels_read'):
+                print('    (levels %s only)' % framesoln.levels_read)
+        self._schedule(frameno, outdir)
+        return framesoln_dict[key]
+
+    def close(self):
+        """Cancel pending reads and stop the background thread."""
+        with self.lock:
+            for nbytes, future in self.pending.values():
+                future.cancel()
+            self.pending.clear()
+        self.pool.shutdown(wait=True)
+
+
+def install(plotdata, framenos=None, depth=2, max_bytes=None):
+    """
+    Make plotdata.getframe prefetch the frames following the one requested,
+    in the order given by framenos (default: consecutive frames).  Call this
+    after setplot (and after level_filter.install, if used).  If plotdata
+    already has a Prefetcher, only its framenos are replaced.  Returns the
+    Prefetcher.
+    """
+    prefetcher = getattr(plotdata.getframe, '__self__', None)
+    if isinstance(prefetcher, Prefetcher):
+        prefetcher.framenos = list(framenos) if framenos is not None \
+                              else None
+        return prefetcher
+    prefetcher = Prefetcher(plotdata, framenos, depth, max_bytes)
+    # ClawPlotData only accepts declared attributes, so bypass its check:
+    object.__setattr__(plotdata, 'getframe', prefetcher.getframe)
+    return prefetcher
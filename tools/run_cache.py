@@ -0,0 +1,266 @@
+"""
+Cache of completed runs, keyed on the content of everything that
+determines the output.
+
+The key of a run is a hash of
+
+  - the .data files written by rundata.write(), with each quoted file
+    name in them (topo, dtopo, qinit, fgmax files, ...) replaced by a
+    hash of the content of that file,
+  - the Fortran sources of the executable: SOURCES and MODULES of the
+    case Makefile (qinit.f90, ../conck.f90, riemann files) and those of
+    the GeoClaw library Makefile it includes, with $(CLAW) expanded,
+  - the compiler settings FC and FFLAGS from the environment.
+
+A completed run is stored in cachedir/<key>/ by copying its output files
+there, read-only, and a later run with the same key is restored by copying
+them back (with their modification times) instead of running it.  The
+files are copied rather than hard-linked both ways, although that costs
+space and time, because a later `make .output`, supervise.py or xgeoclaw
+run into the same outdir appends to or rewrites gauge, timing and fort.amr
+files in place, which would silently modify the cached copies through a
+shared link.  Content hashes of large input files are remembered in
+cachedir/file_hashes.json by path, size and mtime.
+
+In a case directory, instead of `make .output`:
+
+    python ../../tools/run_cache.py . --outdir _output
+
+runs `make .data`, restores _output from the cache if possible and
+otherwise runs `make .output` and stores the result.  runtools.run_all
+runs can be cached with RunCache.run_all, used by the --cache options of
+sphere_runs.py and sweep.py.  The default cachedir is
+$SPHERE_TESTS_CACHE or ~/.cache/sphere_tests.
+
+"""
+
+import os
+import re
+import glob
+import json
+import stat
+import shutil
+import hashlib
+import subprocess
+
+import runtools
+
+CACHE_DIR = os.environ.get('SPHERE_TESTS_CACHE',
+                           os.path.join(os.path.expanduser('~'), '.cache',
+                                        'sphere_tests'))
+COMPLETE = 'cache_complete.txt'
+
+
+def file_sha1(fname, blocksize=2**20):
+    sha1 = hashlib.sha1()
+    with open(fname, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def _expand(text, variables):
+    """Expand $(NAME) in text using variables, then the environment."""
+    def value(match):
+        name = match.group(1)
+        return variables.get(name, os.environ.get(name, ''))
+    for k in range(10):     # nested references
+        new = re.sub(r'\$\((\w+)\)', value, text)
+        if new == text:
+            break
+        text = new
+    return text
+
+
+def makefile_sources(casedir, fname='Makefile', variables=None):
+    """
+    Source files (absolute paths) named in SOURCES, MODULES, COMMON_SOURCES
+    and COMMON_MODULES of a Makefile and the makefiles it includes, except
+    Makefile.common.
+    """
+    variables = {} if variables is None else variables
+    path = os.path.join(casedir, fname)
+    sources = []
+    if not os.path.isfile(path):
+        return sources
+    with open(path) as f:
+        text = f.read().replace('\\\n', ' ')
+    for line in text.splitlines():
+        line = line.split('#')[0].strip()
+        if line.startswith('include '):
+            include = os.path.join(casedir, _expand(
+                line[len('include '):].strip(), variables))
+            if not include.endswith('Makefile.common'):
+                sources += makefile_sources(os.path.dirname(include),
+                                            os.path.basename(include),
+                                            variables)
+            continue
+        match = re.match(r'^(\w+)\s*(\+=|\?=|:=|=)(.*)$', line)
+        if match is None:
+            continue
+        name, op, value = match.groups()
+        value = _expand(value.strip(), variables)
+        if op == '+=':
+            variables[name] = (variables.get(name, '') + ' ' + value).strip()
+        elif op != '?=' or name not in variables:
+            variables[name] = value
+        if name in ['SOURCES', 'MODULES', 'COMMON_SOURCES', 'COMMON_MODULES']:
+            sources += [os.path.abspath(os.path.join(casedir, source))
+                        for source in value.split()]
+    return sources
+
+
+class RunCache(object):
+
+    """Store of completed runs in cachedir, keyed by run_key."""
+
+    def __init__(self, cachedir=None):
+        self.cachedir = os.path.abspath(cachedir or CACHE_DIR)
+        os.makedirs(self.cachedir, exist_ok=True)
+        self._hashes_fname = os.path.join(self.cachedir, 'file_hashes.json')
+        if os.path.isfile(self._hashes_fname):
+            with open(self._hashes_fname) as f:
+                self._hashes = json.load(f)
+        else:
+            self._hashes = {}
+
+    def content_hash(self, fname):
+        """sha1 of a file, remembered by path, size and mtime."""
+        fname = os.path.abspath(fname)
+        stat = os.stat(fname)
+        stamp = [stat.st_size, stat.st_mtime]
+        entry = self._hashes.get(fname)
+        if entry is None or entry[0] != stamp:
+            entry = self._hashes[fname] = [stamp, file_sha1(fname)]
+            tmp = self._hashes_fname + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(self._hashes, f)
+            os.replace(tmp, self._hashes_fname)
+        return entry[1]
+
+    def _data_lines(self, fname):
+        """Lines of a .data file with file names replaced by hashes."""
+        lines = []
+        with open(fname) as f:
+            for line in f:
+                for name in re.findall(r"'([^']+)'", line):
+                    if os.path.isfile(name):
+                        line = line.replace(name, self.content_hash(name))
+                lines.append(line)
+        return lines
+
+    def run_key(self, rundir, casedir):
+        """Hash of the .data files in rundir and the sources of casedir."""
+        sha1 = hashlib.sha1()
+        for fname in sorted(glob.glob(os.path.join(rundir, '*.data'))):
+            sha1.update(os.path.basename(fname).encode())
+            for line in self._data_lines(fname):
+                sha1.update(line.encode())
+        for source in sorted(set(makefile_sources(casedir))):
+            sha1.update(source.encode())
+            if os.path.isfile(source):
+                sha1.update(self.content_hash(source).encode())
+        for name in ['FC', 'FFLAGS']:
+            sha1.update(('%s=%s' % (name, os.environ.get(name, ''))).encode())
+        return sha1.hexdigest()
+
+    def entry(self, key):
+        return os.path.join(self.cachedir, key)
+
+    def has(self, key):
+        return os.path.isfile(os.path.join(self.entry(key), COMPLETE))
+
+    def _copy_files(self, src, dest, readonly=False):
+        """Copy the files in src to dest, keeping modification times."""
+        os.makedirs(dest, exist_ok=True)
+        for fname in glob.glob(os.path.join(src, '*')):
+            if not os.path.isfile(fname):
+                continue
+            target = os.path.join(dest, os.path.basename(fname))
+            if os.path.exists(target):
+                os.remove(target)
+            shutil.copy2(fname, target)
+            mode = os.stat(target).st_mode
+            if readonly:
+                mode &= ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH)
+            else:
+                mode |= stat.S_IWUSR
+            os.chmod(target, mode)
+
+    def store(self, key, outdir):
+        """Add a copy of the files of a completed run in outdir."""
+        entry = self.entry(key)
+        tmp = entry + '.tmp'
+        if os.path.isdir(tmp):
+            shutil.rmtree(tmp)
+        self._copy_files(outdir, tmp, readonly=True)
+        with open(os.path.join(tmp, COMPLETE), 'w') as f:
+            f.write('%s\n' % os.path.abspath(outdir))
+        if os.path.isdir(entry):
+            shutil.rmtree(entry)
+        os.rename(tmp, entry)
+
+    def restore(self, key, outdir):
+        """Copy the cached files of key into outdir.  Returns True if the
+        run was in the cache."""
+        if not self.has(key):
+            return False
+        self._copy_files(self.entry(key), outdir)
+        os.remove(os.path.join(outdir, COMPLETE))
+        return True
+
+    def run_all(self, runs, casedir, max_threads=None, on_finish=None):
+        """
+        runtools.run_all for runs of casedir, restoring runs found in the
+        cache and storing the others as they complete successfully.
+        """
+        keys = {}
+        todo = []
+        for run in runs:
+            keys[run.name] = self.run_key(run.rundir, casedir)
+            if self.restore(keys[run.name], run.outdir):
+                print('Restored %s from cache %s' % (run.outdir,
+                                                     keys[run.name][:10]))
+                run.returncode = 0
+                run.elapsed = 0.
+                if on_finish is not None:
+                    on_finish(run)
+            else:
+                todo.append(run)
+
+        def store(run):
+            if run.returncode == 0:
+                self.store(keys[run.name], run.outdir)
+            if on_finish is not None:
+                on_finish(run)
+
+        return runtools.run_all(todo, max_threads, on_finish=store)
+
+
+def cached_output(casedir='.', outdir='_output', cachedir=None):
+    """make .data, then restore outdir from the cache or make .output."""
+    casedir = os.path.abspath(casedir)
+    subprocess.check_call(['make', '.data'], cwd=casedir)
+    cache = RunCache(cachedir)
+    key = cache.run_key(casedir, casedir)
+    outdir = os.path.join(casedir, outdir)
+    if cache.restore(key, outdir):
+        print('Restored %s from cache %s' % (outdir, key[:10]))
+        return key
+    subprocess.check_call(['make', '.output', 'OUTDIR=%s' % outdir],
+                          cwd=casedir)
+    cache.store(key, outdir)
+    print('Stored %s in cache %s' % (outdir, key[:10]))
+    return key
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Restore a run from the cache, or run and cache it')
+    parser.add_argument('casedir', nargs='?', default='.')
+    parser.add_argument('--outdir', default='_output')
+    parser.add_argument('--cachedir', default=None)
+    args = parser.parse_args()
+
+    cached_output(args.casedir, args.outdir, args.cachedir)
@@ -0,0 +1,321 @@
+"""
+Tools for running the cases in this repository from Python, without
+editing setrun.py between runs.
+
+A run is made in three steps:
+
+    rundata = runtools.make_rundata('../2d/nonpolar_axisymmetric')
+    rundata.geo_data.sphere_source = 0
+    runtools.write_data(rundata, rundir, casedir)     # *.data in rundir
+    exe = runtools.build(casedir)                     # make .exe
+
+and then one or more Run objects are executed concurrently by run_all,
+which starts each run as soon as enough threads are free:
+
+    runs = [runtools.Run(exe, rundir, outdir, nthreads=8), ...]
+    runtools.run_all(runs, max_threads=16)
+
+Each run copies the *.data files from its rundir into its outdir and runs
+the executable there (as runclaw does), with OMP_NUM_THREADS set to the
+threads given to it, writing stdout and stderr to outdir/run.log.
+
+"""
+
+import os
+import sys
+import time
+import glob
+import shutil
+import filecmp
+import tempfile
+import importlib.util
+import subprocess
+
+import datasets
+
+
+def load_setrun(casedir, setrun_file='setrun.py'):
+    """Import setrun_file from casedir as a module (not cached in
+    sys.modules, so several cases can be loaded in one process)."""
+    path = os.path.abspath(os.path.join(casedir, setrun_file))
+    spec = importlib.util.spec_from_file_location('_setrun', path)
+    module = importlib.util.module_from_spec(spec)
+    sys.path.insert(0, os.path.dirname(path))
+    try:
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(os.path.dirname(path))
+    return module
+
+
+def make_rundata(casedir, setrun_file='setrun.py', claw_pkg='geoclaw'):
+    """Run setrun() of a case, in the case directory, and return rundata."""
+    setrun = load_setrun(casedir, setrun_file)
+    cwd = os.getcwd()
+    os.chdir(casedir)
+    try:
+        rundata = setrun.setrun(claw_pkg)
+    finally:
+        os.chdir(cwd)
+    return enable_telemetry(rundata)
+
+
+def enable_telemetry(rundata):
+    """Turn on amrdata.tprint if $SPHERE_TESTS_TPRINT is set (see
+    amr_telemetry.py)."""
+    if os.environ.get('SPHERE_TESTS_TPRINT'):
+        import amr_telemetry
+        amr_telemetry.enable(rundata)
+    return rundata
+
+
+def _absolute(path, casedir):
+    return os.path.abspath(os.path.join(casedir, path))
+
+
+def absolute_paths(rundata, casedir):
+    """
+    Make the input file names in rundata (topo, dtopo, qinit, fgmax,
+    friction and force_dry files, 1d cell edges) absolute, relative to
+    casedir.  GeoClaw makes them relative to the directory the .data files
+    are written to, which for write_data is not the case directory.
+    """
+    for name in ['topo_data', 'dtopo_data', 'qinit_data']:
+        data = getattr(rundata, name, None)
+        for attr in ['topofiles', 'dtopofiles', 'qinitfiles']:
+            for tfile in getattr(data, attr, None) or []:
+                tfile[-1] = _absolute(tfile[-1], casedir)
+    fgmax_data = getattr(rundata, 'fgmax_data', None)
+    for fg in getattr(fgmax_data, 'fgmax_grids', None) or []:
+        if getattr(fg, 'xy_fname', None):
+            fg.xy_fname = _absolute(fg.xy_fname, casedir)
+    friction_data = getattr(rundata, 'friction_data', None)
+    if getattr(friction_data, 'friction_files', None):
+        friction_data.friction_files = [_absolute(fname, casedir) for fname
+                                        in friction_data.friction_files]
+    qinit_data = getattr(rundata, 'qinit_data', None)
+    for force_dry in getattr(qinit_data, 'force_dry_list', None) or []:
+        force_dry.fname = _absolute(force_dry.fname, casedir)
+    grid_data = getattr(rundata, 'grid_data', None)
+    if getattr(grid_data, 'fname_celledges', None):
+        grid_data.fname_celledges = _absolute(grid_data.fname_celledges,
+                                              casedir)
+    return rundata
+
+
+def write_changed(rundata, out_dir=''):
+    """
+    Write the .data files of rundata into out_dir (default the current
+    directory), replacing an existing file only if its content changes, so
+    that unchanged files keep their modification time.  The files are
+    written to a temporary directory first and moved into place with
+    os.replace.  Returns the list of files that changed.
+    """
+    out_dir = os.path.abspath(out_dir)
+    # as in rundata.write, relative input file names are relative to out_dir:
+    absolute_paths(rundata, out_dir)
+    tmpdir = tempfile.mkdtemp(prefix='.data_', dir=out_dir)
+    changed = []
+    try:
+        rundata.write(out_dir=tmpdir)
+        for name in sorted(os.listdir(tmpdir)):
+            new = os.path.join(tmpdir, name)
+            old = os.path.join(out_dir, name)
+            if os.path.isfile(old) and filecmp.cmp(new, old, shallow=False):
+                continue
+            os.replace(new, old)
+            changed.append(old)
+    finally:
+        shutil.rmtree(tmpdir)
+    return changed
+
+
+def write_case_data(rundata, stamp='.data'):
+    """
+    Write the .data files of rundata in the current directory with
+    write_changed, and touch the make stamp file only if some file changed
+    (or the stamp is missing), so that `make .output` does not rerun the
+    solver after a setrun that changed nothing.  Called from the __main__
+    block of the setrun files; tools/Makefile.data keeps make's data rule
+    from touching the stamp itself.  Returns the list of changed files.
+    """
+    changed = write_changed(enable_telemetry(rundata))
+    if changed or not os.path.exists(stamp):
+        with open(stamp, 'a'):
+            os.utime(stamp, None)
+        print('%i .data files changed' % len(changed))
+    else:
+        print('No .data file changed')
+    return changed
+
+
+def write_data(rundata, rundir, casedir):
+    """
+    Write the .data files of rundata into rundir, where they differ, with
+    the topo and dtopo files staged to node-local disk if a stage
+    directory is set (see datasets.py).
+    """
+    os.makedirs(rundir, exist_ok=True)
+    absolute_paths(rundata, casedir)
+    datasets.stage_files(rundata)
+    write_changed(rundata, rundir)
+    return rundir
+
+
+def shorten(rundata, fraction=0.1):
+    """
+    Reduce a run to the first fraction of its time span, with one output
+    frame at the end and no checkpoints, e.g. for timing runs.
+    """
+    clawdata = rundata.clawdata
+    if clawdata.output_style == 3:
+        clawdata.total_steps = max(1, int(fraction * clawdata.total_steps))
+    else:
+        if clawdata.output_style == 2:
+            tfinal = clawdata.output_times[-1]
+        else:
+            tfinal = clawdata.tfinal
+        clawdata.output_style = 1
+        clawdata.num_output_times = 1
+        clawdata.tfinal = clawdata.t0 + fraction * (tfinal - clawdata.t0)
+    if hasattr(clawdata, 'checkpt_style'):
+        clawdata.checkpt_style = 0
+    return rundata
+
+
+def makefile_variable(casedir, name, default=None):
+    """Value of a variable such as EXE set in the Makefile of a case."""
+    fname = os.path.join(casedir, 'Makefile')
+    if not os.path.isfile(fname):
+        return default
+    with open(fname) as f:
+        for line in f:
+            words = line.split('#')[0].split('=')
+            if len(words) == 2 and words[0].strip(' ?:') == name:
+                return words[1].strip()
+    return default
+
+
+def build(casedir, fflags=None):
+    """
+    Build the executable of a case with make .exe; returns its path.  If
+    fflags is given, everything is recompiled with make new FFLAGS=fflags,
+    e.g. to switch OpenMP on.
+    """
+    exe = makefile_variable(casedir, 'EXE')
+    if exe is None:
+        raise IOError('No Makefile with EXE in %s' % casedir)
+    if fflags is None:
+        subprocess.check_call(['make', '.exe'], cwd=casedir)
+    else:
+        subprocess.check_call(['make', 'new', 'FFLAGS=%s' % fflags],
+                              cwd=casedir)
+    return os.path.abspath(os.path.join(casedir, exe))
+
+
+class Run(object):
+
+    """
+    One execution of exe with the .data files in rundir, output in outdir.
+    cost is used by run_all to start the most expensive runs first.  With
+    append_log=True, e.g. for restarts, output is appended to run.log.
+    memory is an estimate of its peak memory in bytes, for the max_memory
+    of run_all.  After the run, started is its start time and max_rss its
+    peak resident memory in bytes (where os.wait4 is available).
+    """
+
+    def __init__(self, exe, rundir, outdir, nthreads=1, cost=0., name=None,
+                 append_log=False, memory=0):
+        self.exe = os.path.abspath(exe)
+        self.rundir = os.path.abspath(rundir)
+        self.outdir = os.path.abspath(outdir)
+        self.nthreads = nthreads
+        self.cost = cost
+        self.name = name if name is not None \
+                    else os.path.basename(self.outdir)
+        self.append_log = append_log
+        self.memory = memory
+        self.process = None
+        self.started = None
+        self.returncode = None
+        self.elapsed = None
+        self.max_rss = None
+
+    def start(self):
+        os.makedirs(self.outdir, exist_ok=True)
+        for fname in glob.glob(os.path.join(self.rundir, '*.data')):
+            shutil.copy2(fname, self.outdir)
+        env = dict(os.environ, OMP_NUM_THREADS=str(self.nthreads))
+        self._log = open(os.path.join(self.outdir, 'run.log'),
+                         'a' if self.append_log else 'w')
+        self.started = time.time()
+        self.process = subprocess.Popen([self.exe], cwd=self.outdir, env=env,
+                                        stdout=self._log,
+                                        stderr=subprocess.STDOUT)
+
+    def poll(self):
+        """Return code if finished, otherwise None."""
+        if self.returncode is not None:
+            return self.returncode
+        if hasattr(os, 'wait4'):
+            pid, status, rusage = os.wait4(self.process.pid, os.WNOHANG)
+            if pid == 0:
+                return None
+            self.process.returncode = os.waitstatus_to_exitcode(status)
+            # ru_maxrss is in kilobytes on Linux, bytes on macOS:
+            self.max_rss = rusage.ru_maxrss * \
+                           (1 if sys.platform == 'darwin' else 1024)
+        elif self.process.poll() is None:
+            return None
+        self.returncode = self.process.returncode
+        self.elapsed = time.time() - self.started
+        self._log.close()
+        return self.returncode
+
+    def __repr__(self):
+        return 'Run(%s, nthreads = %i)' % (self.name, self.nthreads)
+
+
+def run_all(runs, max_threads=None, interval=1., verbose=True,
+            on_finish=None, max_memory=None):
+    """
+    Execute runs concurrently, using at most max_threads threads (default
+    os.cpu_count()) and, if max_memory is given, at most that many bytes of
+    the runs' memory estimates.  Runs are started largest cost first
+    whenever enough threads and memory are free, and on_finish(run), if
+    given, is called as each run finishes.  Returns the list of runs that
+    failed.
+    """
+    max_threads = max_threads or os.cpu_count()
+    max_memory = max_memory or float('inf')
+    waiting = sorted(runs, key=lambda run: run.cost, reverse=True)
+    running = []
+    failed = []
+    while waiting or running:
+        for run in list(running):
+            if run.poll() is not None:
+                running.remove(run)
+                if run.returncode != 0:
+                    failed.append(run)
+                if on_finish is not None:
+                    on_finish(run)
+                if verbose:
+                    print('Finished %s in %.1f s (return code %i)'
+                          % (run.name, run.elapsed, run.returncode))
+        free = max_threads - sum(run.nthreads for run in running)
+        free_memory = max_memory - sum(run.memory for run in running)
+        for run in list(waiting):
+            # a run larger than max_threads starts when nothing else runs:
+            if (run.nthreads <= free and run.memory <= free_memory) \
+                    or not running:
+                waiting.remove(run)
+                run.start()
+                running.append(run)
+                free -= run.nthreads
+                free_memory -= run.memory
+                if verbose:
+                    print('Started  %s with %i threads' % (run.name,
+                                                           run.nthreads))
+        if running:
+            time.sleep(interval)
+    return failed
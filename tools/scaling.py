@@ -0,0 +1,215 @@
+"""
+OpenMP thread-scaling study of a case.
+
+The case is compiled with OpenMP (make new with FFLAGS from the
+environment plus -fopenmp, unless --exe is given) and run for a short
+time span (the first --fraction of tfinal, see runtools.shorten) with 1, 2,
+4, ... up to --nthreads threads, one run at a time:
+
+    python ../../tools/scaling.py . --nthreads 32
+    python tools/scaling.py 2d/aasz_butler 2d/nonpolar_axisymmetric
+
+The time of each run is the integration time from timing.txt when the
+solver writes it (see amr_telemetry.py), which leaves out reading the
+input, otherwise the wall time of the process.  For each case a table of
+time, speedup, parallel efficiency and cell updates per second is
+printed, and workdir/<case>_scaling.json and <case>_scaling.png are
+written.  The JSON file gives the fastest thread count and the largest
+one with an efficiency of at least --min-efficiency, which is the one to
+request for production jobs of the case.
+
+"""
+
+import os
+import json
+import shutil
+import numpy as np
+
+import runtools
+import amr_telemetry
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def thread_counts(max_threads):
+    """1, 2, 4, ... up to and including max_threads."""
+    counts = [1]
+    while 2 * counts[-1] < max_threads:
+        counts.append(2 * counts[-1])
+    if max_threads > 1:
+        counts.append(max_threads)
+    return counts
+
+
+def case_name(casedir):
+    """Name of a case for file names, e.g. 2d_aasz_butler."""
+    path = os.path.relpath(os.path.abspath(casedir), REPO)
+    if path.startswith('..'):
+        path = os.path.basename(os.path.abspath(casedir))
+    return path.replace(os.sep, '_')
+
+
+def openmp_fflags():
+    """FFLAGS of the environment with the OpenMP flag added."""
+    fflags = os.environ.get('FFLAGS', '-O2')
+    if 'openmp' not in fflags:
+        fflags += ' -fopenmp'
+    return fflags
+
+
+def check_threads(solver_threads, nthreads):
+    """Warn if the solver reported another thread count than requested."""
+    if solver_threads not in [None, nthreads]:
+        print('*** Solver used %s threads instead of %i, built without '
+              'OpenMP?' % (solver_threads, nthreads))
+
+
+def timed_run(exe, rundir, outdir, nthreads, name=None):
+    """
+    Run exe alone in a fresh outdir.  Returns a record with nthreads, time
+    (integration time from timing.txt, or the wall time of the process),
+    elapsed, cell_updates_per_second and the number of threads reported
+    by the solver.
+    """
+    if os.path.isdir(outdir):
+        shutil.rmtree(outdir)
+    run = runtools.Run(exe, rundir, outdir, nthreads, name=name)
+    runtools.run_all([run], nthreads, interval=0.05)
+    if run.returncode != 0:
+        raise RuntimeError('Run failed, see %s'
+                           % os.path.join(outdir, 'run.log'))
+    tel = amr_telemetry.AMRTelemetry(outdir)
+    time = tel.wall_time()
+    if time is None or not np.isfinite(time):
+        time = run.elapsed
+    rate = tel.cell_updates_per_second()
+    return {'nthreads': nthreads, 'time': time, 'elapsed': run.elapsed,
+            'cell_updates_per_second':
+                float(rate) if np.isfinite(rate) else None,
+            'solver_threads': tel.nthreads}
+
+
+def run_scaling(casedir, nthreads_list, fraction=0.1, workdir='_scaling',
+                exe=None):
+    """
+    Run the shortened case at each thread count.  Returns a list of
+    records with nthreads, time, elapsed, cell_updates_per_second and the
+    number of threads reported by the solver.
+    """
+    casedir = os.path.abspath(casedir)
+    if exe is None:
+        exe = runtools.build(casedir, openmp_fflags())
+    rundata = runtools.shorten(runtools.make_rundata(casedir), fraction)
+    rundir = os.path.join(os.path.abspath(workdir), case_name(casedir))
+    runtools.write_data(rundata, rundir, casedir)
+
+    records = []
+    for nthreads in nthreads_list:
+        outdir = os.path.join(rundir, '_output_%ithreads' % nthreads)
+        record = timed_run(exe, rundir, outdir, nthreads, '%s (%i threads)'
+                           % (case_name(casedir), nthreads))
+        check_threads(record['solver_threads'], nthreads)
+        records.append(record)
+    return records
+
+
+def analyze(records, min_efficiency=0.5):
+    """
+    Speedup and efficiency relative to the run with the fewest threads,
+    added to the records.  Returns a dictionary with the records, the
+    fastest thread count and the recommended one (the largest with
+    efficiency >= min_efficiency).
+    """
+    records = sorted(records, key=lambda record: record['nthreads'])
+    base = records[0]
+    for record in records:
+        record['speedup'] = base['time'] / record['time']
+        record['efficiency'] = record['speedup'] * base['nthreads'] \
+                               / record['nthreads']
+    fastest = min(records, key=lambda record: record['time'])
+    efficient = [record['nthreads'] for record in records
+                 if record['efficiency'] >= min_efficiency]
+    return {'records': records, 'fastest': fastest['nthreads'],
+            'recommended': max(efficient) if efficient else base['nthreads'],
+            'min_efficiency': min_efficiency}
+
+
+def format_table(name, result):
+    lines = ['%s: fastest with %i threads, recommended %i threads'
+             % (name, result['fastest'], result['recommended']),
+             'threads   time (s)  speedup  efficiency  cell updates/s']
+    for record in result['records']:
+        rate = record['cell_updates_per_second']
+        lines.append('%7i %10.2f %8.2f %11.2f %15s'
+                     % (record['nthreads'], record['time'],
+                        record['speedup'], record['efficiency'],
+                        '%.3e' % rate if rate else '-'))
+    return '\n'.join(lines)
+
+
+def plot_scaling(name, result, fname):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    nthreads = [record['nthreads'] for record in result['records']]
+    fig, axes = plt.subplots(1, 2, figsize=(10, 4))
+    axes[0].plot(nthreads, [record['speedup']
+                            for record in result['records']], 'bo-',
+                 label='measured')
+    axes[0].plot(nthreads, np.array(nthreads) / float(nthreads[0]), 'k--',
+                 label='ideal')
+    axes[0].set_ylabel('speedup')
+    axes[0].legend(loc='upper left')
+    axes[1].plot(nthreads, [record['efficiency']
+                            for record in result['records']], 'ro-')
+    axes[1].axhline(result['min_efficiency'], color='k', linestyle=':')
+    axes[1].set_ylabel('parallel efficiency')
+    axes[1].set_ylim(0, 1.1)
+    for ax in axes:
+        ax.set_xscale('log', base=2)
+        ax.set_xticks(nthreads)
+        ax.set_xticklabels([str(n) for n in nthreads])
+        ax.set_xlabel('threads')
+        ax.grid(True)
+    fig.suptitle(name)
+    fig.savefig(fname, bbox_inches='tight')
+    plt.close(fig)
+
+
+def scaling_study(casedir, max_threads=None, fraction=0.1,
+                  workdir='_scaling', exe=None, min_efficiency=0.5):
+    """Run, analyze, print, and write the JSON file and plot of a case."""
+    name = case_name(casedir)
+    nthreads_list = thread_counts(max_threads or os.cpu_count())
+    records = run_scaling(casedir, nthreads_list, fraction, workdir, exe)
+    result = analyze(records, min_efficiency)
+    result['case'] = name
+    result['fraction'] = fraction
+    print(format_table(name, result))
+    fname = os.path.join(workdir, '%s_scaling' % name)
+    with open(fname + '.json', 'w') as f:
+        json.dump(result, f, indent=1)
+    plot_scaling(name, result, fname + '.png')
+    print('Created %s.json and %s.png' % (fname, fname))
+    return result
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Thread-scaling study of cases')
+    parser.add_argument('casedirs', nargs='*', default=['.'])
+    parser.add_argument('--nthreads', type=int, default=None,
+                        help='largest thread count (default: all cores)')
+    parser.add_argument('--fraction', type=float, default=0.1,
+                        help='fraction of tfinal to run (default 0.1)')
+    parser.add_argument('--workdir', default='_scaling')
+    parser.add_argument('--exe', default=None,
+                        help='OpenMP executable to use instead of make new')
+    parser.add_argument('--min-efficiency', type=float, default=0.5)
+    args = parser.parse_args()
+
+    for casedir in args.casedirs:
+        scaling_study(casedir, args.nthreads, args.fraction, args.workdir,
+                      args.exe, args.min_efficiency)
+        print()
@@ -0,0 +1,317 @@
+"""
+Run all the cases of the repository on one node in the shortest total
+time.
+
+The jobs are the runs needed for the figures: each case with and without
+the sphere source term (in the output directories the plotting scripts
+read) and the 1d_latitude reference solutions, about 16 xgeoclaw/xgeo
+processes of very different cost.  For each job
+
+  - the work (core-seconds) is estimated from the benchmark history
+    (benchmark.py: wall time times threads divided by the fraction of
+    tfinal run, smallest thread count), otherwise from the number of cell
+    updates (sweep.estimate_cost) at a nominal rate per core,
+  - the thread count is the recommended one of a scaling study
+    (scaling.py, <case>_scaling.json in --scaling-dir) if there is one,
+    otherwise proportional to the job's share of the total work,
+  - the memory is the largest peak RSS in the benchmark history, if any.
+
+The jobs are then started longest estimated duration first whenever
+enough cores and memory (--max-memory, default 90% of the available
+memory) are free (runtools.run_all), which keeps the makespan close to
+the minimum.  Output of the running jobs is streamed to the terminal,
+prefixed with the job name, and a report of estimated and actual times,
+threads and memory is written to --report:
+
+    python tools/scheduler.py --nthreads 64
+    python tools/scheduler.py --cases 2d/tohoku 2d/aasz_butler --dry-run
+
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import threading
+import subprocess
+import numpy as np
+
+import sweep
+import runtools
+import scaling
+import benchmark
+import prefetch
+
+# (case, outdir, sphere_source), sphere_source None for the setrun value:
+JOBS = [('1d/ring', '_output_nosphere', 0),
+        ('1d/ring', '_output_sphere', 2),
+        ('2d/nonpolar_axisymmetric', '_output_sphere0', 0),
+        ('2d/nonpolar_axisymmetric', '_output_sphere2', 2),
+        ('2d/nonpolar_axisymmetric/1d_latitude', '_output', None),
+        ('2d/nonpolar_axisymmetric_arctic', '_output_sphere0', 0),
+        ('2d/nonpolar_axisymmetric_arctic', '_output_sphere2', 2),
+        ('2d/nonpolar_axisymmetric_arctic/1d_latitude', '_output', None),
+        ('2d/nonpolar_axisymmetric_arctic_deep', '_output_sphere0', 0),
+        ('2d/nonpolar_axisymmetric_arctic_deep', '_output_sphere2', 2),
+        ('2d/axisymmetric_ring', '_output_sphere0', 0),
+        ('2d/axisymmetric_ring', '_output_sphere2', 2),
+        ('2d/tohoku', '_output_nosphere', 0),
+        ('2d/tohoku', '_output_sphere', 2),
+        ('2d/aasz_butler', '_output_nosphere_6hr', 0),
+        ('2d/aasz_butler', '_output_sphere_6hr', 2)]
+
+RATE = 2.e6     # nominal cell updates per second per core, for estimates
+
+
+class Job(object):
+
+    """One run of a case, with its estimated work, threads and memory."""
+
+    def __init__(self, case, outdir, sphere_source=None):
+        self.case = case
+        self.casedir = os.path.join(benchmark.REPO, case)
+        self.outdir = outdir
+        self.sphere_source = sphere_source
+        self.name = '%s/%s' % (case, outdir)
+        self.work = None
+        self.work_source = None
+        self.nthreads = 1
+        self.efficiency = 1.
+        self.memory = 0
+        self.rundata = None
+        self.run = None
+
+    @property
+    def duration(self):
+        """Estimated wall time with self.nthreads threads."""
+        return self.work / (self.nthreads * self.efficiency)
+
+    def prepare(self):
+        """Make rundata, with sphere_source set if given."""
+        self.rundata = runtools.make_rundata(self.casedir)
+        if self.sphere_source is not None:
+            self.rundata.geo_data.sphere_source = self.sphere_source
+        return self.rundata
+
+    def estimate(self, history, scaling_dir):
+        """Estimate work, memory and the efficiency of threads."""
+        host = socket.gethostname()
+        records = [record for record in history.records
+                   if record['case'] == self.case and record['host'] == host
+                   and record['returncode'] == 0]
+        if records:
+            record = min(records, key=lambda record: (record['nthreads'],
+                                                      record['date']))
+            self.work = record['wall'] * record['nthreads'] \
+                        / record['fraction']
+            self.work_source = 'history'
+            self.memory = max(record['max_rss'] or 0 for record in records)
+        else:
+            self.work = sweep.estimate_cost(self.rundata) / RATE
+            self.work_source = 'cells'
+        fname = os.path.join(scaling_dir, '%s_scaling.json'
+                             % scaling.case_name(self.casedir))
+        self.scaling = None
+        if os.path.isfile(fname):
+            with open(fname) as f:
+                self.scaling = json.load(f)
+
+    def choose_threads(self, max_threads, total_work):
+        """Threads from the scaling study, or by share of the work."""
+        if self.rundata.clawdata.num_dim == 1:
+            self.nthreads = 1       # the 1d codes are not parallel
+        elif self.scaling is not None:
+            self.nthreads = min(self.scaling['recommended'], max_threads)
+            efficiencies = dict((record['nthreads'], record['efficiency'])
+                                for record in self.scaling['records'])
+            self.efficiency = efficiencies.get(self.nthreads, 1.)
+        else:
+            share = max_threads * self.work / total_work
+            self.nthreads = int(np.clip(round(share), 1, max_threads))
+
+
+def plan(jobs, max_threads, history, scaling_dir):
+    """
+    Estimate the jobs and choose their thread counts.  Returns the jobs
+    whose case has a Makefile and whose setrun could be run.
+    """
+    planned = []
+    for job in jobs:
+        if runtools.makefile_variable(job.casedir, 'EXE') is None:
+            print('*** Skipping %s: no Makefile with EXE in %s'
+                  % (job.name, job.case))
+            continue
+        try:
+            job.prepare()
+        except Exception as err:    # e.g. missing $CLAW or 1d GeoClaw
+            print('*** Skipping %s: %s' % (job.name, err))
+            continue
+        job.estimate(history, scaling_dir)
+        planned.append(job)
+    total_work = sum(job.work for job in planned)
+    for job in planned:
+        job.choose_threads(max_threads, total_work)
+    return planned
+
+
+class LogStreamer(threading.Thread):
+
+    """Print new lines of the run.log of each started job, prefixed."""
+
+    def __init__(self, jobs, interval=0.5):
+        threading.Thread.__init__(self, daemon=True)
+        self.jobs = jobs
+        self.interval = interval
+        self.done = threading.Event()
+        self._files = {}
+
+    def poll(self):
+        for job in self.jobs:
+            if job.run is None or job.run.started is None:
+                continue
+            f = self._files.get(job.name)
+            if f is None:
+                fname = os.path.join(job.run.outdir, 'run.log')
+                if not os.path.isfile(fname):
+                    continue
+                f = self._files[job.name] = open(fname)
+            for line in f:
+                sys.stdout.write('[%s] %s' % (job.name, line))
+        sys.stdout.flush()
+
+    def run(self):
+        while not self.done.wait(self.interval):
+            self.poll()
+        self.poll()
+        for f in self._files.values():
+            f.close()
+
+    def stop(self):
+        self.done.set()
+        self.join()
+
+
+def build_all(jobs):
+    """
+    Build each case once, with OpenMP (scaling.openmp_fflags) if any of
+    its jobs has more than one thread; returns the jobs that could be
+    built.
+    """
+    openmp = set(job.case for job in jobs if job.nthreads > 1)
+    exes = {}
+    built = []
+    for job in jobs:
+        if job.case not in exes:
+            fflags = scaling.openmp_fflags() if job.case in openmp else None
+            try:
+                exes[job.case] = runtools.build(job.casedir, fflags)
+            except (IOError, subprocess.CalledProcessError) as err:
+                print('*** Skipping %s: %s' % (job.case, err))
+                exes[job.case] = None
+        if exes[job.case] is not None:
+            job.exe = exes[job.case]
+            built.append(job)
+    return built
+
+
+def report(jobs, t_start, max_threads):
+    """Dictionary of the schedule: per job estimates and actual values."""
+    makespan = max(job.run.started + job.run.elapsed for job in jobs) \
+               - t_start
+    busy = sum(job.nthreads * job.run.elapsed for job in jobs)
+    return {'makespan': makespan, 'max_threads': max_threads,
+            'utilization': busy / (max_threads * makespan),
+            'jobs': [{'name': job.name, 'nthreads': job.nthreads,
+                      'work_estimate': job.work,
+                      'work_source': job.work_source,
+                      'duration_estimate': job.duration,
+                      'start': job.run.started - t_start,
+                      'elapsed': job.run.elapsed,
+                      'returncode': job.run.returncode,
+                      'memory_estimate': job.memory,
+                      'max_rss': job.run.max_rss} for job in jobs]}
+
+
+def format_plan(jobs):
+    lines = ['%-55s %7s %12s %9s %10s' % ('job', 'threads', 'est. time (s)',
+                                          'from', 'memory MB')]
+    for job in sorted(jobs, key=lambda job: job.duration, reverse=True):
+        lines.append('%-55s %7i %12.1f %9s %10.0f'
+                     % (job.name, job.nthreads, job.duration,
+                        job.work_source, job.memory / 2**20))
+    return '\n'.join(lines)
+
+
+def format_report(rep):
+    lines = ['%-55s %7s %9s %9s %9s %6s' % ('job', 'threads', 'est. (s)',
+                                            'start', 'elapsed', 'code')]
+    for entry in sorted(rep['jobs'], key=lambda entry: entry['start']):
+        lines.append('%-55s %7i %9.1f %9.1f %9.1f %6i'
+                     % (entry['name'], entry['nthreads'],
+                        entry['duration_estimate'], entry['start'],
+                        entry['elapsed'], entry['returncode']))
+    lines.append('makespan %.1f s, core utilization %.0f%%'
+                 % (rep['makespan'], 100 * rep['utilization']))
+    return '\n'.join(lines)
+
+
+def schedule(jobs, max_threads=None, max_memory=None,
+             history_fname=benchmark.HISTORY_NAME, scaling_dir='_scaling',
+             report_fname='schedule_report.json', dry_run=False):
+    """Plan, build and run the jobs; returns the report (None if dry_run)."""
+    max_threads = max_threads or os.cpu_count()
+    if max_memory is None:
+        max_memory = 0.9 * prefetch.available_memory()
+    jobs = plan(jobs, max_threads, benchmark.History(history_fname),
+                scaling_dir)
+    print(format_plan(jobs))
+    if dry_run:
+        return None
+    jobs = build_all(jobs)
+    for job in jobs:
+        rundir = os.path.join(job.casedir,
+                              '_run' + job.outdir[len('_output'):])
+        runtools.write_data(job.rundata, rundir, job.casedir)
+        job.run = runtools.Run(job.exe, rundir,
+                               os.path.join(job.casedir, job.outdir),
+                               job.nthreads, job.duration, job.name,
+                               memory=job.memory)
+    streamer = LogStreamer(jobs)
+    streamer.start()
+    t_start = time.time()
+    try:
+        runtools.run_all([job.run for job in jobs], max_threads,
+                         max_memory=max_memory)
+    finally:
+        streamer.stop()
+    rep = report(jobs, t_start, max_threads)
+    with open(report_fname, 'w') as f:
+        json.dump(rep, f, indent=1)
+    print(format_report(rep))
+    print('Report in %s' % report_fname)
+    return rep
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Run all cases on one node in minimum total time')
+    parser.add_argument('--cases', nargs='+', default=None,
+                        help='only the jobs of these cases')
+    parser.add_argument('--nthreads', type=int, default=None,
+                        help='cores to use (default: all)')
+    parser.add_argument('--max-memory', type=float, default=None,
+                        help='memory ceiling in GB')
+    parser.add_argument('--history', default=benchmark.HISTORY_NAME)
+    parser.add_argument('--scaling-dir', default='_scaling')
+    parser.add_argument('--report', default='schedule_report.json')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='only print the plan')
+    args = parser.parse_args()
+
+    jobs = [Job(*job) for job in JOBS
+            if args.cases is None or job[0] in args.cases]
+    max_memory = args.max_memory * 2**30 if args.max_memory else None
+    schedule(jobs, args.nthreads, max_memory, args.history,
+             args.scaling_dir, args.report, args.dry_run)
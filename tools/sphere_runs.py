@@ -0,0 +1,81 @@
+"""
+Run a case with several values of geo_data.sphere_source, concurrently.
+
+Instead of editing setrun.py between runs, e.g.
+
+    python ../../tools/sphere_runs.py . --sphere-source 0 2
+
+writes the .data files of each variant into _run_sphere0, _run_sphere2,
+builds the executable once (make .exe) and runs the variants at the same
+time, splitting the threads (default: all cores) evenly between them, with
+output in _output_sphere0 and _output_sphere2.  Use --outdirs to choose
+other output names, e.g. for the tohoku and Butler plotting scripts:
+
+    python ../../tools/sphere_runs.py . --sphere-source 0 2 \\
+           --outdirs _output_nosphere _output_sphere --exe ./xgeoclaw
+
+"""
+
+import os
+
+import runtools
+
+
+def sphere_runs(casedir, sphere_sources=(0, 2), outdirs=None, exe=None,
+                max_threads=None, setrun_file='setrun.py', cachedir=None):
+    """
+    Write, build and run the variants of a case.  Returns the list of
+    runtools.Run objects, after they are finished.  If cachedir is given,
+    runs are restored from or stored in that run_cache.RunCache.
+    """
+    casedir = os.path.abspath(casedir)
+    if outdirs is None:
+        outdirs = ['_output_sphere%i' % s for s in sphere_sources]
+    if len(outdirs) != len(sphere_sources):
+        raise ValueError('Need one outdir per sphere_source value')
+    if exe is None:
+        exe = runtools.build(casedir)
+    max_threads = max_threads or os.cpu_count()
+    nthreads = max(1, max_threads // len(sphere_sources))
+
+    runs = []
+    for sphere_source, outdir in zip(sphere_sources, outdirs):
+        rundata = runtools.make_rundata(casedir, setrun_file)
+        rundata.geo_data.sphere_source = sphere_source
+        rundir = os.path.join(casedir, '_run_sphere%i' % sphere_source)
+        runtools.write_data(rundata, rundir, casedir)
+        runs.append(runtools.Run(exe, rundir, os.path.join(casedir, outdir),
+                                 nthreads))
+        print('Created %s/*.data with sphere_source = %i'
+              % (rundir, sphere_source))
+
+    if cachedir is not None:
+        import run_cache
+        failed = run_cache.RunCache(cachedir).run_all(runs, casedir,
+                                                      max_threads)
+    else:
+        failed = runtools.run_all(runs, max_threads)
+    if failed:
+        raise RuntimeError('Runs failed, see run.log in %s'
+                           % [run.outdir for run in failed])
+    return runs
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Run a case with several sphere_source values')
+    parser.add_argument('casedir')
+    parser.add_argument('--sphere-source', type=int, nargs='+',
+                        default=[0, 2])
+    parser.add_argument('--outdirs', nargs='+', default=None)
+    parser.add_argument('--exe', default=None,
+                        help='executable to use instead of make .exe')
+    parser.add_argument('--nthreads', type=int, default=None,
+                        help='total threads (default: all cores)')
+    parser.add_argument('--cache', default=None, metavar='CACHEDIR',
+                        help='reuse runs with identical inputs from here')
+    args = parser.parse_args()
+
+    sphere_runs(args.casedir, args.sphere_source, args.outdirs, args.exe,
+                args.nthreads, cachedir=args.cache)
@@ -0,0 +1,291 @@
+"""
+Run a case to completion, restarting from the newest checkpoint whenever
+the run stops early (preemption, node failure, ...).
+
+    python ../../tools/supervise.py . --outdir _output --nthreads 16
+
+writes the .data files with runtools into _run_supervised and runs the
+executable in the outdir.  If the run ends before the final frame has
+been written, the newest valid checkpoint in the outdir is found and the
+.data files are written again with clawdata.restart = True and
+restart_file set to it, and the run is relaunched, up to --max-restarts
+times.  Running the same command again after the supervisor itself was
+killed resumes in the same way.
+
+A checkpoint fort.chkNNNNN (or fort.chkaaaaa / fort.chkbbbbb for negative
+checkpt_style) is valid if its fort.tck file, which GeoClaw writes after
+the checkpoint is complete, exists and is not older.  For 1d codes, which
+restart from an output frame, the newest complete frame is used.  If the
+case does not checkpoint (checkpt_style = 0), checkpoints are added at
+the output times, alternating between two files.
+
+The run is complete when the final frame (for output_style 3 the frame
+after total_steps steps) has been written completely, at the expected
+time if known.  An existing outdir is only continued or accepted as
+complete if its .data files, copied there by runtools.Run, are those of
+the current setrun apart from the restart parameters; otherwise its
+checkpoints are removed and the case is run again from t0.
+
+When the run is complete, the frames are checked for continuity: all
+frames present, readable and complete, at the expected output times.
+
+"""
+
+import os
+import glob
+import numpy as np
+
+import frameio
+import patch_index
+import runtools
+
+# parameters of claw.data set for restarts, ignored by same_data:
+RESTART_PARAMS = ['restart', 'restart_file']
+
+
+def checkpoint_time(tck_fname):
+    """Time recorded in a fort.tck file, or None."""
+    try:
+        with open(tck_fname) as f:
+            for line in f:
+                if 'time' in line.lower() and '=' in line:
+                    return float(line.split('=')[1].split()[0])
+    except (IOError, ValueError, IndexError):
+        pass
+    return None
+
+
+def valid_checkpoints(outdir):
+    """List of (time, chk_fname) of the valid checkpoints, newest last."""
+    checkpoints = []
+    for chk in glob.glob(os.path.join(outdir, 'fort.chk*')):
+        tck = chk.replace('fort.chk', 'fort.tck')
+        if os.path.getsize(chk) == 0 or not os.path.isfile(tck) \
+                or os.path.getmtime(tck) < os.path.getmtime(chk):
+            continue
+        t = checkpoint_time(tck)
+        checkpoints.append((t if t is not None else -np.inf,
+                            os.path.getmtime(chk), chk))
+    checkpoints.sort()
+    return [(t, chk) for t, mtime, chk in checkpoints]
+
+
+def check_frame(frameno, outdir='_output', file_prefix='fort'):
+    """Time of a frame, raising IOError if it is missing or incomplete."""
+    tinfo, records = frameio.scan_patches(frameno, outdir, file_prefix)
+    if tinfo['file_format'] != 'ascii':
+        fname = frameio.data_fname(frameno, tinfo, outdir, file_prefix)
+        if os.path.getsize(fname) != records['data_nbytes'].sum():
+            raise IOError('%s is incomplete' % fname)
+    return tinfo['t']
+
+
+def output_times(clawdata):
+    """Expected times of the output frames, or None if not known."""
+    if clawdata.output_style == 1:
+        times = list(np.linspace(clawdata.t0, clawdata.tfinal,
+                                 clawdata.num_output_times + 1))
+    elif clawdata.output_style == 2:
+        times = [clawdata.t0] + list(clawdata.output_times)
+    else:
+        return None
+    if not clawdata.output_t0:
+        times = times[1:]
+    return times
+
+
+def final_frameno(clawdata):
+    """Number of the final output frame."""
+    times = output_times(clawdata)
+    if times is None:
+        # output_style 3: a frame every output_step_interval steps
+        return clawdata.total_steps // clawdata.output_step_interval
+    return len(times) - 1 + (0 if clawdata.output_t0 else 1)
+
+
+def check_frames(outdir, clawdata, file_prefix='fort'):
+    """
+    List of problems found in the frames of outdir (empty if all frames
+    are present, complete and at the expected times).
+    """
+    problems = []
+    framenos = patch_index.frame_numbers(outdir, file_prefix)
+    times = output_times(clawdata)
+    first = 0 if clawdata.output_t0 else 1
+    expected = list(range(first, final_frameno(clawdata) + 1))
+    missing = sorted(set(expected) - set(framenos))
+    if missing:
+        problems.append('missing frames %s' % missing)
+    t_prev = -np.inf
+    for k, frameno in enumerate(expected):
+        if frameno in missing:
+            continue
+        try:
+            t = check_frame(frameno, outdir, file_prefix)
+        except (IOError, ValueError) as err:
+            problems.append('frame %i: %s' % (frameno, err))
+            continue
+        if times is not None and \
+                not np.isclose(t, times[k], rtol=1e-8, atol=1e-6):
+            problems.append('frame %i at t = %g, expected %g'
+                            % (frameno, t, times[k]))
+        if t <= t_prev:
+            problems.append('frame %i at t = %g is not after the previous '
+                            'frame' % (frameno, t))
+        t_prev = t
+    return problems
+
+
+def is_complete(outdir, clawdata, file_prefix='fort'):
+    """
+    True if the final output frame has been written completely, at the
+    final output time if it is known (not for output_style 3).
+    """
+    try:
+        t = check_frame(final_frameno(clawdata), outdir, file_prefix)
+    except (IOError, ValueError):
+        return False
+    times = output_times(clawdata)
+    return times is None or np.isclose(t, times[-1], rtol=1e-8, atol=1e-6)
+
+
+def _data_lines(fname):
+    """Lines of a .data file, except those setting RESTART_PARAMS."""
+    with open(fname) as f:
+        return [line for line in f
+                if line.partition('=:')[2].split('#')[0].strip()
+                not in RESTART_PARAMS]
+
+
+def same_data(rundir, outdir):
+    """
+    True if outdir holds the same .data files as rundir, apart from the
+    restart parameters, i.e. it was run with the current parameters.
+    """
+    names = sorted(os.path.basename(fname) for fname
+                   in glob.glob(os.path.join(rundir, '*.data')))
+    if names != sorted(os.path.basename(fname) for fname
+                       in glob.glob(os.path.join(outdir, '*.data'))):
+        return False
+    return all(_data_lines(os.path.join(rundir, name))
+               == _data_lines(os.path.join(outdir, name)) for name in names)
+
+
+def remove_checkpoints(outdir):
+    """Remove the checkpoint files of a run with other parameters."""
+    for fname in glob.glob(os.path.join(outdir, 'fort.chk*')) \
+                 + glob.glob(os.path.join(outdir, 'fort.tck*')):
+        os.remove(fname)
+
+
+def restart_file(outdir, clawdata, file_prefix='fort'):
+    """
+    Name (in outdir) of the file to restart from, or None: the newest
+    valid checkpoint, or for 1d codes the newest complete frame.
+    """
+    if clawdata.num_dim == 1:
+        for frameno in reversed(patch_index.frame_numbers(outdir,
+                                                          file_prefix)):
+            try:
+                check_frame(frameno, outdir, file_prefix)
+            except (IOError, ValueError):
+                continue
+            return os.path.basename(frameio.frame_fname(frameno, outdir,
+                                                        file_prefix))
+        return None
+    checkpoints = valid_checkpoints(outdir)
+    if not checkpoints:
+        return None
+    return os.path.basename(checkpoints[-1][1])
+
+
+def ensure_checkpoints(clawdata):
+    """Checkpoint at the output times if the case does not checkpoint."""
+    if clawdata.checkpt_style != 0 or clawdata.num_dim == 1:
+        return
+    times = output_times(clawdata)
+    if times is None:
+        clawdata.checkpt_style = -3
+        clawdata.checkpt_interval = 100
+    else:
+        clawdata.checkpt_style = -2      # alternate between two files
+        clawdata.checkpt_times = [float(t) for t in times
+                                  if clawdata.t0 < t < clawdata.tfinal]
+
+
+def supervise(casedir, outdir='_output', exe=None, nthreads=None,
+              max_restarts=10, setrun_file='setrun.py'):
+    """
+    Run the case in casedir until its final frame is written, restarting
+    from checkpoints.  Returns the list of problems found by check_frames.
+    """
+    casedir = os.path.abspath(casedir)
+    outdir = os.path.join(casedir, outdir)
+    rundir = os.path.join(casedir, '_run_supervised')
+    if exe is None:
+        exe = runtools.build(casedir)
+    nthreads = nthreads or os.cpu_count()
+
+    for attempt in range(max_restarts + 1):
+        rundata = runtools.make_rundata(casedir, setrun_file)
+        clawdata = rundata.clawdata
+        ensure_checkpoints(clawdata)
+        runtools.write_data(rundata, rundir, casedir)
+        restart = None
+        if os.path.isdir(outdir):
+            if not same_data(rundir, outdir):
+                if os.listdir(outdir):
+                    print('%s was run with other .data files, running '
+                          'again from t0' % outdir)
+                remove_checkpoints(outdir)
+            elif is_complete(outdir, clawdata):
+                break
+            else:
+                restart = restart_file(outdir, clawdata)
+        if restart is not None:
+            clawdata.restart = True
+            clawdata.restart_file = restart
+            print('Restarting from %s' % os.path.join(outdir, restart))
+        elif attempt > 0:
+            print('No valid checkpoint found, starting from t0')
+        runtools.write_data(rundata, rundir, casedir)
+        run = runtools.Run(exe, rundir, outdir, nthreads,
+                           append_log=restart is not None)
+        runtools.run_all([run], nthreads)
+        if run.returncode == 0 and is_complete(outdir, clawdata):
+            break
+    else:
+        raise RuntimeError('Run not complete after %i restarts, see %s'
+                           % (max_restarts, os.path.join(outdir, 'run.log')))
+
+    problems = check_frames(outdir, rundata.clawdata)
+    for problem in problems:
+        print('*** %s' % problem)
+    if not problems:
+        print('Run complete, all frames present in %s' % outdir)
+    return problems
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Run a case, restarting from checkpoints until done')
+    parser.add_argument('casedir', nargs='?', default='.')
+    parser.add_argument('--outdir', default='_output')
+    parser.add_argument('--exe', default=None)
+    parser.add_argument('--nthreads', type=int, default=None)
+    parser.add_argument('--max-restarts', type=int, default=10)
+    parser.add_argument('--check', action='store_true',
+                        help='only check the frames of an existing outdir')
+    args = parser.parse_args()
+
+    if args.check:
+        rundata = runtools.make_rundata(args.casedir)
+        outdir = os.path.join(args.casedir, args.outdir)
+        problems = check_frames(outdir, rundata.clawdata)
+        for problem in problems:
+            print('*** %s' % problem)
+        print('%i problems found in %s' % (len(problems), outdir))
+    else:
+        supervise(args.casedir, args.outdir, args.exe, args.nthreads,
+                  args.max_restarts)
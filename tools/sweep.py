@@ -0,0 +1,243 @@
+"""
+Parameter sweeps of a case, e.g. grid-convergence studies of the
+sphere source term.
+
+Every combination of the parameter values is run in its own directory
+sweepdir/run_<key>, where key is a hash of the parameters:
+
+    sweepdir/run_<key>/          .data files of the run
+    sweepdir/run_<key>/_output   output
+    sweepdir/index.json          one entry per run: parameters, status,
+                                 elapsed time, output directory
+
+Runs are executed concurrently by runtools.run_all, largest first (by an
+estimate of the number of cell updates), and combinations already in the
+index with status 'done' are skipped, so a sweep can be extended or
+restarted.  A combination counts as done only if its inputs are unchanged:
+the index records run_cache.RunCache.run_key of its run directory (the
+.data files, the input files they name and the Fortran sources), so
+editing setrun.py, a tuning file it applies or the code reruns it.
+Parameters are attribute paths in rundata, optionally indexed;
+amrdata.refinement_ratios sets the x, y and t ratios together:
+
+    python sweep.py ../2d/nonpolar_axisymmetric --sweepdir _sweep \\
+        --param clawdata.num_cells '[[60,60],[120,120],[240,240]]' \\
+        --param amrdata.refinement_ratios '[[2,2],[4,4]]'
+
+    python sweep.py ../1d/ring --param 'clawdata.num_cells[0]' \\
+        '[900,1800,3600]' --threads-per-run 2
+
+Values are given as JSON.  With --fraction, each run covers only that
+fraction of tfinal (runtools.shorten), e.g. for tuning studies.  From
+Python, use Sweep(casedir, sweepdir).run().
+
+"""
+
+import os
+import re
+import json
+import hashlib
+import itertools
+import numpy as np
+
+import runtools
+import run_cache
+
+INDEX_NAME = 'index.json'
+
+ALIASES = {'amrdata.refinement_ratios': ['amrdata.refinement_ratios_x',
+                                         'amrdata.refinement_ratios_y',
+                                         'amrdata.refinement_ratios_t']}
+
+
+def set_param(rundata, path, value):
+    """Set rundata.<path> = value, e.g. path = 'clawdata.num_cells[0]'."""
+    for path in ALIASES.get(path, [path]):
+        match = re.match(r'^(.*)\[(\d+)\]$', path)
+        names = (match.group(1) if match else path).split('.')
+        obj = rundata
+        for name in names[:-1]:
+            obj = getattr(obj, name)
+        if match:
+            getattr(obj, names[-1])[int(match.group(2))] = value
+        else:
+            setattr(obj, names[-1], value)
+
+
+def param_key(params):
+    """Short hash identifying a combination of parameters."""
+    text = json.dumps(params, sort_keys=True)
+    return hashlib.sha1(text.encode()).hexdigest()[:10]
+
+
+def pareto_front(costs, errors):
+    """
+    Indices of the Pareto-optimal points, those for which no other point
+    has both lower (or equal) cost and lower (or equal) error, sorted by
+    cost.
+    """
+    costs = np.asarray(costs, dtype=float)
+    errors = np.asarray(errors, dtype=float)
+    front = []
+    best_error = np.inf
+    for i in np.lexsort((errors, costs)):
+        if errors[i] < best_error:
+            front.append(int(i))
+            best_error = errors[i]
+    return front
+
+
+def combinations(grid):
+    """List of dictionaries, one per combination of the values in grid."""
+    names = list(grid)
+    return [dict(zip(names, values))
+            for values in itertools.product(*[grid[name] for name in names])]
+
+
+def estimate_cost(rundata):
+    """
+    Rough number of cell updates: level 1 cells times time steps (which
+    grow like the number of cells in one direction), times the refinement
+    ratios to the finest level.
+    """
+    clawdata = rundata.clawdata
+    num_cells = list(clawdata.num_cells)
+    cost = float(np.prod(num_cells)) * max(num_cells)
+    amrdata = getattr(rundata, 'amrdata', None)
+    if amrdata is not None:
+        nlevels = amrdata.amr_levels_max
+        for name in ['refinement_ratios_x', 'refinement_ratios_y',
+                     'refinement_ratios_t'][:clawdata.num_dim] + \
+                    ['refinement_ratios_t']:
+            ratios = getattr(amrdata, name, [])[:nlevels-1]
+            cost *= float(np.prod(ratios)) if len(ratios) else 1.
+    return cost
+
+
+class Sweep(object):
+
+    """
+    A sweep of casedir over a grid of parameters (dictionary of path ->
+    list of values), run in sweepdir, shortened to fraction of tfinal if
+    fraction is given.
+    """
+
+    def __init__(self, casedir, sweepdir='_sweep', grid=None,
+                 setrun_file='setrun.py', fraction=None):
+        self.casedir = os.path.abspath(casedir)
+        self.sweepdir = os.path.abspath(sweepdir)
+        self.grid = grid or {}
+        self.setrun_file = setrun_file
+        self.fraction = fraction
+        self.index_fname = os.path.join(self.sweepdir, INDEX_NAME)
+        self.index = self.read_index()
+
+    def read_index(self):
+        if not os.path.isfile(self.index_fname):
+            return {}
+        with open(self.index_fname) as f:
+            return dict((entry['key'], entry) for entry in json.load(f))
+
+    def write_index(self):
+        tmp = self.index_fname + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(list(self.index.values()), f, indent=1)
+        os.replace(tmp, self.index_fname)
+
+    def key(self, params):
+        if self.fraction is None:
+            return param_key(params)
+        return param_key(dict(params, fraction=self.fraction))
+
+    def is_done(self, key, inputs):
+        """True if key was run successfully with inputs (a run_key)."""
+        entry = self.index.get(key)
+        return entry is not None and entry['status'] == 'done' \
+               and entry.get('inputs') == inputs \
+               and os.path.isdir(entry['outdir'])
+
+    def prepare(self, params, exe, nthreads):
+        """Write the .data files for one combination; returns its Run."""
+        key = self.key(params)
+        rundata = runtools.make_rundata(self.casedir, self.setrun_file)
+        if self.fraction is not None:
+            runtools.shorten(rundata, self.fraction)
+        for path, value in params.items():
+            set_param(rundata, path, value)
+        rundir = os.path.join(self.sweepdir, 'run_%s' % key)
+        runtools.write_data(rundata, rundir, self.casedir)
+        return runtools.Run(exe, rundir, os.path.join(rundir, '_output'),
+                            nthreads, estimate_cost(rundata), key)
+
+    def run(self, exe=None, max_threads=None, threads_per_run=1,
+            cachedir=None):
+        """
+        Run the combinations not already done with the same inputs,
+        restoring those found in run_cache.RunCache(cachedir) if cachedir
+        is given.  Returns failed runs.
+        """
+        os.makedirs(self.sweepdir, exist_ok=True)
+        if exe is None:
+            exe = runtools.build(self.casedir)
+        cache = run_cache.RunCache(cachedir)   # also remembers file hashes
+        runs = []
+        for params in combinations(self.grid):
+            run = self.prepare(params, exe, threads_per_run)
+            inputs = cache.run_key(run.rundir, self.casedir)
+            if self.is_done(run.name, inputs):
+                print('Skipping %s, already done' % params)
+                continue
+            self.index[run.name] = {'key': run.name, 'params': params,
+                                    'inputs': inputs, 'status': 'queued',
+                                    'cost': run.cost, 'elapsed': None,
+                                    'rundir': run.rundir,
+                                    'outdir': run.outdir}
+            runs.append(run)
+        self.write_index()
+
+        def on_finish(run):
+            entry = self.index[run.name]
+            entry['status'] = 'done' if run.returncode == 0 else 'failed'
+            entry['elapsed'] = run.elapsed
+            self.write_index()
+
+        if cachedir is not None:
+            return cache.run_all(runs, self.casedir, max_threads,
+                                 on_finish=on_finish)
+        return runtools.run_all(runs, max_threads, on_finish=on_finish)
+
+    def results(self, status='done'):
+        """Index entries with the given status, e.g. to locate outdirs."""
+        return [entry for entry in self.index.values()
+                if entry['status'] == status]
+
+    def entry(self, params):
+        """Index entry of one combination, or None."""
+        return self.index.get(self.key(params))
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Parameter sweep of a case')
+    parser.add_argument('casedir')
+    parser.add_argument('--sweepdir', default='_sweep')
+    parser.add_argument('--param', nargs=2, action='append', default=[],
+                        metavar=('PATH', 'VALUES'),
+                        help='attribute path in rundata and JSON list')
+    parser.add_argument('--exe', default=None)
+    parser.add_argument('--nthreads', type=int, default=None,
+                        help='total threads (default: all cores)')
+    parser.add_argument('--threads-per-run', type=int, default=1)
+    parser.add_argument('--fraction', type=float, default=None,
+                        help='run only this fraction of tfinal')
+    parser.add_argument('--cache', default=None, metavar='CACHEDIR',
+                        help='reuse runs with identical inputs from here')
+    args = parser.parse_args()
+
+    grid = dict((path, json.loads(values)) for path, values in args.param)
+    sweep = Sweep(args.casedir, args.sweepdir, grid,
+                  fraction=args.fraction)
+    failed = sweep.run(args.exe, args.nthreads, args.threads_per_run,
+                       args.cache)
+    print('%i runs done, %i failed, index in %s'
+          % (len(sweep.results()), len(failed), sweep.index_fname))
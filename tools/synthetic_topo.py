@@ -0,0 +1,556 @@
+"""
+Synthetic topography with the extents, resolutions and formats of the
+topofiles of a case, so that the realistic cases (2d/aasz_butler,
+2d/tohoku) can be benchmarked on machines without the etopo and NCEI DEMs.
+
+The topofiles (and dtopofiles) are taken from the setrun of the case.  The
+extent and spacing of each file come from --spec (JSON, basename ->
+[x1, x2, y1, y2, dx in arcseconds]), from its header if the file exists,
+or from SPECS, which lists the files of the cases (approximate where the
+name does not give the extent).  The elevation is a deterministic function
+of longitude, latitude and --seed, so files that overlap agree:
+
+  - an abyssal plain near -5000 m with abyssal hills,
+  - islands and coasts (FEATURES) where Hawaii, Japan, the Kurils,
+    Kamchatka, the Aleutians, Alaska and the Pacific coasts of Asia and
+    North America are, each with land rising inland, a shelf to -130 m and
+    a continental slope, and a fractal coastline,
+  - bays (BAYS) cut into the islands where the coast must pass through
+    the fine DEMs and fgmax grids of the cases (Hilo and Laupahoehoe on
+    Hawaii, Waihee on Maui), with a coastline only slightly rough,
+  - the Japan, Izu-Bonin, Kuril-Kamchatka and Aleutian trenches,
+  - value noise at the scales the file resolves, with an amplitude
+    depending on depth.
+
+Everything is computed on whole rows of the grid with numpy, a block of
+rows at a time, and ASCII files are formatted by building the fixed-width
+characters as an array, so large 2" and 1/3" tiles take seconds to write.
+Each dtopofile gets an instantaneous uplift and subsidence pair over the
+source region (DTOPO_SPECS).
+
+The 2" and finer files and the fgmax grids of the case must contain both
+wet and dry points, as the real ones do, or the inundation the case
+computes there is not exercised; synthesize checks this (check_coasts)
+and raises ValueError otherwise.
+
+    python tools/synthetic_topo.py 2d/aasz_butler --outdir /scratch/synth
+    export SPHERE_TESTS_DATASETS=/scratch/synth/datasets.json
+
+writes the files to outdir/<data set>/<name> (see datasets.py) and a
+datasets.json that points the data sets of the case there.
+
+"""
+
+import os
+import json
+import numpy as np
+
+import datasets
+
+KM_PER_DEGREE = 111.2
+ABYSS = 5000.           # depth of the abyssal plain (m)
+SHELF_DEPTH = 130.      # depth at the shelf break (m)
+SLOPE_KM = 25.          # e-folding width of the continental slope
+TRENCH_DEPTH = 3000.    # below the abyssal plain
+TRENCH_KM = 35.         # half width of the trenches
+ROWS_PER_BLOCK = 256
+
+# basename -> [x1, x2, y1, y2 (data points, degrees), dx (arcseconds)]
+SPECS = {
+    'etopo1_-180_-110_11_63_1min.asc': [-180., -110., 11., 63., 60.],
+    'etopo1_-200_-180_11_63_1min.asc': [-200., -180., 11., 63., 60.],
+    'hawaii_36s.asc': [-161., -154., 18., 23., 36.],
+    'hawaii_6s.txt': [-160.5, -154.5, 18.5, 22.5, 6.],   # approximate
+    'nw_pacific_3sec_cropped.asc': [-156.6, -156.4, 20.8, 21., 3.],
+    'topo_waihee_W_2s.asc': [-156.56, -156.5, 20.9, 20.98, 2.],
+    'topo_waihee_E_2s.asc': [-156.5, -156.44, 20.88, 20.96, 2.],
+    'topo_waihee_W_13s.asc': [-156.53, -156.5, 20.92, 20.96, 1/3.],
+    'topo_waihee_E_13s.asc': [-156.5, -156.47, 20.91, 20.95, 1/3.],
+    'ncei19_n19x75_w155x00_2021v1_2s.asc': [-155., -154.75, 19.5, 19.75, 2.],
+    'ncei19_n19x75_w155x25_2021v1_2s.asc': [-155.25, -155., 19.5, 19.75,
+                                            2.],
+    'ncei19_n20x00_w155x25_2021v1_2s.asc': [-155.25, -155., 19.75, 20., 2.],
+    'topo_hilo_13s.asc': [-155.1, -155.03, 19.7, 19.77, 1/3.],
+    'topo_hiloN_13s.asc': [-155.26, -155.22, 19.97, 20.01, 1/3.],
+    'etopo1min139E147E34N41N.asc': [139., 147., 34., 41., 60.],
+    'etopo4min120E72W40S60N.asc': [120., 288., -40., 60., 240.],
+    }
+
+# basename -> [x1, x2, y1, y2, dx (arcseconds), strike (degrees from
+# east), uplift (m)]
+DTOPO_SPECS = {
+    'Butler6.tt3': [-170., -158., 51., 56., 60., 25., 8.],
+    'UCSB3.txydz': [140., 146., 35., 41., 120., 75., 6.],
+    }
+
+# Islands and coasts: [lon, lat, semi-axis a, b (km), angle of a (degrees
+# from east), height of the land (m), shelf width (km)].  Land rises
+# inland, the sea floor falls from the coast to the abyssal plain.
+FEATURES = [
+    # Hawaii
+    [-155.5, 19.6, 70., 75., 0., 4200., 3.],
+    [-156.3, 20.8, 40., 20., -20., 3000., 4.],
+    [-156.6, 20.55, 8., 5., 0., 450., 3.],
+    [-156.93, 20.83, 10., 8., 0., 1000., 3.],
+    [-157.0, 21.13, 28., 8., 0., 1500., 4.],
+    [-157.98, 21.47, 30., 20., -40., 1200., 6.],
+    [-159.53, 22.06, 17., 15., 0., 1500., 5.],
+    [-160.15, 21.9, 9., 5., 60., 380., 5.],
+    # Japan
+    [130.8, 32.6, 45., 80., 80., 1700., 25.],
+    [133.4, 33.7, 90., 35., 10., 1900., 20.],
+    [132.5, 34.6, 110., 50., 10., 1300., 20.],
+    [134.8, 35.0, 110., 60., 15., 1500., 20.],
+    [136.8, 35.6, 110., 80., 25., 2500., 25.],
+    [138.5, 36.0, 100., 90., 35., 3000., 25.],
+    [139.8, 36.6, 80., 60., 60., 2000., 30.],
+    [140.3, 38.0, 150., 60., 80., 1800., 25.],
+    [140.6, 40.0, 110., 60., 85., 1700., 20.],
+    [142.8, 43.4, 150., 120., 10., 2000., 25.],
+    # Kurils, Kamchatka
+    [146.5, 44.2, 40., 10., 40., 1000., 5.],
+    [148.5, 45.3, 40., 10., 40., 1000., 5.],
+    [151.0, 46.6, 40., 8., 40., 1000., 5.],
+    [153.5, 48.2, 40., 8., 45., 1000., 5.],
+    [156.0, 50.2, 40., 10., 55., 1000., 5.],
+    [159.0, 55.5, 130., 450., 20., 2500., 20.],
+    # Aleutians, Alaska
+    [172.9, 52.9, 40., 12., 10., 700., 5.],
+    [178.0, 51.8, 50., 12., 0., 1000., 5.],
+    [-176.5, 51.9, 60., 12., 0., 1200., 5.],
+    [-171.5, 52.5, 60., 12., 15., 1200., 5.],
+    [-167.0, 53.6, 80., 20., 25., 1800., 10.],
+    [-162.5, 55.2, 150., 40., 30., 1500., 20.],
+    [-156.0, 57.5, 250., 70., 35., 1500., 40.],
+    [-153.5, 57.5, 60., 30., 45., 1000., 20.],
+    [-152.0, 63.0, 700., 380., 0., 1500., 60.],
+    [-140.0, 61.5, 450., 150., -15., 3500., 30.],
+    # North America
+    [-131.0, 56.5, 250., 300., -45., 2000., 25.],
+    [-126.0, 50.5, 230., 250., -40., 2000., 25.],
+    [-118.5, 44.0, 450., 350., -20., 1800., 40.],
+    [-114.5, 35.5, 400., 400., -40., 1500., 40.],
+    [-110.5, 27.5, 350., 300., -40., 1500., 50.],
+    # Asia
+    [115.0, 33.0, 600., 900., 60., 800., 150.],
+    [127.8, 37.0, 130., 280., 10., 800., 60.],
+    [121.0, 23.7, 60., 170., 15., 2500., 20.],
+    [137.0, 47.0, 400., 350., 30., 1200., 50.],
+    [141.5, 50.0, 60., 400., 85., 800., 30.],
+    ]
+
+# Bays: [lon, lat, semi-axis a, b (km), angle of a, height of the land
+# around them (m), shelf width (km), roughness of the coast (km)].  The
+# sea inside the ellipse and the land rising around it replace the
+# elevation of FEATURES where they are lower.  Each circle passes through
+# two points on the real coast, in the fine DEMs of the cases:
+BAYS = [
+    # Hamakua coast, through Hilo (fgmax grid 1 of aasz_butler) and
+    # Laupahoehoe (fgmax grid 2):
+    [-154.821, 20.071, 45., 45., 0., 4200., 5., 0.15],
+    # north shore of West Maui at Waihee:
+    [-156.436, 21.104, 20., 20., 0., 1000., 5., 0.1],
+    ]
+
+FINE_ARCSEC = 2.        # files this fine must have wet and dry points
+
+TRENCHES = [
+    [[144.5, 41.5], [144.3, 40.0], [144.0, 38.0], [143.2, 36.0],
+     [142.2, 34.0], [142.5, 30.0], [142.7, 25.0]],
+    [[145.5, 41.8], [148.5, 43.0], [152.0, 45.3], [155.0, 47.5],
+     [158.5, 50.5], [161.5, 53.5], [163.5, 55.5]],
+    [[168.0, 52.5], [175.0, 50.5], [-178.0, 50.2], [-172.0, 50.8],
+     [-165.0, 52.0], [-158.0, 54.0], [-152.0, 56.0], [-148.0, 58.3]],
+    ]
+
+OCTAVES = [4., 1., 0.25, 0.06, 0.015, 0.004, 0.001, 0.00025, 0.00006]
+
+
+def _wrap(dlon):
+    """Longitude differences in [-180, 180)."""
+    return (dlon + 180.) % 360. - 180.
+
+
+def _hash(ix, iy, seed):
+    """Pseudo-random values in [-1, 1) of integer lattice points."""
+    mask = 2**64 - 1
+    h = ix.astype(np.int64).view(np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+    h = h ^ (iy.astype(np.int64).view(np.uint64)
+             * np.uint64(0xC2B2AE3D27D4EB4F))
+    h ^= np.uint64((seed * 0x165667B19E3779F9 + 0x27D4EB2F165667C5) & mask)
+    h ^= h >> np.uint64(31)
+    h *= np.uint64(0xBF58476D1CE4E5B9)
+    h ^= h >> np.uint64(29)
+    h *= np.uint64(0x94D049BB133111EB)
+    h ^= h >> np.uint64(32)
+    return (h >> np.uint64(11)).astype(np.float64) * 2.**-52 - 1.
+
+
+def value_noise(lon, lat, spacing, seed):
+    """
+    Smooth noise of lattice spacing (degrees) on the grid lon x lat: the
+    hashes of the lattice points are interpolated, first along the rows of
+    the lattice and then between them.
+    """
+    gx, gy = lon / spacing, lat / spacing
+    x0, y0 = np.floor(gx.min()), np.floor(gy.min())
+    ix = (np.floor(gx) - x0).astype(int)
+    iy = (np.floor(gy) - y0).astype(int)
+    fx, fy = gx - np.floor(gx), gy - np.floor(gy)
+    fx = fx * fx * (3 - 2 * fx)
+    fy = (fy * fy * (3 - 2 * fy))[:, None]
+    lattice = _hash(x0 + np.arange(ix.max() + 2)[None, :],
+                    y0 + np.arange(iy.max() + 2)[:, None], seed)
+    rows = lattice[:, ix] * (1 - fx) + lattice[:, ix + 1] * fx
+    return rows[iy] * (1 - fy) + rows[iy + 1] * fy
+
+
+def fractal_noise(lon, lat, delta, seed, octaves=OCTAVES, largest=None):
+    """
+    Sum of value noise over the octaves between largest and twice the grid
+    spacing delta, with amplitude proportional to spacing**0.8, scaled so
+    that the largest octave has amplitude 1.
+    """
+    octaves = [s for s in octaves if s >= 2 * delta
+               and (largest is None or s <= largest)]
+    if not octaves:
+        return np.zeros((len(lat), len(lon)))
+    z = 0.
+    for k, spacing in enumerate(octaves):
+        z = z + (spacing / octaves[0])**0.8 \
+                * value_noise(lon, lat, spacing, seed + k)
+    return z
+
+
+def _local_km(lon, lat, lon0, lat0):
+    """East and north distances (km) of the grid from (lon0, lat0)."""
+    east = _wrap(lon - lon0)[None, :] * KM_PER_DEGREE \
+           * np.cos(np.radians(lat))[:, None]
+    north = np.repeat(((lat - lat0) * KM_PER_DEGREE)[:, None], len(lon), 1)
+    return east, north
+
+
+def _window(lon, lat, lon0, lat0, radius):
+    """
+    Slices of the rows and columns of the grid that may be within radius
+    (km) of (lon0, lat0), or None if there are none.
+    """
+    rows = np.nonzero(np.abs(lat - lat0) * KM_PER_DEGREE <= radius)[0]
+    if not len(rows):
+        return None
+    coslat = np.cos(np.radians(min(np.abs(lat[rows]).min(), 80.)))
+    cols = np.nonzero(np.abs(_wrap(lon - lon0)) * KM_PER_DEGREE * coslat
+                      <= radius)[0]
+    if not len(cols):
+        return None
+    return (slice(rows[0], rows[-1] + 1), slice(cols[0], cols[-1] + 1))
+
+
+def _ellipse_distance(lon, lat, window, feature):
+    """
+    Signed distance (km, negative inside) of the window of the grid from
+    the boundary of the ellipse of a feature, along the rays from its
+    center.
+    """
+    lon0, lat0, a, b, angle = feature[:5]
+    rows, cols = window
+    east, north = _local_km(lon[cols], lat[rows], lon0, lat0)
+    c, s = np.cos(np.radians(angle)), np.sin(np.radians(angle))
+    u, v = c * east + s * north, -s * east + c * north
+    r = np.hypot(u, v)
+    rho = np.hypot(u / a, v / b)
+    r_coast = np.divide(r, rho, out=np.full_like(r, min(a, b)),
+                        where=rho > 0)
+    return r - r_coast
+
+
+def coast_profile(d, height, shelf, scale):
+    """Elevation at signed distance d (km, negative inland) from a coast."""
+    land = height * (1 - np.exp(np.minimum(d, 0) / scale))
+    sea = np.where(d < shelf, -SHELF_DEPTH * np.maximum(d, 0) / shelf,
+                   -SHELF_DEPTH - (ABYSS - SHELF_DEPTH)
+                   * (1 - np.exp(-(d - shelf) / SLOPE_KM)))
+    return np.where(d < 0, land, sea)
+
+
+def trench_distance(lon, lat, polyline, dist):
+    """
+    Minimum of dist and the distance (km) of the grid from a polyline of
+    (lon, lat) points, in place.
+    """
+    for (lon1, lat1), (lon2, lat2) in zip(polyline[:-1], polyline[1:]):
+        length = KM_PER_DEGREE * np.hypot(_wrap(lon2 - lon1), lat2 - lat1)
+        window = _window(lon, lat, lon1, lat1, 3 * TRENCH_KM + length)
+        if window is None:
+            continue
+        rows, cols = window
+        east, north = _local_km(lon[cols], lat[rows], lon1, lat1)
+        sx = _wrap(lon2 - lon1) * KM_PER_DEGREE * np.cos(np.radians(lat1))
+        sy = (lat2 - lat1) * KM_PER_DEGREE
+        t = np.clip((east * sx + north * sy) / (sx**2 + sy**2), 0, 1)
+        dist[rows, cols] = np.minimum(dist[rows, cols],
+                                      np.hypot(east - t * sx,
+                                               north - t * sy))
+    return dist
+
+
+def elevation(lon, lat, seed=0):
+    """Synthetic elevation Z[j, i] (m) at (lon[i], lat[j])."""
+    delta = max(abs(lon[1] - lon[0]) if len(lon) > 1 else 1.,
+                abs(lat[1] - lat[0]) if len(lat) > 1 else 1.)
+    hills = fractal_noise(lon, lat, delta, seed + 100, largest=1.)
+    z = -ABYSS + 250. * hills
+    coast = None
+    for feature in FEATURES:
+        lon0, lat0, a, b, angle, height, shelf = feature
+        window = _window(lon, lat, lon0, lat0,
+                         max(a, b) + shelf + 6 * SLOPE_KM)
+        if window is None:
+            continue
+        if coast is None:
+            coast = fractal_noise(lon, lat, delta, seed + 200, largest=0.25)
+        rows, cols = window
+        d = _ellipse_distance(lon, lat, window, feature) \
+            + 0.05 * min(a, b) * coast[rows, cols]
+        z[rows, cols] = np.maximum(z[rows, cols],
+                                   coast_profile(d, height, shelf,
+                                                 min(a, b) / 3.))
+    for bay in BAYS:
+        lon0, lat0, a, b, angle, height, shelf, roughness = bay
+        window = _window(lon, lat, lon0, lat0, max(a, b) + 6 * SLOPE_KM)
+        if window is None:
+            continue
+        if coast is None:
+            coast = fractal_noise(lon, lat, delta, seed + 200, largest=0.25)
+        rows, cols = window
+        # the sea is inside, so the distance from the coast is reversed:
+        d = roughness * coast[rows, cols] \
+            - _ellipse_distance(lon, lat, window, bay)
+        z[rows, cols] = np.minimum(z[rows, cols],
+                                   coast_profile(d, height, shelf,
+                                                 min(a, b) / 3.))
+    dist = np.full(z.shape, np.inf)
+    for polyline in TRENCHES:
+        trench_distance(lon, lat, polyline, dist)
+    deep = np.clip((-z - 3000.) / 1500., 0, 1)
+    z = z - TRENCH_DEPTH * deep * np.exp(-(dist / TRENCH_KM)**2)
+    amplitude = np.clip(0.2 * np.abs(z), 2., 300.)
+    z = z + amplitude * fractal_noise(lon, lat, delta, seed + 300,
+                                      largest=0.06)
+    return z
+
+
+def format_values(Z, decimals=2, sep=' ', end='\n'):
+    """
+    Text of the rows of Z, each value right aligned in a fixed width with
+    the given decimals, built as an array of characters.
+    """
+    scale = 10**decimals
+    v = np.rint(np.abs(Z) * scale).astype(np.int64)
+    ipart, frac = v // scale, v % scale
+    nint = len(str(int(ipart.max()))) if ipart.size else 1
+    width = 1 + nint + (1 + decimals if decimals else 0) + 1
+    out = np.full(Z.shape + (width,), ord(' '), dtype=np.uint8)
+    pos = width - 2
+    for k in range(decimals):
+        out[..., pos] = ord('0') + frac % 10
+        frac //= 10
+        pos -= 1
+    if decimals:
+        out[..., pos] = ord('.')
+        pos -= 1
+    ndigits = np.ones(Z.shape, dtype=np.int64)
+    rest = ipart.copy()
+    for k in range(nint):
+        digit = ord('0') + rest % 10
+        if k == 0:
+            out[..., pos] = digit
+        else:
+            out[..., pos] = np.where(ipart >= 10**k, digit, ord(' '))
+            ndigits += ipart >= 10**k
+        rest //= 10
+        pos -= 1
+    rows, cols = np.nonzero((Z < 0) & (v > 0))
+    out[rows, cols, pos + nint - ndigits[rows, cols]] = ord('-')
+    out[..., -1] = ord(sep)
+    out[:, -1, -1] = ord(end)
+    return out.tobytes()
+
+
+def grid(spec):
+    """Data point coordinates x, y (ascending) of a spec."""
+    x1, x2, y1, y2, arcsec = spec[:5]
+    delta = arcsec / 3600.
+    mx = int(round((x2 - x1) / delta)) + 1
+    my = int(round((y2 - y1) / delta)) + 1
+    return x1 + delta * np.arange(mx), y1 + delta * np.arange(my)
+
+
+def write_topo(fname, topo_type, spec, seed=0, rows_per_block=ROWS_PER_BLOCK):
+    """Write synthetic topography of spec to fname as topo_type 2, 3 or 4."""
+    x, y = grid(spec)
+    delta = spec[4] / 3600.
+    if topo_type == 4:
+        import topo_cache
+        topo_cache.write_netcdf(fname, x, y, elevation(x, y, seed),
+                                source='synthetic_topo.py seed %i' % seed)
+        return
+    if abs(topo_type) not in (2, 3):
+        raise ValueError('Cannot write topo_type %s' % topo_type)
+    sign = -1 if topo_type < 0 else 1
+    with open(fname, 'wb') as f:
+        f.write(('%i ncols\n%i nrows\n%.12f xllcenter\n%.12f yllcenter\n'
+                 '%.15g cellsize\n-99999 nodata_value\n'
+                 % (len(x), len(y), x[0], y[0], delta)).encode())
+        for j2 in range(len(y), 0, -rows_per_block):   # north to south
+            j1 = max(j2 - rows_per_block, 0)
+            Z = elevation(x, y[j1:j2], seed)[::-1]
+            if abs(topo_type) == 2:
+                f.write(format_values(sign * Z, sep='\n'))
+            else:
+                f.write(format_values(sign * Z))
+
+
+def write_dtopo(fname, dtopo_type, spec, times=(0., 1.)):
+    """
+    Write an instantaneous uplift and subsidence pair (the deformation of
+    a thrust fault) over the extent of spec, with the strike and uplift of
+    spec, as a dtopo file of dtopo_type 1 or 3.
+    """
+    from clawpack.geoclaw import dtopotools
+    x, y = grid(spec)
+    strike, uplift = spec[5], spec[6]
+    lon0, lat0 = 0.5 * (x[0] + x[-1]), 0.5 * (y[0] + y[-1])
+    east, north = _local_km(x, y, lon0, lat0)
+    c, s = np.cos(np.radians(strike)), np.sin(np.radians(strike))
+    along, across = c * east + s * north, -s * east + c * north
+    length = 0.4 * min(east.max() - east.min(), north.max() - north.min()) \
+             / max(abs(c), abs(s))
+    taper = np.exp(-(along / length)**4)
+    dZ = uplift * taper * (np.exp(-((across + 30.) / 30.)**2)
+                           - 0.4 * np.exp(-((across - 50.) / 40.)**2))
+    dtopo = dtopotools.DTopography()
+    dtopo.X, dtopo.Y = np.meshgrid(x, y)
+    dtopo.times = np.array(times)
+    dtopo.dZ = np.array([dZ * (t > times[0]) for t in times])
+    dtopo.write(fname, dtopo_type)
+
+
+def read_spec(fname, topo_type):
+    """Spec of an existing topofile of type 2 or 3 from its header."""
+    import topo_cache
+    with open(fname) as f:
+        mx, my, x, y, nodata = topo_cache.read_header(f)
+    return [x[0], x[-1], y[0], y[-1], (x[1] - x[0]) * 3600.]
+
+
+def check_coasts(extents, seed=0, npoints=500):
+    """
+    Names of the extents (dictionary name -> [x1, x2, y1, y2]) where the
+    synthetic elevation, sampled on npoints x npoints points, is not both
+    below and above sea level somewhere.
+    """
+    missing = []
+    for name, (x1, x2, y1, y2) in sorted(extents.items()):
+        z = elevation(np.linspace(x1, x2, npoints),
+                      np.linspace(y1, y2, npoints), seed)
+        if not ((z < 0).any() and (z > 0).any()):
+            missing.append(name)
+    return missing
+
+
+def dataset_of(fname, config=None):
+    """Name of the data set whose directory contains fname, or None."""
+    dirname = os.path.dirname(os.path.abspath(fname))
+    for name in sorted(datasets.DATASETS):
+        if os.path.abspath(datasets.directory(name, config)) == dirname:
+            return name
+    return None
+
+
+def synthesize(rundata, outdir, seed=0, specs=None):
+    """
+    Write synthetic versions of the topo and dtopo files of rundata to
+    outdir/<data set>/ and outdir/datasets.json.  Returns the list of
+    (source name, written file).
+    """
+    specs = dict(SPECS, **(specs or {}))
+    specs.update((name, spec) for name, spec in DTOPO_SPECS.items()
+                 if name not in specs)
+    outdir = os.path.abspath(outdir)
+    config = datasets.load_config()
+    written = []
+    paths = {}
+    files = [(topofile[0], topofile[-1], False)
+             for topofile in rundata.topo_data.topofiles] \
+            + [(dtopofile[0], dtopofile[-1], True)
+               for dtopofile in rundata.dtopo_data.dtopofiles]
+    file_specs = []
+    for file_type, fname, is_dtopo in files:
+        name = os.path.basename(fname)
+        if name in specs:
+            spec = specs[name]
+        elif os.path.isfile(fname) and abs(file_type) in (2, 3) \
+                and not is_dtopo:
+            spec = read_spec(fname, file_type)
+        else:
+            raise ValueError('No extent and resolution known for %s, '
+                             'give it with --spec' % name)
+        file_specs.append(spec)
+
+    # the fine files and the fgmax grids must have a coast:
+    extents = dict((os.path.basename(fname), spec[:4]) for spec,
+                   (file_type, fname, is_dtopo) in zip(file_specs, files)
+                   if not is_dtopo and spec[4] <= FINE_ARCSEC)
+    fgmax_data = getattr(rundata, 'fgmax_data', None)
+    for k, fg in enumerate(getattr(fgmax_data, 'fgmax_grids', None) or []):
+        if fg.point_style == 2:
+            extents['fgmax grid %i' % (k + 1)] = [fg.x1, fg.x2, fg.y1, fg.y2]
+    missing = check_coasts(extents, seed)
+    if missing:
+        raise ValueError('No wet and dry points in %s, see BAYS'
+                         % ', '.join(missing))
+
+    for (file_type, fname, is_dtopo), spec in zip(files, file_specs):
+        name = os.path.basename(fname)
+        dataset = dataset_of(fname, config) or 'other'
+        dest = os.path.join(outdir, dataset, name)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        print('Writing %s' % dest)
+        if is_dtopo:
+            write_dtopo(dest, file_type, spec)
+        else:
+            write_topo(dest, file_type, spec, seed)
+        written.append((fname, dest))
+        if dataset != 'other':
+            paths[dataset] = os.path.dirname(dest)
+    with open(os.path.join(outdir, 'datasets.json'), 'w') as f:
+        json.dump({'datasets': dict((name, {'path': path})
+                                    for name, path in paths.items())},
+                  f, indent=1)
+    return written
+
+
+if __name__ == '__main__':
+    import argparse
+    import runtools
+    import topo_crop
+    import topo_cache
+    parser = argparse.ArgumentParser(
+        description='Synthetic topo and dtopo files for the files of a case')
+    parser.add_argument('casedir', nargs='?', default='.')
+    parser.add_argument('--outdir', default='_synthetic_topo')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--spec', default=None,
+                        help='JSON: basename -> [x1, x2, y1, y2, '
+                             'arcseconds, ...]')
+    args = parser.parse_args()
+
+    # the file names of setrun, not cropped or converted copies:
+    os.environ[topo_crop.ENABLE] = '0'
+    os.environ[topo_cache.ENABLE] = '0'
+    rundata = runtools.make_rundata(args.casedir)
+    specs = json.loads(args.spec) if args.spec else None
+    synthesize(rundata, args.outdir, args.seed, specs)
+    print('To use them: export SPHERE_TESTS_DATASETS=%s'
+          % os.path.join(os.path.abspath(args.outdir), 'datasets.json'))
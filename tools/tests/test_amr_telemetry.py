@@ -0,0 +1,46 @@
+"""
+Tests of the fort.amr parser of amr_telemetry.py:
+
+    python -m pytest tools/tests
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import amr_telemetry
+
+# Lines as written by amrclaw: setgrd.f at t0, regrid.f afterwards.
+FORT_AMR = """\
+Gridding level   2 at t =  0.000000E+00:     1 grids with         400 cells
+ AMRCLAW: level  1  CFL = .412E+00  dt = 0.1000E+02  final t = 0.100000E+02
+Regridding level   2 at t =  0.123456E+03:     5 grids with        1234 cells
+Regridding level   3 at t =  0.123456E+03:    12 grids with       56789 cells
+"""
+
+
+def test_regridding_lines(tmpdir):
+    fname = str(tmpdir.join('fort.amr'))
+    with open(fname, 'w') as f:
+        f.write(FORT_AMR)
+    info = amr_telemetry.parse_fort_amr(fname)
+    regrids = info['regrids']
+    assert list(regrids['level']) == [2, 2, 3]
+    assert list(regrids['t']) == [0., 123.456, 123.456]
+    assert list(regrids['ngrids']) == [1, 5, 12]
+    assert list(regrids['ncells']) == [400, 1234, 56789]
+    assert len(info['steps']) == 1
+
+
+def test_enable():
+    class AmrData(object):
+        tprint = False
+        verbosity_regrid = 0
+        amr_levels_max = 4
+
+    class RunData(object):
+        amrdata = AmrData()
+
+    rundata = amr_telemetry.enable(RunData())
+    assert rundata.amrdata.tprint
+    assert rundata.amrdata.verbosity_regrid == 4
@@ -0,0 +1,58 @@
+"""
+Tests of the spatial queries of patch_index.py on a small binary frame:
+
+    python -m pytest tools/tests
+"""
+
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import frameio
+from patch_index import PatchIndex
+
+# patch, level, xlow, xhigh, ylow, yhigh, mx, my
+PATCHES = [(1, 1, -60., 60., -60., 60., 12, 12),
+           (2, 2, -30., 0., -20., 10., 12, 12),
+           (3, 2, 5., 35., 0., 30., 12, 12),
+           (4, 3, -25., -15., -15., -5., 16, 16)]
+
+
+def write_frame(outdir, frameno=0):
+    tinfo = {'t': 0., 'num_eqn': 1, 'num_patches': len(PATCHES),
+             'num_aux': 0, 'num_dim': 2, 'num_ghost': 2,
+             'file_format': 'binary64'}
+    frameio.write_t(frameio.frame_fname(frameno, outdir, kind='t'), tinfo)
+    qname = frameio.frame_fname(frameno, outdir, kind='q')
+    bname = frameio.frame_fname(frameno, outdir, kind='b')
+    with open(qname, 'w') as qf, open(bname, 'wb') as bf:
+        for patch, level, x1, x2, y1, y2, mx, my in PATCHES:
+            record = np.zeros((), dtype=frameio.PATCH_DTYPE)
+            record['patch'], record['level'] = patch, level
+            record['mx'], record['my'] = mx, my
+            record['xlow'], record['ylow'] = x1, y1
+            record['dx'], record['dy'] = (x2 - x1) / mx, (y2 - y1) / my
+            frameio.write_header(qf, record, 2)
+            frameio.write_binary_data(bf, np.full((1, mx, my), patch), 2)
+
+
+def test_points_on_patch_edges(tmpdir):
+    outdir = str(tmpdir)
+    write_frame(outdir)
+    pindex = PatchIndex(0, outdir=outdir)
+    points = [(-10., -20.), (-60., -60.), (-30., 10.), (0., 0.),
+              (5., 0.), (-25., -15.), (-15., -5.), (0., -20.), (59., 59.)]
+    for x, y in points:
+        patches = list(pindex.query_point(x, y)['patch'])
+        row = pindex.finest_containing(x, y)[0]
+        finest = pindex.records['patch'][row]
+        assert finest in patches, (x, y, patches, finest)
+        assert max(patches) == finest
+    assert list(pindex.query_point(-10., -20.)['patch']) == [1, 2]
+    assert list(pindex.query_point(-60., -60.)['patch']) == [1]
+    assert list(pindex.query_point(-25., -15.)['patch']) == [1, 2, 4]
+    # upper edges are outside, as in finest_containing
+    assert list(pindex.query_point(0., -20.)['patch']) == [1]
+    assert len(pindex.query_point(60., 0.)) == 0
+    assert pindex.finest_containing(60., 0.)[0] == -1
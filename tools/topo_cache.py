@@ -0,0 +1,275 @@
+"""
+Cache of ASCII topography files converted to a binary format, so that
+neither the solver nor Python has to parse large DEMs on every run.
+
+Each topofile of type 1, 2 or 3 (e.g. the etopo and 2" / 1/3" DEMs of
+2d/aasz_butler, or etopo4min120E72W40S60N.asc of 2d/tohoku) is converted
+once to a NetCDF file: a short header, coordinate variables lon and lat
+(ascending, at the data points) and a contiguous 2d array z(lat, lon).
+This is GeoClaw topo_type 4, so the solver reads it with a few large
+reads instead of formatted input, and Python maps z into memory lazily
+(load).  Values equal to the nodata value of the header are replaced by
+topo_missing, as the solver does when it reads the ASCII file, and
+topo_type < 0 (positive down) is converted to positive up.
+
+The converted files are stored in cachedir/<key>_<name>.nc, where key is
+a hash of the content of the source file (run_cache.RunCache.content_hash,
+so it is computed only once per file) and of the conversion settings.
+The default cachedir is $SPHERE_TESTS_TOPO_CACHE or
+~/.cache/sphere_tests/topo.
+
+Reading topo_type 4 requires an executable built with NetCDF:
+
+    export SPHERE_TESTS_NETCDF_TOPO=1
+    make new        # adds -DNETCDF and the flags of nf-config
+    make .output    # setrun replaces the ASCII topofiles by cached ones
+
+and the files can be converted in advance with
+
+    python ../../tools/topo_cache.py .
+
+or, for given files, python tools/topo_cache.py --files 3 DEM.asc ...
+
+"""
+
+import os
+import hashlib
+import numpy as np
+from scipy.io import netcdf_file
+
+import run_cache
+
+CACHE_DIR = os.environ.get('SPHERE_TESTS_TOPO_CACHE',
+                           os.path.join(os.path.expanduser('~'), '.cache',
+                                        'sphere_tests', 'topo'))
+ENABLE = 'SPHERE_TESTS_NETCDF_TOPO'
+VERSION = 1     # of the conversion, part of the key
+
+_CHUNK = 2**25  # characters of ASCII data parsed at a time
+
+
+def enabled():
+    """True if setrun should use the cached NetCDF files."""
+    return os.environ.get(ENABLE, '0') not in ('', '0')
+
+
+def _header_value(line):
+    """The first number on a header line (value and label in any order)."""
+    values = []
+    for token in line.split():
+        try:
+            values.append(float(token))
+        except ValueError:
+            pass
+    if not values:
+        raise IOError('No value on topo header line: %s' % line)
+    return values
+
+
+def read_header(f):
+    """
+    Read the 6 line header of a topo_type 2 or 3 file from the open file
+    f.  Returns mx, my, x, y (data locations) and the nodata value.
+    """
+    lines = [f.readline() for k in range(6)]
+    mx = int(_header_value(lines[0])[0])
+    my = int(_header_value(lines[1])[0])
+    xll = _header_value(lines[2])[0]
+    yll = _header_value(lines[3])[0]
+    delta = _header_value(lines[4])
+    dx = delta[0]
+    dy = delta[1] if len(delta) > 1 else dx
+    if 'xllcorner' in lines[2].lower():
+        xll += 0.5 * dx
+    if 'yllcorner' in lines[3].lower():
+        yll += 0.5 * dy
+    nodata = _header_value(lines[5])[0]
+    x = xll + dx * np.arange(mx)
+    y = yll + dy * np.arange(my)
+    return mx, my, x, y, nodata
+
+
+def _read_values(f, out):
+    """
+    Parse whitespace separated numbers from f into the flat array out,
+    _CHUNK characters at a time.  Returns the number of values read.
+    """
+    n = 0
+    rest = ''
+    while n < len(out):
+        text = f.read(_CHUNK)
+        if not text:
+            text, rest = rest, ''
+            if not text.strip():
+                break
+        else:
+            text = rest + text
+            cut = max(text.rfind(' '), text.rfind('\n'))
+            if cut < 0:
+                rest = text
+                continue
+            text, rest = text[:cut], text[cut:]
+        values = np.fromstring(text, sep=' ')
+        m = min(len(values), len(out) - n)
+        out[n:n + m] = values[:m]
+        n += m
+    return n
+
+
+def read_ascii(fname, topo_type):
+    """
+    Read an ASCII topofile of type 1, 2 or 3 (or negative).  Returns x, y
+    (ascending), Z[j, i] at (x[i], y[j]) and the nodata value (None for
+    type 1).
+    """
+    with open(fname) as f:
+        if abs(topo_type) == 1:
+            values = np.fromstring(f.read(), sep=' ').reshape(-1, 3)
+            x = np.unique(values[:, 0])
+            y = np.unique(values[:, 1])
+            Z = values[:, 2].reshape(len(y), len(x))
+            if values[0, 1] > values[-1, 1]:
+                Z = Z[::-1]
+            return x, y, np.ascontiguousarray(Z), None
+        elif abs(topo_type) in (2, 3):
+            mx, my, x, y, nodata = read_header(f)
+            Z = np.empty((my, mx))
+            n = _read_values(f, Z.reshape(-1))
+            if n < mx * my:
+                raise IOError('%s: expected %i values, found %i'
+                              % (fname, mx * my, n))
+            return x, y, Z[::-1], nodata
+    raise ValueError('Cannot convert topo_type %s' % topo_type)
+
+
+def write_netcdf(fname, x, y, Z, dtype='d', **attributes):
+    """Write topo_type 4 (dimensions and variables lon, lat and z)."""
+    tmp = fname + '.tmp'
+    with netcdf_file(tmp, 'w', version=2) as f:
+        for name, value in attributes.items():
+            setattr(f, name, value)
+        f.createDimension('lon', len(x))
+        f.createDimension('lat', len(y))
+        lon = f.createVariable('lon', 'd', ('lon',))
+        lon[:] = x
+        lon.units = 'degrees_east'
+        lat = f.createVariable('lat', 'd', ('lat',))
+        lat[:] = y
+        lat.units = 'degrees_north'
+        z = f.createVariable('z', dtype, ('lat', 'lon'))
+        z[:] = Z
+        z.units = 'meters'
+        z.positive = 'up'
+    os.replace(tmp, fname)
+
+
+class TopoCache(object):
+
+    """Converted topofiles in cachedir, keyed by source content."""
+
+    def __init__(self, cachedir=None):
+        self.cachedir = os.path.abspath(cachedir or CACHE_DIR)
+        os.makedirs(self.cachedir, exist_ok=True)
+        self._hashes = run_cache.RunCache(self.cachedir)
+
+    def path(self, fname, topo_type, topo_missing=99999., dtype='d'):
+        """Name of the converted file for these settings."""
+        sha1 = hashlib.sha1(('%s %s %r %s %i' % (
+            self._hashes.content_hash(fname), topo_type, topo_missing, dtype,
+            VERSION)).encode())
+        name = os.path.splitext(os.path.basename(fname))[0]
+        return os.path.join(self.cachedir,
+                            '%s_%s.nc' % (sha1.hexdigest()[:16], name))
+
+    def convert(self, fname, topo_type, topo_missing=99999., dtype='d'):
+        """Path of the converted file, converting fname if needed."""
+        path = self.path(fname, topo_type, topo_missing, dtype)
+        if os.path.isfile(path):
+            return path
+        print('Converting %s to %s' % (fname, path))
+        x, y, Z, nodata = read_ascii(fname, topo_type)
+        if nodata is not None:
+            missing = Z == nodata
+            if missing.any():
+                print('*** %i missing data values in %s set to '
+                      'topo_missing = %g' % (missing.sum(), fname,
+                                             topo_missing))
+                Z[missing] = topo_missing
+        if topo_type < 0:
+            Z = -Z
+        write_netcdf(path, x, y, Z, dtype, source=os.path.abspath(fname),
+                     source_topo_type=topo_type)
+        return path
+
+    def topofiles(self, topofiles, topo_missing=99999., dtype='d'):
+        """
+        Copy of a list of topofiles (rundata.topo_data.topofiles) with the
+        ASCII ones replaced by the converted files, as topo_type 4.
+        """
+        result = []
+        for topofile in topofiles:
+            topo_type, fname = topofile[0], topofile[-1]
+            if abs(topo_type) in (1, 2, 3):
+                topofile = [4] + list(topofile[1:-1]) \
+                           + [self.convert(fname, topo_type, topo_missing,
+                                           dtype)]
+            result.append(topofile)
+        return result
+
+
+def use_cache(rundata, cachedir=None):
+    """
+    If enabled() replace the ASCII topofiles of rundata by the cached
+    NetCDF files, converting them if needed.  Called at the end of setrun.
+    """
+    if enabled():
+        topo_data = rundata.topo_data
+        topo_data.topofiles = TopoCache(cachedir).topofiles(
+            topo_data.topofiles, topo_data.topo_missing)
+    return rundata
+
+
+def load(fname):
+    """
+    Topography object of a converted file whose Z is mapped into memory:
+    nothing is read until Z is indexed.
+    """
+    from clawpack.geoclaw import topotools
+    f = netcdf_file(fname, 'r', mmap=True)
+    topo = topotools.Topography(topo_type=4)
+    topo.path = fname
+    topo._x = np.array(f.variables['lon'][:])
+    topo._y = np.array(f.variables['lat'][:])
+    topo._Z = f.variables['z'].data
+    topo._netcdf_file = f   # keeps the mapping open
+    return topo
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Convert ASCII topofiles to cached NetCDF files')
+    parser.add_argument('casedir', nargs='?', default=None,
+                        help='convert the topofiles of this case')
+    parser.add_argument('--files', nargs='+', default=[],
+                        metavar='TOPO_TYPE FNAME',
+                        help='pairs of topo_type and file name')
+    parser.add_argument('--cachedir', default=None)
+    parser.add_argument('--topo-missing', type=float, default=99999.)
+    parser.add_argument('--float32', action='store_true',
+                        help='store z in single precision')
+    args = parser.parse_args()
+
+    topofiles = [[int(topo_type), fname] for topo_type, fname
+                 in zip(args.files[::2], args.files[1::2])]
+    topo_missing = args.topo_missing
+    if args.casedir is not None:
+        import runtools
+        os.environ[ENABLE] = '0'
+        rundata = runtools.make_rundata(args.casedir)
+        topofiles += rundata.topo_data.topofiles
+        topo_missing = rundata.topo_data.topo_missing
+    cache = TopoCache(args.cachedir)
+    for topofile in cache.topofiles(topofiles, topo_missing,
+                                    'f' if args.float32 else 'd'):
+        print('%s %s' % (topofile[0], topofile[-1]))
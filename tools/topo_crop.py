@@ -0,0 +1,437 @@
+"""
+Crop the topofiles of a case to the extent the run actually uses, and
+split very large ones into tiles.
+
+GeoClaw keeps every topo array in memory for the whole run, but a DEM is
+only useful where the grids get fine enough to resolve it.  For each
+topofile of type 2, 3 or 4 the needed extent is found from the setrun of
+the case:
+
+  - the largest level allowed at each point of the domain, from the
+    regions and flagregions whose time window overlaps [t0, tfinal]
+    (amr_levels_max where no region applies),
+  - the part of the domain where that level has cells at most --coarsen
+    times (default 4) the spacing of the topofile, in x or in y,
+  - extended by regrid_buffer_width + num_ghost cells of the next coarser
+    level, or by --margin degrees, and limited to the file.
+
+The coarsest file(s) are always kept over the whole domain, so that every
+point has topography.  Files not needed anywhere are dropped, the others
+are cropped (ASCII files by copying the text of the rows and columns
+kept, so the values are unchanged; NetCDF files as NetCDF) and, if more
+than --max-points points remain, split into tiles that share their edge
+rows and columns.  Before the manifest is written, the new files are
+checked to cover every level 1 cell center that the sources covered.  The
+new files and topo_manifest.json, which records for each of them the
+source file and its sha1, the extent, the indices kept and the settings,
+are written to --outdir:
+
+    python ../../tools/topo_crop.py . --outdir _topo_crop
+
+With SPHERE_TESTS_CROPPED_TOPO=1 the tohoku and aasz_butler setruns
+replace their topofiles by those of the manifest in _topo_crop (use_crop),
+after checking that the sources, domain and regions have not changed.
+
+"""
+
+import os
+import json
+import time
+import hashlib
+import numpy as np
+from scipy.io import netcdf_file
+
+import run_cache
+import topo_cache
+
+MANIFEST = 'topo_manifest.json'
+ENABLE = 'SPHERE_TESTS_CROPPED_TOPO'
+
+
+def level_deltas(rundata):
+    """Cell sizes (dx, dy) of the levels 1 to amr_levels_max."""
+    clawdata, amrdata = rundata.clawdata, rundata.amrdata
+    dx = (clawdata.upper[0] - clawdata.lower[0]) / clawdata.num_cells[0]
+    dy = (clawdata.upper[1] - clawdata.lower[1]) / clawdata.num_cells[1]
+    deltas = [(dx, dy)]
+    for k in range(amrdata.amr_levels_max - 1):
+        dx /= amrdata.refinement_ratios_x[k]
+        dy /= amrdata.refinement_ratios_y[k]
+        deltas.append((dx, dy))
+    return deltas
+
+
+def time_span(clawdata):
+    """t0 and the final time of the run (inf if not known)."""
+    if clawdata.output_style == 1:
+        return clawdata.t0, clawdata.tfinal
+    if clawdata.output_style == 2:
+        return clawdata.t0, max(clawdata.output_times)
+    return clawdata.t0, np.inf
+
+
+def active_regions(rundata):
+    """
+    [maxlevel, x1, x2, y1, y2] of the regions and flagregions whose time
+    window overlaps the run (bounding box for ruled rectangles).
+    """
+    t0, tfinal = time_span(rundata.clawdata)
+    regions = [list(region[1:2]) + list(region[4:8])
+               for region in rundata.regiondata.regions
+               if region[2] <= tfinal and region[3] >= t0]
+    flagregions = getattr(rundata, 'flagregiondata', None)
+    for flagregion in getattr(flagregions, 'flagregions', []):
+        if flagregion.t1 > tfinal or flagregion.t2 < t0:
+            continue
+        if flagregion.spatial_region_type == 1:
+            extent = list(flagregion.spatial_region)
+        else:
+            from clawpack.amrclaw import region_tools
+            rr = region_tools.RuledRectangle(flagregion.spatial_region_file)
+            extent = list(rr.bounding_box())
+        regions.append([flagregion.maxlevel] + extent)
+    return regions
+
+
+def max_levels(rundata):
+    """
+    Largest level allowed in the rectangles of a grid of all region edges.
+    Returns the edges xe, ye and levels[j, i] for [xe[i], xe[i+1]] x
+    [ye[j], ye[j+1]].
+    """
+    clawdata = rundata.clawdata
+    levels_max = rundata.amrdata.amr_levels_max
+    regions = active_regions(rundata)
+    xe = np.unique(np.clip([clawdata.lower[0], clawdata.upper[0]]
+                           + [r[k] for r in regions for k in (1, 2)],
+                           clawdata.lower[0], clawdata.upper[0]))
+    ye = np.unique(np.clip([clawdata.lower[1], clawdata.upper[1]]
+                           + [r[k] for r in regions for k in (3, 4)],
+                           clawdata.lower[1], clawdata.upper[1]))
+    xc, yc = np.meshgrid(0.5 * (xe[1:] + xe[:-1]), 0.5 * (ye[1:] + ye[:-1]))
+    levels = np.zeros(xc.shape, dtype=int)
+    covered = np.zeros(xc.shape, dtype=bool)
+    for maxlevel, x1, x2, y1, y2 in regions:
+        inside = (xc >= x1) & (xc <= x2) & (yc >= y1) & (yc <= y2)
+        levels[inside] = np.maximum(levels[inside], maxlevel)
+        covered |= inside
+    levels[~covered] = levels_max
+    return xe, ye, np.minimum(levels, levels_max)
+
+
+def needed_extent(rundata, delta, coarsen=4., margin=None):
+    """
+    [x1, x2, y1, y2] of the part of the domain where the grids resolve
+    topography of spacing delta = (dx, dy) to within a factor coarsen,
+    plus a margin, or None if there is no such part.
+    """
+    deltas = level_deltas(rundata)
+    xe, ye, levels = max_levels(rundata)
+    resolved = np.array([min(ldx / delta[0], ldy / delta[1]) <= coarsen
+                         for ldx, ldy in deltas])
+    needed = resolved[levels - 1]
+    if not needed.any():
+        return None
+    jj, ii = np.nonzero(needed)
+    if margin is None:
+        cells = rundata.amrdata.regrid_buffer_width \
+                + rundata.clawdata.num_ghost
+        coarser = deltas[max(levels[needed].max() - 2, 0)]
+        margin_x, margin_y = cells * coarser[0], cells * coarser[1]
+    else:
+        margin_x = margin_y = margin
+    return [xe[ii.min()] - margin_x, xe[ii.max() + 1] + margin_x,
+            ye[jj.min()] - margin_y, ye[jj.max() + 1] + margin_y]
+
+
+def read_grid(fname, topo_type):
+    """
+    x, y (ascending), the cell size(s) as written and nodata of a type 2,
+    3 or 4 file.
+    """
+    if abs(topo_type) in (2, 3):
+        with open(fname) as f:
+            mx, my, x, y, nodata = topo_cache.read_header(f)
+            f.seek(0)
+            delta_line = [f.readline() for k in range(5)][-1]
+        delta_text = ' '.join(token for token in delta_line.split()
+                              if _is_number(token))
+        return x, y, delta_text, nodata
+    if topo_type == 4:
+        with netcdf_file(fname, 'r', mmap=True) as f:
+            names = dict((name.lower(), name) for name in f.dimensions)
+            x = [f.variables[names[name]][:].copy() for name
+                 in ('lon', 'longitude', 'x') if name in names][0]
+            y = [f.variables[names[name]][:].copy() for name
+                 in ('lat', 'latitude', 'y') if name in names][0]
+        return x, y, None, None
+    raise ValueError('Cannot crop topo_type %s' % topo_type)
+
+
+def _is_number(token):
+    try:
+        float(token)
+    except ValueError:
+        return False
+    return True
+
+
+def crop_indices(x, extent_lower, extent_upper):
+    """First and last (inclusive) index of x covering the interval."""
+    i0 = max(np.searchsorted(x, extent_lower, 'right') - 1, 0)
+    i1 = min(np.searchsorted(x, extent_upper, 'left'), len(x) - 1)
+    return int(i0), int(i1)
+
+
+def tile_edges(i0, i1, j0, j1, max_points):
+    """
+    Index ranges (i0, i1, j0, j1), inclusive and sharing their edges, of
+    tiles of about max_points points at most.
+    """
+    ni, nj = i1 - i0 + 1, j1 - j0 + 1
+    ntiles = int(np.ceil(ni * nj / float(max_points)))
+    ntx = int(np.clip(np.ceil(np.sqrt(ntiles * ni / float(nj))), 1, ni - 1))
+    nty = int(np.clip(np.ceil(ntiles / float(ntx)), 1, nj - 1))
+    ie = np.round(np.linspace(i0, i1, ntx + 1)).astype(int)
+    je = np.round(np.linspace(j0, j1, nty + 1)).astype(int)
+    return [(int(ie[a]), int(ie[a + 1]), int(je[b]), int(je[b + 1]))
+            for b in range(nty) for a in range(ntx)]
+
+
+def _rows(f, mx):
+    """Rows of mx value strings of an ASCII file, north to south."""
+    tokens = []
+    for line in f:
+        tokens.extend(line.split())
+        while len(tokens) >= mx:
+            yield tokens[:mx]
+            tokens = tokens[mx:]
+
+
+def crop_ascii(fname, x, y, delta_text, nodata, tiles, fnames):
+    """
+    Write the tiles (i0, i1, j0, j1) of a type 2 or 3 file to fnames as
+    topo_type 3, copying the text of the values.
+    """
+    my = len(y)
+    files = [open(tile_fname, 'w') for tile_fname in fnames]
+    try:
+        for (i0, i1, j0, j1), f in zip(tiles, files):
+            f.write('%i ncols\n%i nrows\n%s xllcenter\n%s yllcenter\n'
+                    % (i1 - i0 + 1, j1 - j0 + 1, float(x[i0]), float(y[j0])))
+            f.write('%s cellsize\n%s nodata_value\n'
+                    % (delta_text, nodata))
+        j_north = max(j1 for i0, i1, j0, j1 in tiles)
+        j_south = min(j0 for i0, i1, j0, j1 in tiles)
+        with open(fname) as src:
+            for k in range(6):
+                src.readline()
+            for r, row in enumerate(_rows(src, len(x))):
+                j = my - 1 - r
+                if j > j_north:
+                    continue
+                if j < j_south:
+                    break
+                for (i0, i1, j0, j1), f in zip(tiles, files):
+                    if j0 <= j <= j1:
+                        f.write(' '.join(row[i0:i1 + 1]) + '\n')
+    finally:
+        for f in files:
+            f.close()
+
+
+def crop_netcdf(fname, x, y, tiles, fnames):
+    """Write the tiles (i0, i1, j0, j1) of a NetCDF file to fnames."""
+    topo = topo_cache.load(fname)
+    for (i0, i1, j0, j1), tile_fname in zip(tiles, fnames):
+        topo_cache.write_netcdf(tile_fname, x[i0:i1 + 1], y[j0:j1 + 1],
+                                topo.Z[j0:j1 + 1, i0:i1 + 1],
+                                topo.Z.dtype.char, source=fname)
+
+
+def covered(extents, x, y):
+    """Points of the grid x (nx,) by y (ny,) in at least one extent."""
+    inside = np.zeros((len(y), len(x)), dtype=bool)
+    for x1, x2, y1, y2 in extents:
+        inside |= ((y >= y1) & (y <= y2))[:, None] \
+                  & ((x >= x1) & (x <= x2))[None, :]
+    return inside
+
+
+def check_coverage(rundata, entries):
+    """
+    Raise ValueError if some cell center of level 1 covered by a source
+    file is not covered by the cropped files.
+    """
+    clawdata = rundata.clawdata
+    dx, dy = level_deltas(rundata)[0]
+    x = clawdata.lower[0] + dx * (np.arange(clawdata.num_cells[0]) + 0.5)
+    y = clawdata.lower[1] + dy * (np.arange(clawdata.num_cells[1]) + 0.5)
+    sources = [entry['source_extent'] for entry in entries
+               if 'source_extent' in entry]
+    files = [tile['extent'] for entry in entries for tile in entry['files']]
+    lost = covered(sources, x, y) & ~covered(files, x, y)
+    if lost.any():
+        jj, ii = np.nonzero(lost)
+        raise ValueError('The cropped topofiles do not cover [%g, %g] x '
+                         '[%g, %g], covered by the sources'
+                         % (x[ii.min()], x[ii.max()], y[jj.min()],
+                            y[jj.max()]))
+
+
+def settings_hash(rundata, coarsen, margin, max_points):
+    """Hash of everything besides the sources that the crop depends on."""
+    clawdata, amrdata = rundata.clawdata, rundata.amrdata
+    settings = [list(clawdata.lower), list(clawdata.upper),
+                list(clawdata.num_cells), time_span(clawdata),
+                amrdata.amr_levels_max,
+                list(amrdata.refinement_ratios_x),
+                list(amrdata.refinement_ratios_y),
+                amrdata.regrid_buffer_width, clawdata.num_ghost,
+                active_regions(rundata), coarsen, margin, max_points]
+    return hashlib.sha1(json.dumps(settings, default=float).encode()) \
+                  .hexdigest()
+
+
+def crop_topofiles(rundata, outdir, coarsen=4., margin=None,
+                   max_points=2e8, cachedir=None):
+    """
+    Crop and tile the topofiles of rundata into outdir and write the
+    manifest.  Returns the manifest.
+    """
+    os.makedirs(outdir, exist_ok=True)
+    hashes = run_cache.RunCache(cachedir)
+    clawdata = rundata.clawdata
+    domain = [clawdata.lower[0], clawdata.upper[0],
+              clawdata.lower[1], clawdata.upper[1]]
+    grids = dict((os.path.abspath(topofile[-1]),
+                  read_grid(os.path.abspath(topofile[-1]), topofile[0]))
+                 for topofile in rundata.topo_data.topofiles
+                 if abs(topofile[0]) in (2, 3, 4))
+    # cell area of the coarsest file(s), kept over the whole domain:
+    areas = dict((fname, (x[1] - x[0]) * (y[1] - y[0]))
+                 for fname, (x, y, delta_text, nodata) in grids.items())
+    coarsest = max(areas.values()) if areas else None
+    entries = []
+    topofiles = []
+    for topofile in rundata.topo_data.topofiles:
+        topo_type, fname = topofile[0], os.path.abspath(topofile[-1])
+        entry = {'source': fname, 'topo_type': topo_type,
+                 'sha1': hashes.content_hash(fname), 'files': []}
+        entries.append(entry)
+        if abs(topo_type) not in (2, 3, 4):
+            entry['action'] = 'kept (topo_type %s is not cropped)' % topo_type
+            topofiles.append(list(topofile[:-1]) + [fname])
+            continue
+        x, y, delta_text, nodata = grids[fname]
+        delta = (x[1] - x[0], y[1] - y[0])
+        if np.isclose(areas[fname], coarsest):
+            extent = domain
+        else:
+            extent = needed_extent(rundata, delta, coarsen, margin)
+        entry['source_extent'] = [x[0], x[-1], y[0], y[-1]]
+        entry['needed_extent'] = extent
+        if extent is None or extent[0] > x[-1] or extent[1] < x[0] \
+                or extent[2] > y[-1] or extent[3] < y[0]:
+            entry['action'] = 'dropped (not resolved by the grids)'
+            continue
+        i0, i1 = crop_indices(x, extent[0], extent[1])
+        j0, j1 = crop_indices(y, extent[2], extent[3])
+        tiles = [(i0, i1, j0, j1)]
+        if (i1 - i0 + 1) * (j1 - j0 + 1) > max_points:
+            tiles = tile_edges(i0, i1, j0, j1, max_points)
+        name, ext = os.path.splitext(os.path.basename(fname))
+        ext = '.nc' if topo_type == 4 else '.asc'
+        fnames = [os.path.join(os.path.abspath(outdir),
+                               '%s%s%s' % (name, '_tile%i' % k
+                                           if len(tiles) > 1 else '', ext))
+                  for k in range(len(tiles))]
+        print('Cropping %s to %i file(s)' % (fname, len(fnames)))
+        if topo_type == 4:
+            crop_netcdf(fname, x, y, tiles, fnames)
+        else:
+            crop_ascii(fname, x, y, delta_text, nodata, tiles, fnames)
+        new_type = 4 if topo_type == 4 else (-3 if topo_type < 0 else 3)
+        entry['action'] = 'cropped' if len(tiles) == 1 else 'tiled'
+        for (ti0, ti1, tj0, tj1), tile_fname in zip(tiles, fnames):
+            entry['files'].append({'fname': tile_fname,
+                                   'topo_type': new_type,
+                                   'i': [ti0, ti1], 'j': [tj0, tj1],
+                                   'extent': [x[ti0], x[ti1],
+                                              y[tj0], y[tj1]]})
+            topofiles.append([new_type] + list(topofile[1:-1]) + [tile_fname])
+    check_coverage(rundata, entries)
+    manifest = {'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'settings': settings_hash(rundata, coarsen, margin,
+                                          max_points),
+                'coarsen': coarsen, 'margin': margin,
+                'max_points': max_points, 'sources': entries,
+                'topofiles': topofiles}
+    with open(os.path.join(outdir, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=1, default=float)
+    return manifest
+
+
+def use_crop(rundata, casedir, outdir='_topo_crop', cachedir=None):
+    """
+    If $SPHERE_TESTS_CROPPED_TOPO is set, replace the topofiles of rundata
+    by those of the manifest in casedir/outdir.  Raises ValueError if the
+    manifest is out of date.  Called at the end of setrun.
+    """
+    if os.environ.get(ENABLE, '0') in ('', '0'):
+        return rundata
+    fname = os.path.join(casedir, outdir, MANIFEST)
+    if not os.path.isfile(fname):
+        raise ValueError('No %s, run tools/topo_crop.py first' % fname)
+    with open(fname) as f:
+        manifest = json.load(f)
+    hashes = run_cache.RunCache(cachedir)
+    sources = [(topofile[0], os.path.abspath(topofile[-1]))
+               for topofile in rundata.topo_data.topofiles]
+    if sources != [(entry['topo_type'], entry['source'])
+                   for entry in manifest['sources']] \
+            or any(hashes.content_hash(entry['source']) != entry['sha1']
+                   for entry in manifest['sources']) \
+            or settings_hash(rundata, manifest['coarsen'], manifest['margin'],
+                             manifest['max_points']) != manifest['settings']:
+        raise ValueError('%s is out of date, run tools/topo_crop.py again'
+                         % fname)
+    rundata.topo_data.topofiles = manifest['topofiles']
+    return rundata
+
+
+def format_manifest(manifest):
+    lines = []
+    for entry in manifest['sources']:
+        lines.append('%s: %s' % (entry['source'], entry['action']))
+        for tile in entry['files']:
+            lines.append('    %s  [%.4f, %.4f] x [%.4f, %.4f]'
+                         % ((tile['fname'],) + tuple(tile['extent'])))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    import argparse
+    import runtools
+    parser = argparse.ArgumentParser(
+        description='Crop and tile the topofiles of a case to the extent used')
+    parser.add_argument('casedir', nargs='?', default='.')
+    parser.add_argument('--outdir', default='_topo_crop',
+                        help='relative to casedir (default _topo_crop)')
+    parser.add_argument('--coarsen', type=float, default=4.,
+                        help='keep a file where cells are at most this '
+                             'many times its spacing (default 4)')
+    parser.add_argument('--margin', type=float, default=None,
+                        help='margin in degrees (default: buffer and '
+                             'ghost cells of the next coarser level)')
+    parser.add_argument('--max-points', type=float, default=2e8,
+                        help='split files with more points into tiles')
+    args = parser.parse_args()
+
+    os.environ[ENABLE] = '0'
+    os.environ[topo_cache.ENABLE] = '0'
+    rundata = runtools.make_rundata(args.casedir)
+    manifest = crop_topofiles(rundata, os.path.join(args.casedir,
+                                                    args.outdir),
+                              args.coarsen, args.margin, args.max_points)
+    print(format_manifest(manifest))
@@ -0,0 +1,98 @@
+"""
+Choose amrdata.max1d, the largest patch dimension, for a case on this
+machine.
+
+Small patches balance the load between threads better and fit in cache,
+large ones have less ghost-cell and per-patch overhead.  The case is built
+with OpenMP (as in scaling.py, unless --exe is given) and run for a short
+time span (the first --fraction of tfinal) with each candidate value, at
+the thread count of production runs, and the value with the shortest
+integration time (see scaling.timed_run) is written to the tuning file of
+this machine (tuning.py), from which setrun takes it:
+
+    python ../../tools/tune_max1d.py . --nthreads 16
+    python tools/tune_max1d.py 2d/tohoku --values 30 40 60 80 120 --exe ...
+
+Each candidate is run --repeat times and the shortest time is used.  With
+--dry-run the results are only printed.
+
+"""
+
+import os
+import numpy as np
+
+import runtools
+import scaling
+import tuning
+
+VALUES = [20, 30, 40, 60, 80, 120, 200]
+
+
+def tune_max1d(casedir, values=VALUES, nthreads=None, fraction=0.1,
+               workdir='_tune_max1d', exe=None, repeat=1):
+    """
+    Time the shortened case with each max1d in values.  Returns a list of
+    records (see scaling.timed_run) with max1d added, in the order of
+    values.
+    """
+    casedir = os.path.abspath(casedir)
+    nthreads = nthreads or os.cpu_count()
+    if exe is None:
+        exe = runtools.build(casedir, scaling.openmp_fflags())
+    records = []
+    for max1d in values:
+        rundata = runtools.shorten(runtools.make_rundata(casedir), fraction)
+        rundata.amrdata.max1d = max1d
+        rundir = os.path.join(os.path.abspath(workdir), 'max1d_%i' % max1d)
+        runtools.write_data(rundata, rundir, casedir)
+        trials = [scaling.timed_run(exe, rundir,
+                                    os.path.join(rundir, '_output'),
+                                    nthreads, 'max1d = %i' % max1d)
+                  for k in range(repeat)]
+        record = min(trials, key=lambda record: record['time'])
+        scaling.check_threads(record['solver_threads'], nthreads)
+        record['max1d'] = max1d
+        records.append(record)
+    return records
+
+
+def format_table(records, best):
+    lines = ['max1d   time (s)  cell updates/s']
+    for record in records:
+        rate = record['cell_updates_per_second']
+        lines.append('%5i %10.2f %15s%s'
+                     % (record['max1d'], record['time'],
+                        '%.3e' % rate if rate else '-',
+                        '  <- best' if record is best else ''))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Choose amrdata.max1d for a case on this machine')
+    parser.add_argument('casedir', nargs='?', default='.')
+    parser.add_argument('--values', type=int, nargs='+', default=VALUES)
+    parser.add_argument('--nthreads', type=int, default=None,
+                        help='threads per run (default: all cores)')
+    parser.add_argument('--fraction', type=float, default=0.1,
+                        help='fraction of tfinal to run (default 0.1)')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--workdir', default='_tune_max1d')
+    parser.add_argument('--exe', default=None)
+    parser.add_argument('--dry-run', action='store_true',
+                        help='do not write the tuning file')
+    args = parser.parse_args()
+
+    records = tune_max1d(args.casedir, args.values, args.nthreads,
+                         args.fraction, args.workdir, args.exe, args.repeat)
+    best = records[int(np.argmin([record['time'] for record in records]))]
+    print(format_table(records, best))
+    if not args.dry_run:
+        fname = tuning.store(args.casedir, 'amrdata.max1d', best['max1d'],
+                             nthreads=best['nthreads'],
+                             fraction=args.fraction,
+                             times=dict((record['max1d'], record['time'])
+                                        for record in records))
+        print('max1d = %i for %s written to %s'
+              % (best['max1d'], tuning.case_key(args.casedir), fname))
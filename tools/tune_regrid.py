@@ -0,0 +1,199 @@
+"""
+Search for the regridding parameters of a case that give the best trade
+off between run time and accuracy.
+
+regrid_interval, regrid_buffer_width and clustering_cutoff determine how
+often regridding runs and how many cells beyond the flagged ones are
+refined.  The case is run for a short time span (the first --fraction of
+tfinal) for each combination on a small grid (by default regrid_interval
+2, 3, 4, 6, buffer width 1, 2, 3 and cutoff 0.6, 0.7, 0.8), one run at a
+time with --nthreads threads, as a sweep.Sweep in --sweepdir.  It is
+built with OpenMP (as in scaling.py) unless --exe is given.  The accuracy
+proxy is the RMS difference of eta at the gauges from a reference run
+with the most refinement (smallest interval, widest buffer, lowest
+cutoff), relative to the standard deviation of eta in the reference run
+and averaged over the gauges.  If the reference is one of the
+combinations searched, that run is used and not repeated:
+
+    python ../../tools/tune_regrid.py . --nthreads 16 --fraction 0.2
+    python ../../tools/tune_regrid.py . --gauge 0 30 --gauge 0 45 \\
+        --param amrdata.regrid_interval '[3,4]'
+
+Cases without gauges (the axisymmetric tests) need --gauge X Y.  The
+table of all combinations is printed with the Pareto-optimal ones marked,
+and the recommended setting is the fastest one with a relative error
+below --tolerance (default 0.05), or the most accurate one; with --store
+it is written to the tuning file of this machine (tuning.py).
+
+"""
+
+import os
+import json
+import numpy as np
+
+import sweep
+import tuning
+import scaling
+import runtools
+import gauge_store
+import amr_telemetry
+
+GRID = {'amrdata.regrid_interval': [2, 3, 4, 6],
+        'amrdata.regrid_buffer_width': [1, 2, 3],
+        'amrdata.clustering_cutoff': [0.6, 0.7, 0.8]}
+
+# direction of more refinement for each parameter, for the reference run:
+MOST_REFINED = {'amrdata.regrid_interval': min,
+                'amrdata.regrid_buffer_width': max,
+                'amrdata.clustering_cutoff': min}
+
+
+def run_time(entry):
+    """Integration time of a sweep run (timing.txt), or its wall time."""
+    time = amr_telemetry.AMRTelemetry(entry['outdir']).wall_time()
+    if time is None or not np.isfinite(time):
+        time = entry['elapsed']
+    return time
+
+
+def mean_error(outdir, ref_outdir):
+    """
+    Mean over the gauges of the RMS difference of eta from the reference
+    run, relative to the standard deviation of eta in the reference run.
+    """
+    ref = gauge_store.open_store(ref_outdir)
+    errors = []
+    for gaugeno, rms in gauge_store.rms_difference(outdir,
+                                                   ref_outdir).items():
+        scale = np.std(ref.gauge(gaugeno).q[-1])
+        if np.isfinite(rms):
+            errors.append(rms / scale if scale > 0 else rms)
+    return float(np.mean(errors)) if errors else np.nan
+
+
+def evaluate(results, ref_outdir):
+    """Add time and error to the results (sweep index entries)."""
+    for entry in results:
+        entry['time'] = run_time(entry)
+        entry['error'] = mean_error(entry['outdir'], ref_outdir)
+    return results
+
+
+def recommend(results, tolerance=0.05):
+    """
+    Pareto-optimal results (time vs error, NaN errors excluded) and the
+    recommended one: the fastest with error below tolerance, or the most
+    accurate one.
+    """
+    valid = [entry for entry in results if np.isfinite(entry['error'])]
+    if not valid:
+        raise ValueError('No gauge data to compare, use --gauge or a '
+                         'larger --fraction')
+    front = [valid[i] for i in sweep.pareto_front(
+                 [entry['time'] for entry in valid],
+                 [entry['error'] for entry in valid])]
+    good = [entry for entry in front if entry['error'] <= tolerance]
+    if not good:
+        return front, front[-1]
+    return front, good[0]
+
+
+def format_table(results, front, best, names):
+    short = [name.split('.')[-1] for name in names]
+    lines = ['  '.join('%19s' % name for name in short)
+             + '   time (s)   relative error']
+    for entry in sorted(results, key=lambda entry: entry['time']):
+        mark = '  <- recommended' if entry is best else \
+               '  (Pareto)' if entry in front else ''
+        lines.append('  '.join('%19s' % entry['params'][name]
+                               for name in names)
+                     + ' %10.2f %16.4e%s' % (entry['time'], entry['error'],
+                                              mark))
+    return '\n'.join(lines)
+
+
+def tune_regrid(casedir, grid=GRID, nthreads=None, fraction=0.1,
+                sweepdir='_tune_regrid', exe=None, gauges=None,
+                reference=None):
+    """
+    Run the grid of regridding parameters and the reference run.  Returns
+    the evaluated sweep entries (with time and error) and the reference
+    entry.  gauges, if given, replace those of the case, as lists
+    [gaugeno, x, y, t1, t2].
+    """
+    casedir = os.path.abspath(casedir)
+    nthreads = nthreads or os.cpu_count()
+    if exe is None:
+        exe = runtools.build(casedir, scaling.openmp_fflags())
+    if reference is None:
+        reference = dict((name, MOST_REFINED.get(name, min)(values))
+                         for name, values in grid.items())
+    extra = {'gaugedata.gauges': [gauges]} if gauges else {}
+
+    searched = sweep.Sweep(casedir, sweepdir, dict(extra, **grid),
+                           fraction=fraction)
+    ref_grid = dict(extra, **dict((name, [value])
+                                  for name, value in reference.items()))
+    ref_params = sweep.combinations(ref_grid)[0]
+    searched_params = sweep.combinations(searched.grid)
+    sweeps = [searched]
+    if ref_params in searched_params:
+        ref_sweep = searched
+    else:
+        ref_sweep = sweep.Sweep(casedir, os.path.join(sweepdir, 'reference'),
+                                ref_grid, fraction=fraction)
+        sweeps.insert(0, ref_sweep)
+    for s in sweeps:
+        failed = s.run(exe, nthreads, nthreads)
+        if failed:
+            raise RuntimeError('Runs failed: %s' % [run.outdir
+                                                    for run in failed])
+    ref_entry = ref_sweep.entry(ref_params)
+    entries = [searched.entry(params) for params in searched_params]
+    runs = entries if ref_sweep is searched else entries + [ref_entry]
+    for entry in runs:
+        tel = amr_telemetry.AMRTelemetry(entry['outdir'])
+        scaling.check_threads(tel.nthreads, nthreads)
+    results = evaluate(entries, ref_entry['outdir'])
+    return results, ref_entry
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Pareto search of the regridding parameters of a case')
+    parser.add_argument('casedir', nargs='?', default='.')
+    parser.add_argument('--param', nargs=2, action='append', default=[],
+                        metavar=('PATH', 'VALUES'),
+                        help='replace the values searched for a parameter')
+    parser.add_argument('--gauge', nargs=2, type=float, action='append',
+                        default=[], metavar=('X', 'Y'),
+                        help='gauge to compare at (replaces the gauges)')
+    parser.add_argument('--nthreads', type=int, default=None)
+    parser.add_argument('--fraction', type=float, default=0.1,
+                        help='fraction of tfinal to run (default 0.1)')
+    parser.add_argument('--sweepdir', default='_tune_regrid')
+    parser.add_argument('--exe', default=None)
+    parser.add_argument('--tolerance', type=float, default=0.05,
+                        help='largest relative error accepted')
+    parser.add_argument('--store', action='store_true',
+                        help='write the recommendation to the tuning file')
+    args = parser.parse_args()
+
+    grid = dict(GRID)
+    for path, values in args.param:
+        grid[path] = json.loads(values)
+    gauges = [[k + 1, x, y, 0., 1.e10] for k, (x, y) in enumerate(args.gauge)]
+    results, ref_entry = tune_regrid(args.casedir, grid, args.nthreads,
+                                     args.fraction, args.sweepdir, args.exe,
+                                     gauges)
+    front, best = recommend(results, args.tolerance)
+    names = sorted(grid)
+    print('Reference: %s' % ref_entry['params'])
+    print(format_table(results, front, best, names))
+    if args.store:
+        for name in names:
+            fname = tuning.store(args.casedir, name, best['params'][name],
+                                 time=best['time'], error=best['error'],
+                                 fraction=args.fraction)
+        print('Recommended setting written to %s' % fname)
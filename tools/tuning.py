@@ -0,0 +1,76 @@
+"""
+Per-machine tuning file: values of rundata parameters chosen for this
+machine by the autotuners (e.g. tune_max1d.py), applied by setrun.
+
+The file is $SPHERE_TESTS_TUNING, or ~/.config/sphere_tests/tuning_<host>.json,
+with one entry per case (path relative to the repository):
+
+    {"2d/nonpolar_axisymmetric": {"amrdata.max1d": {"value": 40, ...}}}
+
+Besides the value, an entry records when and how it was measured.  The
+setrun of a case calls
+
+    tuning.apply(rundata, casedir)
+
+as its last step, which sets each tuned parameter of the case (paths as
+in sweep.py); without a tuning file the values of setrun are used.
+
+"""
+
+import os
+import json
+import time
+import socket
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def tuning_fname():
+    return os.environ.get('SPHERE_TESTS_TUNING',
+                          os.path.join(os.path.expanduser('~'), '.config',
+                                       'sphere_tests', 'tuning_%s.json'
+                                       % socket.gethostname()))
+
+
+def case_key(casedir):
+    """Key of a case in the tuning file, e.g. '2d/nonpolar_axisymmetric'."""
+    path = os.path.relpath(os.path.abspath(casedir), REPO)
+    return path.replace(os.sep, '/')
+
+
+def load(fname=None):
+    fname = fname or tuning_fname()
+    if not os.path.isfile(fname):
+        return {}
+    with open(fname) as f:
+        return json.load(f)
+
+
+def tuned_values(casedir, fname=None):
+    """Dictionary of parameter path -> tuned value for a case."""
+    entries = load(fname).get(case_key(casedir), {})
+    return dict((path, entry['value']) for path, entry in entries.items())
+
+
+def apply(rundata, casedir, fname=None):
+    """Set the tuned parameters of casedir in rundata; returns them."""
+    import sweep
+    values = tuned_values(casedir, fname)
+    for path, value in values.items():
+        sweep.set_param(rundata, path, value)
+    return values
+
+
+def store(casedir, path, value, fname=None, **info):
+    """Record the tuned value of rundata.<path> for a case, with info such
+    as the measurements it is based on."""
+    fname = fname or tuning_fname()
+    tuning = load(fname)
+    entry = dict(info, value=value, date=time.strftime('%Y-%m-%d %H:%M:%S'))
+    tuning.setdefault(case_key(casedir), {})[path] = entry
+    os.makedirs(os.path.dirname(os.path.abspath(fname)), exist_ok=True)
+    tmp = fname + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(tuning, f, indent=1, sort_keys=True)
+    os.replace(tmp, fname)
+    return fname
@@ -0,0 +1,191 @@
+"""
+Cost and accuracy of refinement_data.wave_tolerance for a case.
+
+wave_tolerance decides which cells are flagged for refinement and so
+how many fine cells exist.  The case is run with each value (by default
+0.2, 0.1, 0.05, 0.02, 0.01 and 0.005) as a sweep.Sweep in --sweepdir, the
+variants concurrently with the cores split between them, optionally for
+only the first --fraction of tfinal.  It is built with OpenMP (as in
+scaling.py) unless --exe is given.  For each variant the total cell
+updates and integration time (see amr_telemetry.py) are compared with the
+error against the run with the smallest tolerance:
+
+  - gauges: RMS difference of eta relative to the standard deviation of
+    eta in the reference run, averaged over the gauges (tune_regrid.py),
+  - fgmax: RMS difference of the maximum depth (m) over the fgmax points
+    wet in both runs.
+
+    python ../../tools/wave_tolerance.py . --values 0.1 0.05 0.02 0.01 \\
+        --target 0.02
+
+prints a table, marks the Pareto-optimal values (cell updates vs error of
+--metric) and the cheapest one with error below --target, and plots error
+against cell updates in sweepdir/wave_tolerance.png.
+
+"""
+
+import os
+import glob
+import numpy as np
+
+import sweep
+import scaling
+import runtools
+import tune_regrid
+import amr_telemetry
+
+PATH = 'refinement_data.wave_tolerance'
+VALUES = [0.2, 0.1, 0.05, 0.02, 0.01, 0.005]
+
+
+def read_fgmax(fname):
+    """x, y, level and maximum depth h of an fgmaxNNNN.txt file."""
+    data = np.loadtxt(fname, ndmin=2)
+    return data[:, 0], data[:, 1], data[:, 2], data[:, 4]
+
+
+def fgmax_error(outdir, ref_outdir):
+    """
+    RMS difference of the maximum depth between the fgmax points of outdir
+    and those of ref_outdir that were reached (level > 0) in both runs.
+    """
+    diffs = []
+    for ref_fname in sorted(glob.glob(os.path.join(ref_outdir,
+                                                   'fgmax*.txt'))):
+        fname = os.path.join(outdir, os.path.basename(ref_fname))
+        if not os.path.isfile(fname):
+            continue
+        x, y, level, h = read_fgmax(fname)
+        ref_x, ref_y, ref_level, ref_h = read_fgmax(ref_fname)
+        if len(x) != len(ref_x):
+            continue
+        reached = (level > 0) & (ref_level > 0)
+        diffs.append(h[reached] - ref_h[reached])
+    if not diffs or not sum(len(diff) for diff in diffs):
+        return np.nan
+    diff = np.concatenate(diffs)
+    return float(np.sqrt(np.mean(diff**2)))
+
+
+def evaluate(entries, ref_outdir):
+    """Add value, cell_updates, time and the errors to sweep entries."""
+    for entry in entries:
+        tel = amr_telemetry.AMRTelemetry(entry['outdir'])
+        entry['value'] = entry['params'][PATH]
+        entry['cell_updates'] = float(np.nansum(
+            [tel.cell_updates(level) for level in tel.levels])) or np.nan
+        entry['time'] = tune_regrid.run_time(entry)
+        entry['gauge_error'] = tune_regrid.mean_error(entry['outdir'],
+                                                      ref_outdir)
+        entry['fgmax_error'] = fgmax_error(entry['outdir'], ref_outdir)
+    return entries
+
+
+def explore(casedir, values=VALUES, nthreads=None, threads_per_run=None,
+            fraction=None, sweepdir='_wave_tolerance', exe=None):
+    """
+    Run the variants and evaluate them against the smallest tolerance.
+    Returns the evaluated entries, in the order of values.
+    """
+    casedir = os.path.abspath(casedir)
+    nthreads = nthreads or os.cpu_count()
+    threads_per_run = threads_per_run or max(1, nthreads // len(values))
+    if exe is None:
+        exe = runtools.build(casedir, scaling.openmp_fflags())
+    s = sweep.Sweep(casedir, sweepdir, {PATH: list(values)},
+                    fraction=fraction)
+    failed = s.run(exe, nthreads, threads_per_run)
+    if failed:
+        raise RuntimeError('Runs failed: %s' % [run.outdir for run in failed])
+    entries = [s.entry({PATH: value}) for value in values]
+    for entry in entries:
+        tel = amr_telemetry.AMRTelemetry(entry['outdir'])
+        scaling.check_threads(tel.nthreads, threads_per_run)
+    ref = s.entry({PATH: min(values)})
+    return evaluate(entries, ref['outdir'])
+
+
+def choose(entries, metric='gauge', target=None):
+    """
+    Pareto-optimal entries (cell updates, or time if not known, against
+    the error of metric) and the cheapest one with error below target
+    (None if there is no target or none meets it).
+    """
+    key = '%s_error' % metric
+    valid = [entry for entry in entries if np.isfinite(entry[key])]
+    costs = [entry['cell_updates'] if np.isfinite(entry['cell_updates'])
+             else entry['time'] for entry in valid]
+    front = [valid[i] for i in sweep.pareto_front(costs,
+                                                  [entry[key]
+                                                   for entry in valid])]
+    meeting = [entry for entry in front
+               if target is not None and entry[key] <= target]
+    return front, meeting[0] if meeting else None
+
+
+def format_table(entries, front, best):
+    lines = ['wave_tolerance   cell updates   time (s)   gauge error'
+             '   fgmax error (m)']
+    for entry in entries:
+        mark = '  <- cheapest meeting target' if entry is best else \
+               '  (Pareto)' if entry in front else ''
+        lines.append('%14g %14.4e %10.2f %13.4e %17.4e%s'
+                     % (entry['value'], entry['cell_updates'], entry['time'],
+                        entry['gauge_error'], entry['fgmax_error'], mark))
+    return '\n'.join(lines)
+
+
+def plot_pareto(entries, front, metric, fname, target=None):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    key = '%s_error' % metric
+    use_cells = all(np.isfinite(entry['cell_updates']) for entry in entries)
+    cost = 'cell_updates' if use_cells else 'time'
+    fig, ax = plt.subplots(figsize=(6, 4.5))
+    ax.plot([entry[cost] for entry in entries],
+            [entry[key] for entry in entries], 'o', color='0.6')
+    ax.plot([entry[cost] for entry in front],
+            [entry[key] for entry in front], 'bo-', label='Pareto front')
+    for entry in entries:
+        ax.annotate('%g' % entry['value'], (entry[cost], entry[key]),
+                    textcoords='offset points', xytext=(5, 5))
+    if target is not None:
+        ax.axhline(target, color='r', linestyle=':', label='target')
+    ax.set_xscale('log')
+    ax.set_xlabel('total cell updates' if use_cells else 'time (s)')
+    ax.set_ylabel('%s error' % metric)
+    ax.set_title('wave_tolerance')
+    ax.legend(loc='upper right')
+    ax.grid(True)
+    fig.savefig(fname, bbox_inches='tight')
+    plt.close(fig)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Cost and accuracy of wave_tolerance values for a case')
+    parser.add_argument('casedir', nargs='?', default='.')
+    parser.add_argument('--values', type=float, nargs='+', default=VALUES)
+    parser.add_argument('--nthreads', type=int, default=None,
+                        help='total threads (default: all cores)')
+    parser.add_argument('--threads-per-run', type=int, default=None)
+    parser.add_argument('--fraction', type=float, default=None,
+                        help='run only this fraction of tfinal')
+    parser.add_argument('--sweepdir', default='_wave_tolerance')
+    parser.add_argument('--exe', default=None)
+    parser.add_argument('--metric', choices=['gauge', 'fgmax'],
+                        default='gauge')
+    parser.add_argument('--target', type=float, default=None,
+                        help='largest acceptable error of --metric')
+    args = parser.parse_args()
+
+    entries = explore(args.casedir, args.values, args.nthreads,
+                      args.threads_per_run, args.fraction, args.sweepdir,
+                      args.exe)
+    front, best = choose(entries, args.metric, args.target)
+    print(format_table(entries, front, best))
+    fname = os.path.join(args.sweepdir, 'wave_tolerance.png')
+    plot_pareto(entries, front, args.metric, fname, args.target)
+    print('Created %s' % fname)